@@ -1,6 +1,7 @@
 import numpy
-import random
 import copy as cp
+from .backends import get_backend
+from .random_streams import draw_uniforms
 
 
 class Hamiltonian:
@@ -43,24 +44,23 @@ class Hamiltonian:
         self.mu = mu
         self.doPeriodicBoundaryConditions = periodic_flag
 
-    def compute_energy(self, spins):
+    def compute_bond_sum(self, spins):
         """
-        Computes the energy of the spin configuration in the SpinConfiguration object according to the
-        Ising Hamiltonian.
+        Computes the sum of the products of adjacent spins (each spin counted as -1 or +1) that appears in
+        the coupling term of the Ising Hamiltonian. The boundary term is included if periodic boundary
+        conditions are used.
 
         Parameters
         ----------
         spins : SpinConfiguration
-            The spin configuration for which the energy should be calculated.
+            The spin configuration for which the sum should be calculated.
 
         Returns
         -------
-        energy : float
-            The energy of the configuration.
+        sum_products : int
+            The number of matching adjacent pairs minus the number of mismatched adjacent pairs.
         """
-
         sum_products = 0  # value to be updated in for loop; represents the result of the sum given above
-        sum_magnet = 0
 
         for i in range(
             len(spins.config) - 1
@@ -81,6 +81,27 @@ class Hamiltonian:
             else:
                 sum_products -= 1
 
+        return sum_products
+
+    def compute_energy(self, spins):
+        """
+        Computes the energy of the spin configuration in the SpinConfiguration object according to the
+        Ising Hamiltonian.
+
+        Parameters
+        ----------
+        spins : SpinConfiguration
+            The spin configuration for which the energy should be calculated.
+
+        Returns
+        -------
+        energy : float
+            The energy of the configuration.
+        """
+
+        sum_products = self.compute_bond_sum(spins)
+        sum_magnet = 0
+
         for i in range(len(spins.config)):  # iterates through spin sites
             if spins.config[i] == 0:  # if spin is down
                 sum_magnet += -1  # add -1 to sum_magnet
@@ -343,7 +364,110 @@ class Hamiltonian:
             mag_susceptibility_list,
         )
 
-    def metropolis_sweep(self, spins, temp):
+    def flip_energy_change(self, spins, i):
+        """
+        Calculates the change in energy and magnetization that would result from flipping the spin at
+        site i. The spin configuration itself is not modified.
+
+        Parameters
+        ----------
+        spins : SpinConfiguration
+            The spin configuration containing the site to be flipped.
+        i : int
+            The index of the site to be flipped.
+
+        Returns
+        -------
+        deltaE : float
+            The change in energy caused by the flip.
+        deltaM : int
+            The change in magnetization caused by the flip.
+        """
+        n = spins.n_sites()
+        new_spin = 1 - spins[i]  # value of the spin after the flip
+
+        # value that reflects the change in the J term in the Hamiltonian; each neighbor that
+        # matches the flipped spin contributes +2, each neighbor that does not contributes -2
+        J_term = 0
+        if self.doPeriodicBoundaryConditions or i > 0:
+            J_term += 2 if spins[i - 1] == new_spin else -2
+        if self.doPeriodicBoundaryConditions or i < n - 1:
+            J_term += 2 if spins[(i + 1) % n] == new_spin else -2
+
+        # value that reflects the change in the mu term in the Hamiltonian
+        if new_spin == 0:  # if the spin is flipped from up to down
+            mu_term = -2
+        else:  # if the spin is flipped from down to up
+            mu_term = 2
+
+        deltaE = -J_term * self.J + mu_term * self.mu
+        return deltaE, mu_term
+
+    def flip_acceptance(self, deltaE, temp, rule="metropolis"):
+        """
+        Calculates the probability with which a spin flip that changes the energy by deltaE is made.
+
+        Parameters
+        ----------
+        deltaE : float
+            The change in energy caused by the flip.
+        temp : float
+            The temperature of the system.
+        rule : str, default: "metropolis"
+            The update rule. "metropolis" accepts the flip with probability min(1, exp(-deltaE / temp)).
+            "heat_bath" (Glauber dynamics) sets the spin from its conditional probability given its
+            neighbors and the field, which amounts to flipping it with probability
+            exp(-deltaE / temp) / (1 + exp(-deltaE / temp)).
+
+        Returns
+        -------
+        probability : float
+            The flip probability.
+        """
+        if rule == "metropolis":
+            # capped at 1 before exponentiating, so the exponential never overflows
+            probability = numpy.exp(min(0.0, -deltaE / temp))
+        elif rule == "heat_bath":
+            # written so that the exponential never overflows
+            if deltaE >= 0:
+                weight = numpy.exp(-deltaE / temp)
+                probability = weight / (1 + weight)
+            else:
+                probability = 1 / (1 + numpy.exp(deltaE / temp))
+        else:
+            raise ValueError("Unknown update rule. Choose 'metropolis' or 'heat_bath'.")
+        return probability
+
+    def flip_probability_table(self, temp, rule="metropolis"):
+        """
+        Precomputes the flip probability (see flip_acceptance) for every class of spin flip. A flip is fully
+        described by the current value of the spin and the sum of its neighbors (each counted as -1 or +1),
+        so the probability only has to be evaluated once per temperature instead of once per visited site.
+
+        Parameters
+        ----------
+        temp : float
+            The temperature of the system.
+        rule : str, default: "metropolis"
+            The update rule, "metropolis" or "heat_bath".
+
+        Returns
+        -------
+        table : numpy.ndarray
+            Array of shape (2, 5); entry [s, h + 2] is the flip probability of a spin with current value s
+            (0 or 1) whose neighbors sum to h (from -2 to 2).
+        """
+        table = numpy.zeros((2, 5))
+        for s in range(2):
+            new_spin = 1 - 2 * s  # value of the flipped spin, counted as -1 or +1
+            for h in range(-2, 3):
+                J_term = 2 * new_spin * h
+                mu_term = 2 * new_spin
+                deltaE = -J_term * self.J + mu_term * self.mu
+                table[s, h + 2] = self.flip_acceptance(deltaE, temp, rule)
+        return table
+
+    def metropolis_sweep(self, spins, temp, rule="metropolis", rng=None, first_sweep=0):
         """
         Performs a metropolis sweep starting from the SpinConfiguration object passed in.
 
@@ -353,83 +477,99 @@ class Hamiltonian:
             The spin configuration that serves as the starting point for the metropolis sweep.
         temp : float
             The temperature of the system.
+        rule : str, default: "metropolis"
+            The update rule applied to every site, "metropolis" or "heat_bath" (see flip_acceptance), or
+            "block_gibbs" (see block_gibbs_run).
+        rng : numpy.random.Generator, default: None
+            The random number generator. If None, the random module is used, so random.seed reproduces
+            the sweep.
+        first_sweep : int, default: 0
+            The index of this sweep in the chain, which sets the block boundaries of the "block_gibbs" rule.
 
         Returns
         -------
         new_spins : SpinConfiguration
-            The most probable spin configuration resulting from the metropolis sweep.
+            The spin configuration resulting from the metropolis sweep, one random sample of the update
+            rule.
 
         """
-        for i in range(spins.n_sites()):  # for each site in the lattice
-            conf = cp.deepcopy(spins)  # copies the result of the previous iteration
+        new_spins, energy, magnetization = self.metropolis_sweep_tracked(
+            spins, temp, 0, 0, rule, rng, first_sweep
+        )
+        return new_spins
 
-            # flips spin at site i
-            if spins[i] == 0:
-                conf.set_site(i, 1)
-            else:
-                conf.set_site(i, 0)
+    def heat_bath_sweep(self, spins, temp, rng=None):
+        """
+        Performs a heat-bath (Glauber) sweep starting from the SpinConfiguration object passed in: every
+        site in turn is set from its conditional probability given its neighbors and the field. Uses the
+        same random numbers as metropolis_sweep.
 
-            J_term = (
-                0  # value that reflects the change in the J term in the Hamiltonian
-            )
-            mu_term = (
-                0  # value that reflects the change in the mu term in the Hamiltonian
-            )
+        Parameters
+        ----------
+        spins : SpinConfiguration
+            The spin configuration that serves as the starting point for the sweep.
+        temp : float
+            The temperature of the system.
+        rng : numpy.random.Generator, default: None
+            The random number generator. If None, the random module is used.
 
-            # logic for changing J_term and mu_term
-            if self.doPeriodicBoundaryConditions:
-                if i == 0:  # compares spin at first site to adjacent spins
-                    if conf[len(conf.config) - 1] == conf[i] and conf[i] == conf[1]:
-                        J_term = 4
-                    elif conf[len(conf.config) - 1] == conf[1]:
-                        J_term = -4
-                elif (
-                    i == len(conf.config) - 1
-                ):  # compares spin at last site to adjacent spins
-                    if conf[i - 1] == conf[i] and conf[i] == conf[0]:
-                        J_term = 4
-                    elif conf[i - 1] == conf[0]:
-                        J_term = -4
-                else:  # compares spin at any other site to adjacent spins
-                    if conf[i - 1] == conf[i] and conf[i] == conf[i + 1]:
-                        J_term = 4
-                    elif conf[i - 1] == conf[i + 1]:
-                        J_term = -4
-            else:
-                if i == 0:  # compares spin at first site to spin at second site
-                    if conf[i] == conf[1]:
-                        J_term = 2
-                    else:
-                        J_term = -2
-                elif (
-                    i == len(conf.config) - 1
-                ):  # compares spin at last site to spin before it
-                    if conf[i - 1] == conf[i]:
-                        J_term = 2
-                    else:
-                        J_term = -2
-                else:  # compares spin at any other site to adjacent spins
-                    if conf[i - 1] == conf[i] and conf[i] == conf[i + 1]:
-                        J_term = 4
-                    elif conf[i - 1] == conf[i + 1]:
-                        J_term = -4
-
-            if conf[i] == 0:  # if the spin has been flipped from up to down
-                mu_term = -2
-            else:  # if the spin has been flipped from down to up
-                mu_term = 2
-
-            # calculates change in energy after spin flip
-            deltaE = -J_term * self.J + mu_term * self.mu
-
-            check_num = random.random()
-            probability = numpy.exp(
-                -deltaE / temp
-            )  # ratio of Boltzmann factors of final and initial state
-
-            if probability > check_num:  # if the flip is deemed energetically favorable
-                spins = cp.deepcopy(
-                    conf
-                )  # store the reference to the new SpinConfiguration in the spins variable
-        new_spins = spins
+        Returns
+        -------
+        new_spins : SpinConfiguration
+            The spin configuration resulting from the sweep.
+        """
+        new_spins = self.metropolis_sweep(spins, temp, "heat_bath", rng)
         return new_spins
+
+    def metropolis_sweep_tracked(
+        self, spins, temp, energy, magnetization, rule="metropolis", rng=None, first_sweep=0
+    ):
+        """
+        Performs a metropolis sweep starting from the SpinConfiguration object passed in, while updating
+        the energy and magnetization of the configuration with the change caused by the accepted flips.
+        This avoids recomputing both quantities from scratch after the sweep.
+
+        The uniform random numbers of the sweep are drawn as one block, one per site in the order in which
+        the sites are visited, and compared against the precomputed flip_probability_table instead of
+        evaluating the Boltzmann factor at every site. With rng None the block comes from the random
+        module, so sequences seeded with random.seed are reproduced exactly (compatibility mode).
+
+        Parameters
+        ----------
+        spins : SpinConfiguration
+            The spin configuration that serves as the starting point for the metropolis sweep.
+        temp : float
+            The temperature of the system.
+        energy : float
+            The energy of the starting configuration.
+        magnetization : int
+            The magnetization of the starting configuration.
+        rule : str, default: "metropolis"
+            The update rule applied to every site, "metropolis" or "heat_bath" (see flip_acceptance), or
+            "block_gibbs" (see block_gibbs_run).
+        rng : numpy.random.Generator, default: None
+            The random number generator. If None, the random module is used.
+        first_sweep : int, default: 0
+            The index of this sweep in the chain, which sets the block boundaries of the "block_gibbs" rule.
+
+        Returns
+        -------
+        new_spins : SpinConfiguration
+            The spin configuration resulting from the metropolis sweep.
+        energy : float
+            The energy of the new configuration.
+        magnetization : int
+            The magnetization of the new configuration.
+        """
+        new_spins = cp.deepcopy(spins)  # the configuration passed in is left unchanged
+
+        config = numpy.array(new_spins.get_spins(), dtype=numpy.int8)
+        uniforms = draw_uniforms(rng, 1, len(config))[0]
+        delta_bond, delta_mag = get_backend("numpy").sweep(
+            config, self, temp, uniforms, rule, first_sweep
+        )
+        new_spins.initialize([int(s) for s in config])
+
+        energy += -self.J * delta_bond + self.mu * delta_mag
+        magnetization += delta_mag
+        return new_spins, energy, magnetization
@@ -4,7 +4,27 @@
 from .SpinConfiguration import *
 from .Hamiltonian import *
 from .SpinConfigurationSystem import *
+from .configurations import *
 from .montecarlo_metropolis import *
+from .backends import *
+from .accumulators import *
+from .random_streams import *
+from .parallel_tempering import *
+from .cluster_updates import *
+from .nfold_way import *
+from .checkpoint import *
+from .density_of_states import *
+from .wang_landau import *
+from .reweighting import *
+from .multiple_histogram import *
+from .population_annealing import *
+from .creutz_demon import *
+from .kawasaki import *
+from .block_gibbs import *
+from .umbrella_sampling import *
+from .burn_in_forking import *
+from .simulated_annealing import *
+from .quench_dynamics import *
 
 # Handle versioneer
 from ._version import get_versions
@@ -0,0 +1,730 @@
+"""
+Streaming accumulators that keep constant-memory summaries of the values produced by a Monte Carlo run.
+"""
+import numpy
+
+
+class MomentAccumulator:
+    def __init__(self):
+        """
+        Creates an empty MomentAccumulator. The accumulator keeps the number of values, their mean and the
+        sums of the second, third and fourth powers of the deviations from the mean, updated with Welford's
+        method and its extension to higher moments. Two accumulators can be merged, so values collected by
+        separate chains or worker processes combine into the same summary as a single accumulator.
+        """
+        self.count = 0
+        self.mean_value = 0.0
+        self.m2 = 0.0  # sum of squared deviations from the mean
+        self.m3 = 0.0  # sum of cubed deviations from the mean
+        self.m4 = 0.0  # sum of fourth powers of the deviations from the mean
+
+    def __str__(self):
+        acc_message = (
+            "count = "
+            + str(self.count)
+            + ", mean = "
+            + str(self.mean_value)
+            + ", variance = "
+            + str(self.variance())
+        )
+        return acc_message
+
+    def add(self, value):
+        """
+        Adds a single value to the accumulator.
+
+        Parameters
+        ----------
+        value : float
+            The value to be added.
+        """
+        n1 = self.count
+        self.count += 1
+        n = self.count
+        delta = value - self.mean_value
+        delta_n = delta / n
+        term1 = delta * delta_n * n1
+
+        self.mean_value += delta_n
+        self.m4 += (
+            term1 * delta_n**2 * (n * n - 3 * n + 3)
+            + 6 * delta_n**2 * self.m2
+            - 4 * delta_n * self.m3
+        )
+        self.m3 += term1 * delta_n * (n - 2) - 3 * delta_n * self.m2
+        self.m2 += term1
+
+    def add_array(self, values):
+        """
+        Adds an array of values to the accumulator. The summary of the array is computed with array
+        operations and then merged into the accumulator.
+
+        Parameters
+        ----------
+        values : numpy.ndarray
+            The values to be added.
+        """
+        values = numpy.asarray(values, dtype=numpy.float64)
+        if values.size == 0:
+            return
+        block = MomentAccumulator()
+        block.count = values.size
+        block.mean_value = float(numpy.mean(values))
+        deviations = values - block.mean_value
+        squares = deviations * deviations
+        block.m2 = float(numpy.sum(squares))
+        block.m3 = float(numpy.sum(squares * deviations))
+        block.m4 = float(numpy.sum(squares * squares))
+        self.merge(block)
+
+    def merge(self, other):
+        """
+        Merges the values summarized by another MomentAccumulator into this one.
+
+        Parameters
+        ----------
+        other : MomentAccumulator
+            The accumulator to be merged. It is not modified.
+        """
+        if other.count == 0:
+            return
+        if self.count == 0:
+            self.count = other.count
+            self.mean_value = other.mean_value
+            self.m2 = other.m2
+            self.m3 = other.m3
+            self.m4 = other.m4
+            return
+
+        na = self.count
+        nb = other.count
+        n = na + nb
+        delta = other.mean_value - self.mean_value
+        delta_n = delta / n
+
+        mean_value = self.mean_value + delta_n * nb
+        m2 = self.m2 + other.m2 + delta * delta_n * na * nb
+        m3 = (
+            self.m3
+            + other.m3
+            + delta * delta_n**2 * na * nb * (na - nb)
+            + 3 * delta_n * (na * other.m2 - nb * self.m2)
+        )
+        m4 = (
+            self.m4
+            + other.m4
+            + delta * delta_n**3 * na * nb * (na * na - na * nb + nb * nb)
+            + 6 * delta_n**2 * (na * na * other.m2 + nb * nb * self.m2)
+            + 4 * delta_n * (na * other.m3 - nb * self.m3)
+        )
+
+        self.count = n
+        self.mean_value = mean_value
+        self.m2 = m2
+        self.m3 = m3
+        self.m4 = m4
+
+    def get_state(self):
+        """
+        Returns the state of the accumulator as an array, e.g. for writing it to a checkpoint.
+
+        Returns
+        -------
+        state : numpy.ndarray
+            The count, mean and sums of powers of the deviations, as floats.
+        """
+        state = numpy.array([self.count, self.mean_value, self.m2, self.m3, self.m4])
+        return state
+
+    def set_state(self, state):
+        """
+        Restores the state returned by get_state.
+
+        Parameters
+        ----------
+        state : numpy.ndarray
+            The array returned by get_state.
+        """
+        self.count = int(state[0])
+        self.mean_value = float(state[1])
+        self.m2 = float(state[2])
+        self.m3 = float(state[3])
+        self.m4 = float(state[4])
+
+    def mean(self):
+        """
+        Returns the mean of the accumulated values.
+
+        Returns
+        -------
+        mean : float
+            The mean of the values.
+        """
+        mean = self.mean_value
+        return mean
+
+    def variance(self):
+        """
+        Returns the (population) variance of the accumulated values, <x^2> - <x>^2.
+
+        Returns
+        -------
+        variance : float
+            The variance of the values.
+        """
+        if self.count == 0:
+            return 0.0
+        variance = self.m2 / self.count
+        return variance
+
+    def central_moment(self, k):
+        """
+        Returns the kth central moment of the accumulated values, <(x - <x>)^k>, for k up to 4.
+
+        Parameters
+        ----------
+        k : int
+            The order of the moment (0 to 4).
+
+        Returns
+        -------
+        moment : float
+            The kth central moment.
+        """
+        if k == 0:
+            return 1.0
+        if k == 1 or self.count == 0:
+            return 0.0
+        sums = {2: self.m2, 3: self.m3, 4: self.m4}
+        if k not in sums:
+            raise ValueError("Only central moments up to order 4 are accumulated.")
+        moment = sums[k] / self.count
+        return moment
+
+    def raw_moment(self, k):
+        """
+        Returns the kth raw moment of the accumulated values, <x^k>, for k up to 4.
+
+        Parameters
+        ----------
+        k : int
+            The order of the moment (0 to 4).
+
+        Returns
+        -------
+        moment : float
+            The kth raw moment.
+        """
+        if k < 0 or k > 4:
+            raise ValueError("Only raw moments up to order 4 are accumulated.")
+        # binomial expansion of <((x - <x>) + <x>)^k>
+        binomial = [[1], [1, 1], [1, 2, 1], [1, 3, 3, 1], [1, 4, 6, 4, 1]]
+        moment = 0.0
+        for j in range(k + 1):
+            moment += (
+                binomial[k][j]
+                * self.central_moment(j)
+                * self.mean_value ** (k - j)
+            )
+        return moment
+
+
+def binder_cumulant(mag_accumulator):
+    """
+    Calculates the Binder cumulant U = 1 - <M^4> / (3 <M^2>^2) from an accumulator of magnetization (or
+    absolute magnetization) values.
+
+    Parameters
+    ----------
+    mag_accumulator : MomentAccumulator
+        The accumulator holding the magnetization values.
+
+    Returns
+    -------
+    cumulant : float
+        The Binder cumulant.
+    """
+    m2 = mag_accumulator.raw_moment(2)
+    if m2 == 0:
+        return 0.0
+    cumulant = 1 - mag_accumulator.raw_moment(4) / (3 * m2**2)
+    return cumulant
+
+
+class BlockAccumulator:
+    def __init__(self, names, max_blocks=64):
+        """
+        Creates a BlockAccumulator for the observables in names. The values are averaged over blocks of
+        consecutive measurements, and at most max_blocks block averages are kept: when the buffer is full,
+        neighboring blocks are merged and the block size doubles. The memory used is therefore bounded, and
+        the spread of the block averages gives error estimates and integrated autocorrelation times that
+        account for the correlations between successive sweeps (binning analysis). The mean and variance of
+        every observable are kept in a MomentAccumulator, so they do not suffer from the cancellation of
+        <x^2> - <x>^2 in long runs with a large mean.
+
+        Parameters
+        ----------
+        names : list
+            The names of the observables, e.g. ["E", "E2", "M", "M2"].
+        max_blocks : int, default: 64
+            The maximum number of block averages kept. Must be even.
+        """
+        if max_blocks < 2 or max_blocks % 2 != 0:
+            raise ValueError("max_blocks must be an even number of at least 2.")
+        self.names = list(names)
+        self.max_blocks = max_blocks
+        self.block_size = 1
+        self.n_blocks = 0  # number of completed blocks
+        self.block_sums = numpy.zeros((max_blocks, len(self.names)))
+        self.partial_sum = numpy.zeros(len(self.names))
+        self.partial_count = 0
+        self.moments = [MomentAccumulator() for name in self.names]
+        self.count = 0
+
+    def add_array(self, values):
+        """
+        Adds a series of measurements to the accumulator.
+
+        Parameters
+        ----------
+        values : numpy.ndarray
+            Array of shape (number of measurements, number of observables), in the order in which the
+            measurements were made.
+        """
+        values = numpy.asarray(values, dtype=numpy.float64).reshape(-1, len(self.names))
+        for k, moments in enumerate(self.moments):
+            moments.add_array(values[:, k])
+        self.count += len(values)
+
+        start = 0
+        while start < len(values):
+            stop = min(len(values), start + self.block_size - self.partial_count)
+            self.partial_sum += numpy.sum(values[start:stop], axis=0)
+            self.partial_count += stop - start
+            start = stop
+            if self.partial_count == self.block_size:  # the current block is complete
+                self._complete_block()
+
+    def merge(self, other):
+        """
+        Merges the values of another BlockAccumulator with the same names and max_blocks, e.g. of an
+        independent chain, into this one. The means and variances combine exactly. The blocks of the
+        accumulator with the shorter blocks are merged up to the longer block size, and the blocks of other
+        are appended to those of this accumulator. The incomplete block of other is added to the incomplete
+        block of this accumulator if they fit into one block, and otherwise only counts in the means and
+        variances.
+
+        Parameters
+        ----------
+        other : BlockAccumulator
+            The accumulator to be merged. It is not modified.
+        """
+        if other.names != self.names or other.max_blocks != self.max_blocks:
+            raise ValueError("Only accumulators with the same names and max_blocks can be merged.")
+        for moments, other_moments in zip(self.moments, other.moments):
+            moments.merge(other_moments)
+        self.count += other.count
+
+        other_sums = other.block_sums[: other.n_blocks]
+        other_size = other.block_size
+        while self.block_size < other_size:
+            self._merge_blocks()
+        while len(other_sums) > 0:
+            if other_size < self.block_size:
+                # an odd last block of other is left out of the blocks
+                half = len(other_sums) // 2
+                other_sums = other_sums[0 : 2 * half : 2] + other_sums[1 : 2 * half : 2]
+                other_size *= 2
+                continue
+            self.block_sums[self.n_blocks] = other_sums[0]
+            other_sums = other_sums[1:]
+            self.n_blocks += 1
+            if self.n_blocks == self.max_blocks:
+                self._merge_blocks()
+
+        if self.partial_count + other.partial_count <= self.block_size and other.block_size == other_size:
+            self.partial_sum += other.partial_sum
+            self.partial_count += other.partial_count
+            if self.partial_count == self.block_size:
+                self._complete_block()
+
+    def _complete_block(self):
+        """
+        Stores the incomplete block, which has reached the block size, as a completed block.
+        """
+        self.block_sums[self.n_blocks] = self.partial_sum
+        self.n_blocks += 1
+        self.partial_sum = numpy.zeros(len(self.names))
+        self.partial_count = 0
+        if self.n_blocks == self.max_blocks:
+            self._merge_blocks()
+
+    def _merge_blocks(self):
+        """
+        Merges neighboring pairs of completed blocks, halving their number and doubling the block size.
+        The incomplete block is kept and filled up to the new block size; an odd last block is added to it.
+        """
+        half = self.n_blocks // 2
+        if self.n_blocks % 2 == 1:
+            self.partial_sum += self.block_sums[self.n_blocks - 1]
+            self.partial_count += self.block_size
+        merged = self.block_sums[0 : 2 * half : 2] + self.block_sums[1 : 2 * half : 2]
+        self.block_sums[:] = 0
+        self.block_sums[:half] = merged
+        self.n_blocks = half
+        self.block_size *= 2
+
+    def get_state(self):
+        """
+        Returns the state of the accumulator as a dictionary of arrays, e.g. for writing it to a checkpoint.
+
+        Returns
+        -------
+        state : dict
+            Maps "block_sums", "partial_sum", "moments" (the MomentAccumulator state of every observable) and
+            "counters" (block size, number of completed blocks, number of values in the incomplete block and
+            total count) to arrays.
+        """
+        state = {
+            "block_sums": self.block_sums.copy(),
+            "partial_sum": self.partial_sum.copy(),
+            "moments": numpy.array([moments.get_state() for moments in self.moments]),
+            "counters": numpy.array(
+                [self.block_size, self.n_blocks, self.partial_count, self.count]
+            ),
+        }
+        return state
+
+    def set_state(self, state):
+        """
+        Restores the state returned by get_state. The accumulator must have been created with the same
+        names and max_blocks.
+
+        Parameters
+        ----------
+        state : dict
+            The dictionary returned by get_state.
+        """
+        if state["block_sums"].shape != self.block_sums.shape:
+            raise ValueError("The state belongs to an accumulator of a different shape.")
+        self.block_sums = numpy.array(state["block_sums"], dtype=numpy.float64)
+        self.partial_sum = numpy.array(state["partial_sum"], dtype=numpy.float64)
+        for moments, moment_state in zip(self.moments, state["moments"]):
+            moments.set_state(moment_state)
+        self.block_size, self.n_blocks, self.partial_count, self.count = [
+            int(value) for value in state["counters"]
+        ]
+
+    def block_means(self):
+        """
+        Returns the averages of the completed blocks.
+
+        Returns
+        -------
+        means : numpy.ndarray
+            Array of shape (number of completed blocks, number of observables).
+        """
+        means = self.block_sums[: self.n_blocks] / self.block_size
+        return means
+
+    def mean(self, name):
+        """
+        Returns the mean of all values added for the named observable.
+
+        Parameters
+        ----------
+        name : str
+            The name of the observable.
+
+        Returns
+        -------
+        mean : float
+            The mean of the values.
+        """
+        k = self.names.index(name)
+        mean = float(self.moments[k].mean())
+        return mean
+
+    def error(self, name):
+        """
+        Returns the statistical error of the mean of the named observable, estimated from the spread of the
+        block averages.
+
+        Parameters
+        ----------
+        name : str
+            The name of the observable.
+
+        Returns
+        -------
+        error : float
+            The estimated standard error of the mean. Infinite if fewer than two blocks are complete.
+        """
+        if self.n_blocks < 2:
+            return numpy.inf
+        k = self.names.index(name)
+        means = self.block_means()[:, k]
+        error = float(numpy.std(means, ddof=1) / numpy.sqrt(self.n_blocks))
+        return error
+
+    def tau_int(self, name):
+        """
+        Returns the integrated autocorrelation time (in measurements) of the named observable, estimated as
+        half the ratio of the variance of the block averages to the variance expected for uncorrelated
+        measurements.
+
+        Parameters
+        ----------
+        name : str
+            The name of the observable.
+
+        Returns
+        -------
+        tau : float
+            The estimated integrated autocorrelation time. Uncorrelated measurements give 0.5.
+        """
+        k = self.names.index(name)
+        if self.n_blocks < 2 or self.count == 0:
+            return numpy.inf
+        naive_variance = self.moments[k].variance()
+        if naive_variance <= 0:
+            return 0.5
+        block_variance = numpy.var(self.block_means()[:, k], ddof=1)
+        tau = float(0.5 * self.block_size * block_variance / naive_variance)
+        return tau
+
+    def jackknife_error(self, function):
+        """
+        Estimates the statistical error of a function of the observable means with the jackknife method,
+        leaving out one block at a time.
+
+        Parameters
+        ----------
+        function : callable
+            Function that takes a dictionary mapping the observable names to means and returns a float.
+
+        Returns
+        -------
+        error : float
+            The jackknife estimate of the standard error. Infinite if fewer than two blocks are complete.
+        """
+        n = self.n_blocks
+        if n < 2:
+            return numpy.inf
+        sums = self.block_sums[:n]
+        total = numpy.sum(sums, axis=0)
+        estimates = numpy.zeros(n)
+        for i in range(n):
+            means = (total - sums[i]) / ((n - 1) * self.block_size)
+            estimates[i] = function(dict(zip(self.names, means)))
+        error = float(
+            numpy.sqrt((n - 1) * numpy.mean((estimates - numpy.mean(estimates)) ** 2))
+        )
+        return error
+
+
+class ThermalAccumulator:
+    def __init__(self):
+        """
+        Creates a ThermalAccumulator, which collects the energies and magnetizations of a Monte Carlo run
+        in MomentAccumulator objects for E, M and |M| and in a BlockAccumulator of E, E^2, M and M^2, and
+        derives the thermal quantities and their statistical errors from them.
+        """
+        self.energy = MomentAccumulator()
+        self.magnetization = MomentAccumulator()
+        self.abs_magnetization = MomentAccumulator()
+        self.blocks = BlockAccumulator(["E", "E2", "M", "M2"])
+
+    def add_array(self, energies, magnetizations):
+        """
+        Adds the energies and magnetizations of a series of sweeps.
+
+        Parameters
+        ----------
+        energies : numpy.ndarray
+            The energies after each sweep.
+        magnetizations : numpy.ndarray
+            The magnetizations after each sweep.
+        """
+        energies = numpy.asarray(energies, dtype=numpy.float64)
+        magnetizations = numpy.asarray(magnetizations)
+        self.energy.add_array(energies)
+        self.magnetization.add_array(magnetizations)
+        self.abs_magnetization.add_array(numpy.abs(magnetizations))
+        mags = magnetizations.astype(numpy.float64)
+        self.blocks.add_array(
+            numpy.column_stack((energies, energies**2, mags, mags**2))
+        )
+
+    def merge(self, other):
+        """
+        Merges the values of another ThermalAccumulator, e.g. of an independent chain at the same
+        temperature, into this one (see MomentAccumulator.merge and BlockAccumulator.merge).
+
+        Parameters
+        ----------
+        other : ThermalAccumulator
+            The accumulator to be merged. It is not modified.
+        """
+        self.energy.merge(other.energy)
+        self.magnetization.merge(other.magnetization)
+        self.abs_magnetization.merge(other.abs_magnetization)
+        self.blocks.merge(other.blocks)
+
+    def get_state(self):
+        """
+        Returns the state of the accumulator as a flat dictionary of arrays, e.g. for writing it to a
+        checkpoint.
+
+        Returns
+        -------
+        state : dict
+            Maps names such as "energy" or "blocks/moments" to arrays.
+        """
+        state = {
+            "energy": self.energy.get_state(),
+            "magnetization": self.magnetization.get_state(),
+            "abs_magnetization": self.abs_magnetization.get_state(),
+        }
+        for key, value in self.blocks.get_state().items():
+            state["blocks/" + key] = value
+        return state
+
+    def set_state(self, state):
+        """
+        Restores the state returned by get_state.
+
+        Parameters
+        ----------
+        state : dict
+            The dictionary returned by get_state.
+        """
+        self.energy.set_state(state["energy"])
+        self.magnetization.set_state(state["magnetization"])
+        self.abs_magnetization.set_state(state["abs_magnetization"])
+        self.blocks.set_state(
+            {
+                key[len("blocks/") :]: value
+                for key, value in state.items()
+                if key.startswith("blocks/")
+            }
+        )
+
+    def thermal_quantities(self, temp):
+        """
+        Returns the average energy, average magnetization, heat capacity and magnetic susceptibility.
+
+        Parameters
+        ----------
+        temp : float
+            The temperature at which the values were sampled.
+
+        Returns
+        -------
+        avg_energy : float
+            The average energy.
+        avg_mag : float
+            The average magnetization.
+        heat_cap : float
+            The heat capacity.
+        mag_susceptibility : float
+            The magnetic susceptibility.
+        """
+        avg_energy = self.energy.mean()
+        avg_mag = self.magnetization.mean()
+        heat_cap = self.energy.variance() / (temp**2)
+        mag_susceptibility = self.magnetization.variance() / temp
+        return avg_energy, avg_mag, heat_cap, mag_susceptibility
+
+    def errors(self, temp):
+        """
+        Estimates the statistical errors of the thermal quantities from the block averages.
+
+        Parameters
+        ----------
+        temp : float
+            The temperature at which the values were sampled.
+
+        Returns
+        -------
+        errors : dict
+            Maps "energy", "magnetization", "heat_capacity" and "mag_susceptibility" to their errors.
+        """
+        errors = {
+            "energy": self.blocks.error("E"),
+            "magnetization": self.blocks.error("M"),
+            "heat_capacity": self.blocks.jackknife_error(
+                lambda m: (m["E2"] - m["E"] ** 2) / temp**2
+            ),
+            "mag_susceptibility": self.blocks.jackknife_error(
+                lambda m: (m["M2"] - m["M"] ** 2) / temp
+            ),
+        }
+        return errors
+
+    def target_reached(self, temp, target_error):
+        """
+        Checks whether every quantity in target_error has reached its requested relative error. The check
+        only passes once the block buffer has been filled and the blocks are long compared to the
+        autocorrelation time, so that the error estimates themselves can be trusted.
+
+        Parameters
+        ----------
+        temp : float
+            The temperature at which the values were sampled.
+        target_error : dict
+            Maps quantity names (see errors) to the requested relative errors.
+
+        Returns
+        -------
+        reached : bool
+            True if all targets are met.
+        """
+        blocks = self.blocks
+        if blocks.n_blocks < blocks.max_blocks // 2:
+            return False
+        if blocks.block_size < 10 * max(blocks.tau_int("E"), blocks.tau_int("M")):
+            return False
+
+        errors = self.errors(temp)
+        values = dict(
+            zip(
+                ["energy", "magnetization", "heat_capacity", "mag_susceptibility"],
+                self.thermal_quantities(temp),
+            )
+        )
+        for name in target_error:
+            if errors[name] > target_error[name] * abs(values[name]):
+                return False
+        return True
+
+    def info(self, temp):
+        """
+        Returns a dictionary describing the accumulated values: the MomentAccumulator objects ("energy",
+        "magnetization" and "abs_magnetization"), the Binder cumulant ("binder_cumulant"), the errors of
+        the thermal quantities ("errors"), the integrated autocorrelation times of the energy and
+        magnetization in sweeps ("tau_int") and the number of accumulated sweeps ("steps").
+
+        Parameters
+        ----------
+        temp : float
+            The temperature at which the values were sampled.
+
+        Returns
+        -------
+        info : dict
+            The dictionary described above.
+        """
+        info = {
+            "energy": self.energy,
+            "magnetization": self.magnetization,
+            "abs_magnetization": self.abs_magnetization,
+            "binder_cumulant": binder_cumulant(self.magnetization),
+            "errors": self.errors(temp),
+            "tau_int": {
+                "energy": self.blocks.tau_int("E"),
+                "magnetization": self.blocks.tau_int("M"),
+            },
+            "steps": self.energy.count,
+        }
+        return info
@@ -0,0 +1,603 @@
+"""
+Interchangeable implementations ("backends") of the metropolis sweep, the energy calculation and the
+measurement loop used by the Monte Carlo functions of this package.
+
+Every backend works on a spin configuration stored as a numpy array of 0's and 1's and on an array of
+uniform random numbers with one entry per visited site, so the random number generator is kept outside
+of the kernels. The available backends are:
+
+* "python": a pure Python reference that evaluates the flip probability (Hamiltonian.flip_acceptance)
+  for every visited site, like the original per-site metropolis sweep.
+* "numpy": looks the flip probabilities up in Hamiltonian.flip_probability_table and computes energies
+  and magnetizations with array operations.
+* "numba": the same table-driven sweep and measurement loop compiled with numba. Only available if numba
+  is installed; requesting it otherwise falls back to the "numpy" backend with a warning.
+
+Every backend also has a measurement loop for a batch of independent chains (batch_run); the "numpy"
+backend updates all chains of a batch at once with array operations, which makes it the fastest choice
+for large batches without numba.
+
+Every kernel takes an update rule, "metropolis" (the default) or "heat_bath"; the rule only changes the
+flip probabilities, so the heat-bath sweep runs through the same tables and batched loops. The rule
+"block_gibbs" replaces the single-site sweep of every backend by the block sweep of the block_gibbs
+module, which is the same for all backends. Its block boundaries alternate with the parity of the sweep
+index, so sweep, run and batch_run take the index of their first sweep in the chain (first_sweep), which
+the other rules ignore.
+
+Reproducibility: all backends visit the sites in the same (typewriter) order, consume exactly one uniform
+number per visited site and compare it against an identically computed acceptance ratio, so for the same
+random numbers they produce bit-for-bit identical configurations, energies and magnetizations. Energies
+are rebuilt from the integer bond sum and magnetization after each sweep and therefore never drift.
+"""
+import warnings
+
+import numpy
+
+try:
+    import numba
+    import numba.extending
+except ImportError:  # numba is an optional dependency
+    numba = None
+
+__all__ = [
+    "Backend",
+    "register_backend",
+    "available_backends",
+    "set_default_backend",
+    "get_backend",
+]
+
+
+class Backend:
+    def __init__(self, name, energy, sweep, run, reproducibility="", batch_run=None):
+        """
+        Creates a Backend object bundling the kernels of one implementation.
+
+        Parameters
+        ----------
+        name : str
+            The name under which the backend is registered.
+        energy : callable
+            energy(config, ham) -> (bond_sum, magnetization) of a configuration.
+        sweep : callable
+            sweep(config, ham, temp, uniforms, rule="metropolis") -> (delta_bond_sum, delta_magnetization);
+            performs one sweep in place using one uniform random number per site, with the update rule
+            "metropolis" or "heat_bath" (see Hamiltonian.flip_acceptance).
+        run : callable
+            run(config, ham, temp, uniforms, rule="metropolis") -> (bond_sums, magnetizations); performs
+            one sweep per row of the 2D uniforms array in place and returns the values after each sweep.
+        reproducibility : str, default: ""
+            Description of the reproducibility guarantees of the backend.
+        batch_run : callable, default: None
+            batch_run(configs, ham, temps, uniforms, rule="metropolis") -> (bond_sums, magnetizations); the
+            measurement loop
+            for a batch of independent chains. configs has shape (chains, N), temps holds the temperature
+            of every chain, uniforms has shape (sweeps, chains, N) and the returned arrays have shape
+            (sweeps, chains). If None, run is called for one chain after another.
+        """
+        self.name = name
+        self.energy = energy
+        self._sweep = sweep
+        self._run = run
+        self.reproducibility = reproducibility
+        if batch_run is None:
+            batch_run = self._run_chains
+        self._batch_run = batch_run
+
+    def sweep(self, config, ham, temp, uniforms, rule="metropolis", first_sweep=0):
+        """
+        Performs one sweep with the sweep kernel, or with the block sweep if rule is "block_gibbs".
+        """
+        if rule == "block_gibbs":
+            bond_sum, magnetization = self.energy(config, ham)
+            bond_sums, magnetizations = _block_gibbs_run(
+                config, ham, temp, numpy.asarray(uniforms)[numpy.newaxis], first_sweep
+            )
+            return int(bond_sums[0]) - bond_sum, int(magnetizations[0]) - magnetization
+        return self._sweep(config, ham, temp, uniforms, rule)
+
+    def run(self, config, ham, temp, uniforms, rule="metropolis", first_sweep=0):
+        """
+        Performs one sweep per row of uniforms with the run kernel, or with the block sweep if rule is
+        "block_gibbs".
+        """
+        if rule == "block_gibbs":
+            return _block_gibbs_run(config, ham, temp, uniforms, first_sweep)
+        return self._run(config, ham, temp, uniforms, rule)
+
+    def batch_run(self, configs, ham, temps, uniforms, rule="metropolis", first_sweep=0):
+        """
+        Runs a batch of chains with the batch_run kernel, or with the block sweep if rule is "block_gibbs".
+        """
+        if rule == "block_gibbs":
+            return _block_gibbs_batch_run(configs, ham, temps, uniforms, first_sweep)
+        return self._batch_run(configs, ham, temps, uniforms, rule)
+
+    def _run_chains(self, configs, ham, temps, uniforms, rule="metropolis"):
+        """
+        Default batch_run: runs the chains of a batch one after another with run.
+        """
+        n_sweeps, n_chains = uniforms.shape[0], uniforms.shape[1]
+        bond_sums = numpy.zeros((n_sweeps, n_chains), dtype=numpy.int64)
+        magnetizations = numpy.zeros((n_sweeps, n_chains), dtype=numpy.int64)
+        for r in range(n_chains):
+            bond_sums[:, r], magnetizations[:, r] = self.run(
+                configs[r], ham, temps[r], uniforms[:, r], rule
+            )
+        return bond_sums, magnetizations
+
+    def __str__(self):
+        return "Backend " + self.name + ": " + self.reproducibility
+
+
+_BACKENDS = {}
+_default_backend = "numpy"
+
+# smallest batch for which the numpy backend updates the chains of a batch together
+_VECTORIZE_MIN_CHAINS = 128
+
+# number of uniform random numbers the Monte Carlo functions draw per block of sweeps
+BLOCK_UNIFORMS = 2**16
+
+
+def _block_gibbs_run(config, ham, temp, uniforms, first_sweep):
+    # imported here because the block_gibbs module uses the helpers of this module
+    from .block_gibbs import block_gibbs_run
+
+    return block_gibbs_run(config, ham, temp, uniforms, first_sweep=first_sweep)
+
+
+def _block_gibbs_batch_run(configs, ham, temps, uniforms, first_sweep):
+    from .block_gibbs import block_gibbs_batch_run
+
+    return block_gibbs_batch_run(configs, ham, temps, uniforms, first_sweep=first_sweep)
+
+
+def register_backend(backend):
+    """
+    Adds a Backend object to the backend registry, replacing any backend with the same name.
+
+    Parameters
+    ----------
+    backend : Backend
+        The backend to be registered.
+    """
+    _BACKENDS[backend.name] = backend
+
+
+def available_backends():
+    """
+    Returns the names of the backends that can be used in this environment.
+
+    Returns
+    -------
+    names : list
+        The names of the registered backends.
+    """
+    names = list(_BACKENDS.keys())
+    return names
+
+
+def set_default_backend(name):
+    """
+    Selects the backend used by the Monte Carlo functions when no backend is passed in explicitly.
+
+    Parameters
+    ----------
+    name : str
+        The name of the backend, e.g. "python", "numpy" or "numba".
+    """
+    global _default_backend
+    _default_backend = get_backend(name).name
+
+
+def get_backend(name=None):
+    """
+    Looks up a backend in the registry.
+
+    Parameters
+    ----------
+    name : str or Backend, default: None
+        The name of the backend. If None, the default backend is returned. If a Backend object is passed
+        in, it is returned unchanged.
+
+    Returns
+    -------
+    backend : Backend
+        The requested backend. If "numba" is requested but numba is not installed, the "numpy" backend is
+        returned instead and a warning is issued.
+    """
+    if isinstance(name, Backend):
+        return name
+    if name is None:
+        name = _default_backend
+    if name == "numba" and name not in _BACKENDS:
+        warnings.warn(
+            "numba is not installed; falling back to the numpy backend.", RuntimeWarning
+        )
+        name = "numpy"
+    if name not in _BACKENDS:
+        raise ValueError(
+            "Unknown backend "
+            + repr(name)
+            + ". Available backends: "
+            + ", ".join(available_backends())
+        )
+    backend = _BACKENDS[name]
+    return backend
+
+
+def compute_bond_sum(config, periodic):
+    """
+    Computes the sum of the products of adjacent spins (each counted as -1 or +1) of a configuration
+    stored as an array of 0's and 1's.
+    """
+    x = 2 * numpy.asarray(config, dtype=numpy.int64) - 1
+    bond_sum = int(numpy.dot(x[:-1], x[1:]))
+    if periodic:
+        bond_sum += int(x[0] * x[-1])
+    return bond_sum
+
+
+def compute_magnetization(config):
+    """
+    Computes the magnetization of a configuration stored as an array of 0's and 1's.
+    """
+    magnetization = 2 * int(numpy.count_nonzero(config)) - len(config)
+    return magnetization
+
+
+def bond_energy(ham, bond_sum, magnetization):
+    """
+    Converts bond sums and magnetizations (integers or integer arrays) into energies, grouping the terms in
+    the same way as Hamiltonian.compute_energy.
+    """
+    energy = -ham.J * bond_sum + ham.mu * magnetization
+    return energy
+
+
+def jit_kernel(function):
+    """
+    Compiles a kernel written in plain Python with numba if it is installed, and returns it unchanged
+    otherwise.
+    """
+    if numba is None:
+        return function
+    return numba.njit(function)
+
+
+def jit_helper(function):
+    """
+    Makes a plain Python helper callable from the kernels compiled by jit_kernel, if numba is installed. The
+    helper itself stays a plain Python function.
+    """
+    if numba is None:
+        return function
+    return numba.extending.register_jitable(function)
+
+
+@jit_helper
+def neighbor_sum(config, i, periodic):
+    """
+    Returns the sum of the neighboring spins of site i (each counted as -1 or +1) of a configuration stored
+    as an array or list of 0's and 1's.
+    """
+    n = len(config)
+    h = 0
+    if periodic or i > 0:
+        h += 2 * int(config[(i - 1) % n]) - 1
+    if periodic or i < n - 1:
+        h += 2 * int(config[(i + 1) % n]) - 1
+    return h
+
+
+@jit_helper
+def flip_deltas(config, i, periodic):
+    """
+    Returns the changes of the bond sum and of the magnetization if the spin at site i is flipped; the energy
+    changes by -J times the first plus mu times the second.
+    """
+    new_spin = 1 - 2 * int(config[i])
+    return 2 * new_spin * neighbor_sum(config, i, periodic), 2 * new_spin
+
+
+def neighbor_sums(configs, rows, sites, periodic):
+    """
+    The array form of neighbor_sum: returns the neighbor sums of the sites configs[rows, sites] of a batch of
+    configurations, as an int64 array of the broadcast shape of rows and sites.
+    """
+    n = configs.shape[1]
+    left = 2 * configs[rows, (sites - 1) % n].astype(numpy.int64) - 1
+    right = 2 * configs[rows, (sites + 1) % n].astype(numpy.int64) - 1
+    if not periodic:
+        left = numpy.where(sites > 0, left, 0)
+        right = numpy.where(sites < n - 1, right, 0)
+    return left + right
+
+
+# ----------------------------------------------------------------------------------------------------------
+# "python" backend: pure Python reference
+# ----------------------------------------------------------------------------------------------------------
+
+
+def _python_energy(config, ham):
+    spins = [int(s) for s in config]
+    n = len(spins)
+    bond_sum = 0
+    for i in range(n - 1):
+        bond_sum += 1 if spins[i] == spins[i + 1] else -1
+    if ham.doPeriodicBoundaryConditions:
+        bond_sum += 1 if spins[0] == spins[n - 1] else -1
+    magnetization = 0
+    for i in range(n):
+        magnetization += 1 if spins[i] == 1 else -1
+    return bond_sum, magnetization
+
+
+def _python_sweep(config, ham, temp, uniforms, rule="metropolis"):
+    spins = [int(s) for s in config]
+    n = len(spins)
+    delta_bond = 0
+    delta_mag = 0
+    for i in range(n):
+        new_spin = 1 - spins[i]
+
+        # change in the bond sum: +2 for every neighbor matching the flipped spin, -2 otherwise
+        J_term = 0
+        if ham.doPeriodicBoundaryConditions or i > 0:
+            J_term += 2 if spins[i - 1] == new_spin else -2
+        if ham.doPeriodicBoundaryConditions or i < n - 1:
+            J_term += 2 if spins[(i + 1) % n] == new_spin else -2
+        mu_term = 2 if new_spin == 1 else -2
+
+        deltaE = -J_term * ham.J + mu_term * ham.mu
+        probability = ham.flip_acceptance(deltaE, temp, rule)
+        if probability > uniforms[i]:
+            spins[i] = new_spin
+            delta_bond += J_term
+            delta_mag += mu_term
+    config[:] = spins
+    return delta_bond, delta_mag
+
+
+def _python_run(config, ham, temp, uniforms, rule="metropolis"):
+    n_sweeps = len(uniforms)
+    bond_sums = numpy.zeros(n_sweeps, dtype=numpy.int64)
+    magnetizations = numpy.zeros(n_sweeps, dtype=numpy.int64)
+    bond_sum, magnetization = _python_energy(config, ham)
+    for step in range(n_sweeps):
+        delta_bond, delta_mag = _python_sweep(config, ham, temp, uniforms[step], rule)
+        bond_sum += delta_bond
+        magnetization += delta_mag
+        bond_sums[step] = bond_sum
+        magnetizations[step] = magnetization
+    return bond_sums, magnetizations
+
+
+register_backend(
+    Backend(
+        "python",
+        _python_energy,
+        _python_sweep,
+        _python_run,
+        "pure Python reference; identical to Hamiltonian.metropolis_sweep for the same random numbers.",
+    )
+)
+
+
+# ----------------------------------------------------------------------------------------------------------
+# "numpy" backend: table lookups and array operations
+# ----------------------------------------------------------------------------------------------------------
+
+
+def _numpy_energy(config, ham):
+    bond_sum = compute_bond_sum(config, ham.doPeriodicBoundaryConditions)
+    magnetization = compute_magnetization(config)
+    return bond_sum, magnetization
+
+
+def _table_sweep(spins, table, periodic, uniforms):
+    # spins, table and uniforms are plain Python lists; indexing them is much cheaper than indexing arrays
+    n = len(spins)
+    delta_bond = 0
+    delta_mag = 0
+    for i in range(n):
+        h = 0  # sum of the neighboring spins, counted as -1 or +1
+        if periodic or i > 0:
+            h += 2 * spins[i - 1] - 1
+        if periodic or i < n - 1:
+            h += 2 * spins[(i + 1) % n] - 1
+        s = spins[i]
+        if uniforms[i] < table[s][h + 2]:
+            new_spin = 1 - 2 * s
+            spins[i] = 1 - s
+            delta_bond += 2 * new_spin * h
+            delta_mag += 2 * new_spin
+    return delta_bond, delta_mag
+
+
+def _numpy_sweep(config, ham, temp, uniforms, rule="metropolis"):
+    spins = config.tolist()
+    table = ham.flip_probability_table(temp, rule).tolist()
+    delta_bond, delta_mag = _table_sweep(
+        spins, table, ham.doPeriodicBoundaryConditions, numpy.asarray(uniforms).tolist()
+    )
+    config[:] = spins
+    return delta_bond, delta_mag
+
+
+def _numpy_run(config, ham, temp, uniforms, rule="metropolis"):
+    spins = config.tolist()
+    table = ham.flip_probability_table(temp, rule).tolist()
+    periodic = ham.doPeriodicBoundaryConditions
+    n_sweeps = len(uniforms)
+    bond_sums = numpy.zeros(n_sweeps, dtype=numpy.int64)
+    magnetizations = numpy.zeros(n_sweeps, dtype=numpy.int64)
+    bond_sum, magnetization = _numpy_energy(config, ham)
+    for step, row in enumerate(numpy.asarray(uniforms).tolist()):
+        delta_bond, delta_mag = _table_sweep(spins, table, periodic, row)
+        bond_sum += delta_bond
+        magnetization += delta_mag
+        bond_sums[step] = bond_sum
+        magnetizations[step] = magnetization
+    config[:] = spins
+    return bond_sums, magnetizations
+
+
+def _numpy_batch_run(configs, ham, temps, uniforms, rule="metropolis"):
+    n_chains, n = configs.shape
+    if n_chains < _VECTORIZE_MIN_CHAINS:
+        # for small batches the per-site overhead of array operations outweighs their benefit
+        return _BACKENDS["numpy"]._run_chains(configs, ham, temps, uniforms, rule)
+
+    # the chains are updated together: every step of the site loop works on one column of configs
+    periodic = ham.doPeriodicBoundaryConditions
+    tables = numpy.array([ham.flip_probability_table(temp, rule) for temp in temps])
+    chains = numpy.arange(n_chains)
+
+    x = 2 * configs.astype(numpy.int64) - 1
+    bond_sum = numpy.sum(x[:, :-1] * x[:, 1:], axis=1)
+    if periodic:
+        bond_sum += x[:, 0] * x[:, -1]
+    magnetization = numpy.sum(x, axis=1)
+
+    n_sweeps = uniforms.shape[0]
+    bond_sums = numpy.zeros((n_sweeps, n_chains), dtype=numpy.int64)
+    magnetizations = numpy.zeros((n_sweeps, n_chains), dtype=numpy.int64)
+    for step in range(n_sweeps):
+        for i in range(n):
+            h = neighbor_sums(configs, chains, i, periodic)
+            s = configs[:, i].astype(numpy.int64)
+            flip = uniforms[step, :, i] < tables[chains, s, h + 2]
+            new_spin = 1 - 2 * s
+            bond_sum += numpy.where(flip, 2 * new_spin * h, 0)
+            magnetization += numpy.where(flip, 2 * new_spin, 0)
+            configs[flip, i] = 1 - configs[flip, i]
+        bond_sums[step] = bond_sum
+        magnetizations[step] = magnetization
+    return bond_sums, magnetizations
+
+
+register_backend(
+    Backend(
+        "numpy",
+        _numpy_energy,
+        _numpy_sweep,
+        _numpy_run,
+        "table-driven; bit-for-bit identical to the python backend for the same random numbers.",
+        batch_run=_numpy_batch_run,
+    )
+)
+
+
+# ----------------------------------------------------------------------------------------------------------
+# "numba" backend: compiled table-driven kernels
+# ----------------------------------------------------------------------------------------------------------
+
+if numba is not None:
+
+    @numba.njit
+    def _jit_energy_kernel(config, periodic):
+        n = config.shape[0]
+        bond_sum = 0
+        magnetization = 0
+        for i in range(n):
+            magnetization += 2 * config[i] - 1
+            if i < n - 1 or periodic:
+                bond_sum += (2 * config[i] - 1) * (2 * config[(i + 1) % n] - 1)
+        return bond_sum, magnetization
+
+    @numba.njit
+    def _jit_sweep_kernel(config, table, periodic, uniforms):
+        n = config.shape[0]
+        delta_bond = 0
+        delta_mag = 0
+        for i in range(n):
+            h = neighbor_sum(config, i, periodic)
+            s = config[i]
+            if uniforms[i] < table[s, h + 2]:
+                new_spin = 1 - 2 * s
+                config[i] = 1 - s
+                delta_bond += 2 * new_spin * h
+                delta_mag += 2 * new_spin
+        return delta_bond, delta_mag
+
+    @numba.njit
+    def _jit_run_kernel(config, table, periodic, uniforms, bond_sums, magnetizations):
+        bond_sum, magnetization = _jit_energy_kernel(config, periodic)
+        for step in range(uniforms.shape[0]):
+            delta_bond, delta_mag = _jit_sweep_kernel(
+                config, table, periodic, uniforms[step]
+            )
+            bond_sum += delta_bond
+            magnetization += delta_mag
+            bond_sums[step] = bond_sum
+            magnetizations[step] = magnetization
+
+    @numba.njit
+    def _jit_batch_run_kernel(configs, tables, periodic, uniforms, bond_sums, magnetizations):
+        for r in range(configs.shape[0]):
+            bond_sum, magnetization = _jit_energy_kernel(configs[r], periodic)
+            for step in range(uniforms.shape[0]):
+                delta_bond, delta_mag = _jit_sweep_kernel(
+                    configs[r], tables[r], periodic, uniforms[step, r]
+                )
+                bond_sum += delta_bond
+                magnetization += delta_mag
+                bond_sums[step, r] = bond_sum
+                magnetizations[step, r] = magnetization
+
+    def _numba_energy(config, ham):
+        bond_sum, magnetization = _jit_energy_kernel(
+            numpy.ascontiguousarray(config), ham.doPeriodicBoundaryConditions
+        )
+        return int(bond_sum), int(magnetization)
+
+    def _numba_sweep(config, ham, temp, uniforms, rule="metropolis"):
+        delta_bond, delta_mag = _jit_sweep_kernel(
+            config,
+            ham.flip_probability_table(temp, rule),
+            ham.doPeriodicBoundaryConditions,
+            numpy.ascontiguousarray(uniforms, dtype=numpy.float64),
+        )
+        return int(delta_bond), int(delta_mag)
+
+    def _numba_run(config, ham, temp, uniforms, rule="metropolis"):
+        uniforms = numpy.ascontiguousarray(uniforms, dtype=numpy.float64)
+        bond_sums = numpy.zeros(len(uniforms), dtype=numpy.int64)
+        magnetizations = numpy.zeros(len(uniforms), dtype=numpy.int64)
+        _jit_run_kernel(
+            config,
+            ham.flip_probability_table(temp, rule),
+            ham.doPeriodicBoundaryConditions,
+            uniforms,
+            bond_sums,
+            magnetizations,
+        )
+        return bond_sums, magnetizations
+
+    def _numba_batch_run(configs, ham, temps, uniforms, rule="metropolis"):
+        uniforms = numpy.ascontiguousarray(uniforms, dtype=numpy.float64)
+        tables = numpy.array([ham.flip_probability_table(temp, rule) for temp in temps])
+        bond_sums = numpy.zeros(uniforms.shape[:2], dtype=numpy.int64)
+        magnetizations = numpy.zeros(uniforms.shape[:2], dtype=numpy.int64)
+        _jit_batch_run_kernel(
+            configs,
+            tables,
+            ham.doPeriodicBoundaryConditions,
+            uniforms,
+            bond_sums,
+            magnetizations,
+        )
+        return bond_sums, magnetizations
+
+    register_backend(
+        Backend(
+            "numba",
+            _numba_energy,
+            _numba_sweep,
+            _numba_run,
+            "compiled with numba; bit-for-bit identical to the python backend for the same random numbers.",
+            batch_run=_numba_batch_run,
+        )
+    )
@@ -0,0 +1,239 @@
+"""
+Block Gibbs sampling of the Ising chain.
+
+A sweep cuts the chain into contiguous blocks of k spins and draws every block exactly from its conditional
+Boltzmann distribution given the two spins next to it. Along a block the distribution is a Markov chain, so
+a forward pass of the 2 x 2 transfer matrix accumulates the (log) weights of the two values of every spin,
+and a backward pass draws the last spin and then every spin given the one after it, using one uniform
+number per site. Blocks that do not touch are independent given the rest of the chain, so the even and
+then the odd blocks are drawn together, and the block boundaries move by k / 2 on every other sweep. A
+domain of length up to about k is created or removed in one step, so the autocorrelation times drop by
+about k^2 compared to single-site updates when the correlation length is long.
+
+Which of the two layouts of blocks a sweep uses is set by the parity of its index in the chain, first_sweep
+plus its row in uniforms. Callers that hand the sweeps of a chain over in several calls pass the number of
+sweeps done before every call, so the layouts keep alternating across calls.
+
+The block sweep is selected with the update rule "block_gibbs" in montecarlo_metropolis and every other
+function that takes a rule and runs its sweeps through a backend.
+"""
+import math
+
+import numpy
+from .backends import compute_bond_sum, compute_magnetization
+
+__all__ = ["block_gibbs_run", "block_gibbs_batch_run"]
+
+# largest block size chosen automatically
+_MAX_BLOCK_SIZE = 64
+
+
+def block_gibbs_run(config, ham, temp, uniforms, block_size=None, first_sweep=0):
+    """
+    Performs one block Gibbs sweep per row of uniforms, in place, and returns the bond sum and
+    magnetization after every sweep. It has the signature of the run kernel of a backend.
+
+    Parameters
+    ----------
+    config : numpy.ndarray
+        The configuration, an array of 0's and 1's.
+    ham : Hamiltonian
+        The Hamiltonian used to describe the spin system.
+    temp : float
+        The temperature of the spin system.
+    uniforms : numpy.ndarray
+        The uniform random numbers, one row of N numbers per sweep.
+    block_size : int, default: None
+        The number of spins k of a block. If None, it is chosen from the correlation length xi of the
+        infinite chain at this temperature, k = 4 xi, between 2 and 64. It is at most N // 2.
+    first_sweep : int, default: 0
+        The index of the first sweep in the chain. The block boundaries of the sweeps with odd index are
+        shifted by k / 2.
+
+    Returns
+    -------
+    bond_sums : numpy.ndarray
+        The bond sum after every sweep.
+    magnetizations : numpy.ndarray
+        The magnetization after every sweep.
+    """
+    bond_sums, magnetizations = block_gibbs_batch_run(
+        config[numpy.newaxis],
+        ham,
+        [temp],
+        numpy.asarray(uniforms)[:, numpy.newaxis],
+        block_size,
+        first_sweep,
+    )
+    return bond_sums[:, 0], magnetizations[:, 0]
+
+
+def block_gibbs_batch_run(configs, ham, temps, uniforms, block_size=None, first_sweep=0):
+    """
+    Performs block Gibbs sweeps of a batch of independent chains, in place, with the signature of the
+    batch_run kernel of a backend. The chains with the same block size and sweep parity are updated
+    together.
+
+    Parameters
+    ----------
+    configs : numpy.ndarray
+        The configurations of the chains, of shape (chains, N).
+    ham : Hamiltonian
+        The Hamiltonian used to describe the spin system.
+    temps : list
+        The temperature of every chain.
+    uniforms : numpy.ndarray
+        The uniform random numbers, of shape (sweeps, chains, N).
+    block_size : int, default: None
+        The block size of all chains (see block_gibbs_run). If None, it is chosen for every chain from its
+        temperature.
+    first_sweep : int or array_like, default: 0
+        The index of the first sweep in the chain (see block_gibbs_run), for all chains or for every chain.
+
+    Returns
+    -------
+    bond_sums : numpy.ndarray
+        The bond sum of every chain after every sweep, of shape (sweeps, chains).
+    magnetizations : numpy.ndarray
+        The magnetization of every chain after every sweep, of shape (sweeps, chains).
+    """
+    n_chains, N = configs.shape
+    periodic = ham.doPeriodicBoundaryConditions
+    temps = numpy.asarray(temps, dtype=float)
+    uniforms = numpy.asarray(uniforms)
+    if block_size is None:
+        block_sizes = numpy.array([_block_size(ham, temp) for temp in temps])
+    else:
+        block_sizes = numpy.full(n_chains, block_size)
+    block_sizes = numpy.maximum(numpy.minimum(block_sizes, N // 2), 1)
+    parities = numpy.broadcast_to(numpy.asarray(first_sweep) % 2, (n_chains,))
+
+    n_sweeps = uniforms.shape[0]
+    bond_sums = numpy.zeros((n_sweeps, n_chains), dtype=numpy.int64)
+    magnetizations = numpy.zeros((n_sweeps, n_chains), dtype=numpy.int64)
+    for size, parity in sorted(set(zip(block_sizes.tolist(), parities.tolist()))):
+        chains = numpy.flatnonzero((block_sizes == size) & (parities == parity))
+        chain_configs = configs[chains]
+        # the blocks of the sweeps with even and with odd index, whose boundaries are shifted by k / 2
+        layouts = [_block_groups(N, size, offset, periodic) for offset in [0, size // 2]]
+        lengths = set(length for layout in layouts for starts, length in layout)
+        tables = {
+            length: _conditional_table(ham.J / temps[chains], ham.mu / temps[chains], length)
+            for length in lengths
+        }
+        for step in range(n_sweeps):
+            for starts, length in layouts[(parity + step) % 2]:
+                _draw_blocks(
+                    chain_configs, starts, length, tables[length], periodic, uniforms[step, chains]
+                )
+            x = 2 * chain_configs.astype(numpy.int64) - 1
+            bond_sums[step, chains] = numpy.sum(x[:, :-1] * x[:, 1:], axis=1)
+            if periodic:
+                bond_sums[step, chains] += x[:, 0] * x[:, -1]
+            magnetizations[step, chains] = numpy.sum(x, axis=1)
+        configs[chains] = chain_configs
+    return bond_sums, magnetizations
+
+
+def _block_size(ham, temp):
+    """
+    Returns the block size 4 xi, between 2 and _MAX_BLOCK_SIZE, where xi = 1 / ln(lambda_1 / |lambda_2|) is
+    the correlation length of the infinite chain from the eigenvalues of its transfer matrix.
+    """
+    a = ham.J / temp
+    b = ham.mu / temp
+    if abs(b) > 700:
+        return 2  # the chain is frozen in the field
+    if -4 * a > 700:
+        return _MAX_BLOCK_SIZE  # deep in the antiferromagnetic state, where lambda_2 / lambda_1 -> -1
+    # lambda_2 / lambda_1 = (1 - exp(-4a)) / (cosh b + sqrt(sinh^2 b + exp(-4a)))^2
+    root = math.sqrt(math.sinh(b) ** 2 + math.exp(-4 * a))
+    ratio = abs(1 - math.exp(-4 * a)) / (math.cosh(b) + root) ** 2
+    if ratio >= 1:
+        return _MAX_BLOCK_SIZE
+    if ratio == 0:
+        return 2
+    xi = -1 / math.log(ratio)
+    return int(min(max(math.ceil(4 * xi), 2), _MAX_BLOCK_SIZE))
+
+
+def _block_groups(N, block_size, offset, periodic):
+    """
+    Returns the blocks of a sweep as a list of (starts, length) pairs, in the order in which they are drawn.
+    The blocks of a pair have the same length and do not touch, so they are drawn together.
+    """
+    if periodic:
+        bounds = list(range(offset, offset + N, block_size)) + [offset + N]
+    else:
+        bounds = sorted(set([0] + list(range(offset, N, block_size)) + [N]))
+    blocks = [(bounds[m], bounds[m + 1] - bounds[m]) for m in range(len(bounds) - 1)]
+    colors = [m % 2 for m in range(len(blocks))]
+    if periodic and len(blocks) % 2 == 1:
+        colors[-1] = 2  # the last block touches the first one around the ring
+
+    groups = []
+    for color in range(3):
+        lengths = sorted(set(length for (start, length), c in zip(blocks, colors) if c == color))
+        for length in lengths:
+            starts = [
+                start for (start, block_length), c in zip(blocks, colors)
+                if c == color and block_length == length
+            ]
+            groups.append((numpy.array(starts) % N, length))
+    return groups
+
+
+def _conditional_table(couplings, fields, length):
+    """
+    Returns the probabilities that spin j of a block of length spins is up, given the spin before the
+    block and the spin after spin j, for every chain: table[r, a, j, b] with a and b equal to 0 (spin -1),
+    1 (spin +1) or 2 (no spin, at an open end), and couplings and fields holding J / T and mu / T of every
+    chain. The spins of the block before j are summed over with a forward pass of the transfer matrix.
+    """
+    values = numpy.array([-1.0, 1.0])
+    neighbors = numpy.array([-1.0, 1.0, 0.0])
+    couplings = couplings[:, numpy.newaxis, numpy.newaxis]
+    fields = fields[:, numpy.newaxis, numpy.newaxis]
+
+    # log_weights[:, a, v] is the log of the summed weight of the spins up to j, with spin j equal to
+    # values[v] and the spin before the block equal to neighbors[a]
+    log_weights = couplings * neighbors[:, numpy.newaxis] * values - fields * values
+    table = numpy.zeros((len(couplings), 3, length, 3))
+    for j in range(length):
+        if j > 0:
+            log_weights = (
+                numpy.logaddexp(
+                    log_weights[:, :, :1] - couplings * values,
+                    log_weights[:, :, 1:] + couplings * values,
+                )
+                - fields * values
+            )
+        # the log odds of down over up, given the following spin
+        difference = (
+            log_weights[:, :, :1] - log_weights[:, :, 1:] - 2 * couplings * neighbors
+        )
+        table[:, :, j] = 1 / (1 + numpy.exp(numpy.minimum(difference, 700)))
+    return table
+
+
+def _draw_blocks(configs, starts, length, table, periodic, uniforms):
+    """
+    Draws the blocks of length spins that start at the sites starts from their conditional distribution
+    given their neighboring spins, in place, for every chain of configs, using the uniform number of every
+    site and the table of _conditional_table. Spin j is drawn after spin j + 1, from the end of the block.
+    """
+    n_chains, N = configs.shape
+    sites = (starts[:, numpy.newaxis] + numpy.arange(length)) % N
+
+    # the spins next to every block as indices of the table: 0 (spin -1), 1 (spin +1) or 2 (open end)
+    left = configs[:, (starts - 1) % N].astype(numpy.int64)
+    following = configs[:, (starts + length) % N].astype(numpy.int64)
+    if not periodic:
+        left = numpy.where(starts > 0, left, 2)
+        following = numpy.where(starts + length < N, following, 2)
+
+    rows = numpy.arange(n_chains)[:, numpy.newaxis]
+    block_uniforms = uniforms[:, sites]
+    for j in range(length - 1, -1, -1):
+        following = (block_uniforms[:, :, j] < table[rows, left, j, following]).astype(numpy.int64)
+        configs[:, sites[:, j]] = following
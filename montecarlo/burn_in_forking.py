@@ -0,0 +1,196 @@
+"""
+Independent chains at one temperature that share a single burn-in.
+
+Running R chains with montecarlo_metropolis pays the burn-in R times. Here one parent chain is equilibrated,
+a short pilot run of the parent measures its integrated autocorrelation time tau, and R copies of the
+parent are forked with independent random number streams. Every copy runs a few tau of sweeps that are
+discarded, after which the copies have forgotten their common start, and the copies are then sampled
+together as one batch. The burn-in is paid once, and every further chain only costs its decorrelation.
+"""
+import math
+
+import numpy
+from .backends import get_backend, bond_energy, BLOCK_UNIFORMS
+from .accumulators import BlockAccumulator, ThermalAccumulator
+from .random_streams import draw_uniforms, random_configuration, spawn_seeds
+from .montecarlo_metropolis import detect_equilibration
+
+__all__ = ["forked_chains"]
+
+# number of integrated autocorrelation times a forked chain runs before its values are kept
+_DECORRELATION_TAUS = 5
+
+# length of the first pilot run of the parent chain, in sweeps
+_MIN_PILOT_SWEEPS = 256
+
+
+def forked_chains(
+    N,
+    ham,
+    temp,
+    montecarlo_steps,
+    n_chains,
+    burn_steps="auto",
+    decorrelation_steps="auto",
+    backend=None,
+    equilibration="drift",
+    seed=None,
+    rule="metropolis",
+    full_output=False,
+):
+    """
+    Samples n_chains independent chains at one temperature after a single shared burn-in, and returns the
+    thermal quantities of all chains together, with errors from the spread between the chains.
+
+    Parameters
+    ----------
+    N : int
+        The number of sites in the spin system.
+    ham : Hamiltonian
+        The Hamiltonian used to describe the spin system.
+    temp : float
+        The temperature of the spin system.
+    montecarlo_steps : int
+        The number of sweeps of every chain whose values are kept.
+    n_chains : int
+        The number of forked chains.
+    burn_steps : int or str, default: "auto"
+        The number of sweeps of the parent chain before it is forked. If "auto", the parent runs until it
+        has equilibrated (see detect_equilibration), with at most montecarlo_steps sweeps.
+    decorrelation_steps : int or str, default: "auto"
+        The number of sweeps every forked chain runs before its values are kept. If "auto", it is
+        5 tau, where tau is the larger of the integrated autocorrelation times of the energy and the
+        magnetization measured in a pilot run of the parent.
+    backend : str, default: None
+        The name of the backend that performs the sweeps. If None, the default backend is used.
+    equilibration : str, default: "drift"
+        The test used when burn_steps is "auto", either "drift" or "hot_cold".
+    seed : int or numpy.random.SeedSequence, default: None
+        The root seed from which the random number generators of the parent and of every chain are
+        spawned. The ith chain does not depend on the number of chains. If None, a fresh seed is drawn.
+    rule : str, default: "metropolis"
+        The update rule of the sweeps, "metropolis", "heat_bath" or "block_gibbs".
+    full_output : bool, default: False
+        If True, a dictionary with additional information about the run is returned as a fifth value.
+
+    Returns
+    -------
+    avg_energy : float
+        The average energy over all kept sweeps of all chains.
+    avg_mag : float
+        The average magnetization over all kept sweeps of all chains.
+    heat_cap : float
+        The heat capacity from the energy variance of all kept sweeps.
+    mag_susceptibility : float
+        The magnetic susceptibility from the magnetization variance of all kept sweeps.
+    info : dict
+        Only returned if full_output is True. Contains the statistical errors of the four returned values
+        from the spread between the chains ("errors", which needs n_chains > 1), the four quantities of
+        every chain ("chains"), the burn-in of the parent ("burn_steps"), the number of sweeps of the pilot
+        run ("pilot_steps"), the integrated autocorrelation times measured in it ("tau_int"), the
+        decorrelation length used ("decorrelation_steps"), the number of kept sweeps of every chain
+        ("steps") and the final configurations of the chains ("final_configs").
+    """
+    kernels = get_backend(backend)
+    if seed is None:
+        seed = numpy.random.SeedSequence()
+    seeds = spawn_seeds(seed, n_chains + 1)
+    parent_rng = numpy.random.default_rng(seeds[0])
+    chain_rngs = [numpy.random.default_rng(child) for child in seeds[1:]]
+    block_size = max(1, BLOCK_UNIFORMS // N)
+
+    # equilibrates the parent chain
+    config = random_configuration(parent_rng, N)
+    if burn_steps == "auto":
+        burn_steps = detect_equilibration(
+            config,
+            ham,
+            temp,
+            max(montecarlo_steps, 16),
+            backend=kernels,
+            method=equilibration,
+            rng=parent_rng,
+            rule=rule,
+        )
+    else:
+        done = 0
+        while done < burn_steps:
+            n_sweeps = min(block_size, burn_steps - done)
+            kernels.run(config, ham, temp, draw_uniforms(parent_rng, n_sweeps, N), rule, done)
+            done += n_sweeps
+
+    # the pilot run is doubled until its blocks are long compared to the autocorrelation time
+    tau = {"energy": numpy.nan, "magnetization": numpy.nan}
+    pilot_steps = 0
+    if decorrelation_steps == "auto":
+        pilot = BlockAccumulator(["E", "M"], max_blocks=16)
+        n_sweeps = _MIN_PILOT_SWEEPS
+        while True:
+            bond_sums, mags = kernels.run(
+                config,
+                ham,
+                temp,
+                draw_uniforms(parent_rng, n_sweeps, N),
+                rule,
+                burn_steps + pilot_steps,
+            )
+            pilot.add_array(numpy.column_stack((bond_energy(ham, bond_sums, mags), mags)))
+            pilot_steps += n_sweeps
+            tau = {"energy": pilot.tau_int("E"), "magnetization": pilot.tau_int("M")}
+            longest = max(tau.values())
+            if pilot.block_size >= 4 * longest or pilot_steps >= max(montecarlo_steps, 1):
+                break
+            n_sweeps = pilot_steps
+        decorrelation_steps = max(1, int(math.ceil(_DECORRELATION_TAUS * longest)))
+
+    # forks the parent; every chain has its own random number stream, and the sweeps of the chains are
+    # counted on from those of the parent
+    parent_sweeps = burn_steps + pilot_steps + decorrelation_steps
+    configs = numpy.tile(config, (n_chains, 1))
+    temps = numpy.full(n_chains, temp)
+    values = [ThermalAccumulator() for r in range(n_chains)]
+    done = -decorrelation_steps
+    chain_block = max(1, block_size // n_chains)
+    while done < montecarlo_steps:
+        if done < 0:
+            n_sweeps = min(chain_block, -done)
+        else:
+            n_sweeps = min(chain_block, montecarlo_steps - done)
+        uniforms = numpy.stack([draw_uniforms(rng, n_sweeps, N) for rng in chain_rngs], axis=1)
+        bond_sums, mags = kernels.batch_run(
+            configs, ham, temps, uniforms, rule, parent_sweeps + done
+        )
+        if done >= 0:
+            energies = bond_energy(ham, bond_sums, mags)
+            for r in range(n_chains):
+                values[r].add_array(energies[:, r], mags[:, r])
+        done += n_sweeps
+
+    chain_quantities = numpy.array([v.thermal_quantities(temp) for v in values])
+    pooled = ThermalAccumulator()
+    for v in values:
+        pooled.merge(v)
+    avg_energy, avg_mag, heat_cap, mag_susceptibility = pooled.thermal_quantities(temp)
+
+    if full_output:
+        if n_chains > 1:
+            errors = numpy.std(chain_quantities, axis=0, ddof=1) / numpy.sqrt(n_chains)
+        else:
+            errors = numpy.full(4, numpy.nan)
+        info = {
+            "errors": {
+                "energy": float(errors[0]),
+                "magnetization": float(errors[1]),
+                "heat_capacity": float(errors[2]),
+                "mag_susceptibility": float(errors[3]),
+            },
+            "chains": chain_quantities.tolist(),
+            "burn_steps": burn_steps,
+            "pilot_steps": pilot_steps,
+            "tau_int": tau,
+            "decorrelation_steps": decorrelation_steps,
+            "steps": montecarlo_steps,
+            "final_configs": configs,
+        }
+        return avg_energy, avg_mag, heat_cap, mag_susceptibility, info
+    return avg_energy, avg_mag, heat_cap, mag_susceptibility
@@ -0,0 +1,69 @@
+"""
+Checkpoint files for long Monte Carlo runs.
+
+A checkpoint is a compressed numpy .npz archive of named arrays, so it holds no pickled objects and can
+be read without this package. Names may contain "/" to group the arrays of e.g. one temperature point.
+Checkpoints are written to a temporary file next to the target, which then replaces the target in a
+single step, so a run that is interrupted while writing always leaves the previous checkpoint intact.
+"""
+import os
+
+import numpy
+
+__all__ = ["save_checkpoint", "load_checkpoint"]
+
+
+def save_checkpoint(path, arrays):
+    """
+    Atomically writes a dictionary of arrays to a checkpoint file.
+
+    Parameters
+    ----------
+    path : str
+        The path of the checkpoint file.
+    arrays : dict
+        Maps names to arrays (or values that numpy can convert to arrays, e.g. ints and strings).
+    """
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "wb") as checkpoint_file:
+        numpy.savez_compressed(
+            checkpoint_file, **{name: numpy.asarray(value) for name, value in arrays.items()}
+        )
+        checkpoint_file.flush()
+        os.fsync(checkpoint_file.fileno())
+    os.replace(temporary_path, path)
+
+
+def load_checkpoint(path):
+    """
+    Reads a checkpoint file written by save_checkpoint.
+
+    Parameters
+    ----------
+    path : str
+        The path of the checkpoint file.
+
+    Returns
+    -------
+    arrays : dict
+        Maps the names to the arrays.
+    """
+    with numpy.load(path, allow_pickle=False) as data:
+        arrays = {name: data[name] for name in data.files}
+    return arrays
+
+
+def sub_dictionary(arrays, prefix):
+    """
+    Returns the entries of arrays whose names start with prefix + "/", with the prefix removed.
+    """
+    start = len(prefix) + 1
+    sub = {name[start:]: value for name, value in arrays.items() if name.startswith(prefix + "/")}
+    return sub
+
+
+def prefixed(arrays, prefix):
+    """
+    Returns a copy of arrays with prefix + "/" added to every name.
+    """
+    return {prefix + "/" + name: value for name, value in arrays.items()}
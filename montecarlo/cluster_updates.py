@@ -0,0 +1,267 @@
+"""
+Cluster updates (Swendsen-Wang and Wolff) for the Ising chain.
+
+Both algorithms use the Fortuin-Kasteleyn construction: every satisfied bond (J s_i s_j > 0) is activated
+with probability 1 - exp(-2|J|/T), and the clusters of sites joined by active bonds are flipped as a
+whole. The field is handled with a ghost spin that is coupled to every site with strength mu: a site whose
+spin lowers the field energy is attached to the ghost with probability 1 - exp(-2|mu|/T), and clusters
+attached to the ghost are not flipped. In one dimension the clusters are runs of consecutive sites, so all
+bonds are drawn at once and the clusters are labelled with a cumulative sum instead of being grown site by
+site.
+"""
+import numpy
+from .backends import compute_bond_sum, compute_magnetization, bond_energy, BLOCK_UNIFORMS
+from .accumulators import ThermalAccumulator, BlockAccumulator
+from .random_streams import draw_uniforms, random_configuration
+from .configurations import to_spin_configuration
+
+__all__ = ["swendsen_wang_update", "wolff_update", "cluster_montecarlo"]
+
+
+def swendsen_wang_update(config, ham, temp, uniforms=None, rng=None):
+    """
+    Performs one Swendsen-Wang update: all Fortuin-Kasteleyn clusters of the configuration are formed and
+    every cluster that is not attached to the ghost spin is flipped with probability 1/2.
+
+    Parameters
+    ----------
+    config : numpy.ndarray
+        The spin configuration (array of 0's and 1's). It is updated in place.
+    ham : Hamiltonian
+        The Hamiltonian used to describe the spin system.
+    temp : float
+        The temperature of the spin system.
+    uniforms : numpy.ndarray, default: None
+        3N uniform random numbers in [0, 1) used for the update. If None, they are drawn from rng.
+    rng : numpy.random.Generator, default: None
+        The random number generator used if uniforms is None. If None, the random module is used.
+
+    Returns
+    -------
+    improved_mag : float
+        The improved estimator of the magnetization, the summed magnetization of the clusters attached
+        to the ghost spin. Its average is the average magnetization.
+    improved_square_mag : float
+        The improved estimator of the squared magnetization, the squared magnetization of the ghost
+        clusters plus the squared sizes of all other clusters. Its average is the average of M^2.
+    """
+    N = len(config)
+    if uniforms is None:
+        uniforms = draw_uniforms(rng, 1, 3 * N)[0]
+    labels, ghost = _cluster_labels(config, ham, temp, uniforms[: 2 * N])
+    flips = (uniforms[2 * N : 2 * N + len(ghost)] < 0.5) & ~ghost
+    flipped = flips[labels]
+    config[flipped] = 1 - config[flipped]
+    return _improved_estimators(config, labels, ghost)
+
+
+def wolff_update(config, ham, temp, uniforms=None, rng=None):
+    """
+    Performs one Wolff update: the Fortuin-Kasteleyn cluster of a randomly chosen site is flipped. If that
+    cluster is attached to the ghost spin, flipping it together with the ghost is equivalent to flipping
+    every site that is not attached to the ghost, which is done instead.
+
+    Parameters
+    ----------
+    config : numpy.ndarray
+        The spin configuration (array of 0's and 1's). It is updated in place.
+    ham : Hamiltonian
+        The Hamiltonian used to describe the spin system.
+    temp : float
+        The temperature of the spin system.
+    uniforms : numpy.ndarray, default: None
+        2N + 1 uniform random numbers in [0, 1) used for the update. If None, they are drawn from rng.
+    rng : numpy.random.Generator, default: None
+        The random number generator used if uniforms is None. If None, the random module is used.
+
+    Returns
+    -------
+    cluster_size : int
+        The number of flipped sites.
+    improved_mag : float
+        The improved estimator of the magnetization (see swendsen_wang_update).
+    improved_square_mag : float
+        The improved estimator of the squared magnetization (see swendsen_wang_update).
+    """
+    N = len(config)
+    if uniforms is None:
+        uniforms = draw_uniforms(rng, 1, 2 * N + 1)[0]
+    labels, ghost = _cluster_labels(config, ham, temp, uniforms[: 2 * N])
+    seed_label = labels[min(int(uniforms[2 * N] * N), N - 1)]
+    if ghost[seed_label]:
+        flipped = ~ghost[labels]
+    else:
+        flipped = labels == seed_label
+    config[flipped] = 1 - config[flipped]
+    improved_mag, improved_square_mag = _improved_estimators(config, labels, ghost)
+    return int(numpy.count_nonzero(flipped)), improved_mag, improved_square_mag
+
+
+def _cluster_labels(config, ham, temp, uniforms):
+    """
+    Draws the Fortuin-Kasteleyn bonds of a configuration from 2N uniform random numbers (the first N for
+    the bonds between neighbors, the last N for the bonds to the ghost spin) and labels the clusters.
+    Returns the cluster label of every site and a boolean array that marks the clusters attached to the
+    ghost spin.
+    """
+    N = len(config)
+    spins = 2 * config.astype(numpy.int64) - 1
+    # bond i joins sites i and i + 1; the last one is the boundary bond
+    satisfied = ham.J * spins * numpy.roll(spins, -1) > 0
+    active = satisfied & (uniforms[:N] < -numpy.expm1(-2 * abs(ham.J) / temp))
+    if not ham.doPeriodicBoundaryConditions:
+        active[-1] = False
+
+    # a new cluster starts at every site that is not bonded to its left neighbor
+    starts = numpy.ones(N, dtype=bool)
+    starts[1:] = ~active[:-1]
+    labels = numpy.cumsum(starts) - 1
+    n_clusters = labels[-1] + 1
+    if active[-1] and n_clusters > 1:
+        # the boundary bond joins the last cluster to the first
+        labels[labels == n_clusters - 1] = 0
+        n_clusters -= 1
+
+    ghost = numpy.zeros(n_clusters, dtype=bool)
+    attached = (ham.mu * spins < 0) & (uniforms[N : 2 * N] < -numpy.expm1(-2 * abs(ham.mu) / temp))
+    ghost[labels[attached]] = True
+    return labels, ghost
+
+
+def _improved_estimators(config, labels, ghost):
+    """
+    Returns the improved estimators of M and M^2 for the clusters given by labels and ghost.
+    """
+    cluster_mags = numpy.bincount(labels, weights=2.0 * config - 1, minlength=len(ghost))
+    ghost_mag = numpy.sum(cluster_mags[ghost])
+    improved_mag = float(ghost_mag)
+    improved_square_mag = float(ghost_mag**2 + numpy.sum(cluster_mags[~ghost] ** 2))
+    return improved_mag, improved_square_mag
+
+
+def cluster_montecarlo(
+    N,
+    ham,
+    temp,
+    montecarlo_steps,
+    burn_steps=0,
+    algorithm="swendsen_wang",
+    rng=None,
+    initial_spins=None,
+    full_output=False,
+):
+    """
+    Performs cluster Monte Carlo sampling to determine thermal quantities at the specified temperature for
+    an N-spin system described by a particular Hamiltonian. Far below the coupling scale, where single
+    spin flips are almost always rejected, cluster updates decorrelate the chain in a few steps.
+
+    The average magnetization and the magnetic susceptibility are computed from the improved (cluster)
+    estimators, which average over the flips of all clusters that are not attached to the ghost spin and
+    have a much smaller variance than the measured magnetization.
+
+    With an antiferromagnetic coupling (J < 0) and a field, the favored spins of both sublattices are
+    tied to the ghost at low temperature, so almost every site belongs to a frozen ghost cluster and the
+    updates barely move; montecarlo_metropolis or parallel_tempering are better suited to that case.
+
+    Parameters
+    ----------
+    N : int
+        The number of sites in the spin system.
+    ham : Hamiltonian
+        The Hamiltonian used to describe the spin system.
+    temp : float
+        The temperature of the spin system.
+    montecarlo_steps : int
+        The number of cluster updates whose values are kept.
+    burn_steps : int, default: 0
+        The number of cluster updates performed before values are kept.
+    algorithm : str, default: "swendsen_wang"
+        The cluster update, either "swendsen_wang" or "wolff". A Wolff update flips a single cluster, so
+        one update costs about as much as a Swendsen-Wang update but changes fewer spins.
+    rng : numpy.random.Generator, default: None
+        The random number generator of this run. If None, the random module is used.
+    initial_spins : SpinConfiguration, default: None
+        The configuration the chain starts from. If None, a random configuration with N sites is used.
+    full_output : bool, default: False
+        If True, a dictionary with additional information about the run is returned as a fifth value.
+
+    Returns
+    -------
+    avg_energy : float
+        The average of the energy values produced by the kept updates.
+    avg_mag : float
+        The average magnetization, from the improved estimator.
+    heat_cap : float
+        The heat capacity derived from the energy values.
+    mag_susceptibility : float
+        The magnetic susceptibility, from the improved estimators.
+    info : dict
+        Only returned if full_output is True. Contains the entries described in ThermalAccumulator.info
+        for the measured energies and magnetizations, "improved_errors" with the errors of the improved
+        magnetization and susceptibility, "improved_tau_int" with the integrated autocorrelation time of
+        the improved M^2 estimator in updates, "mean_cluster_size" with the average number of sites
+        flipped per update (Wolff only), and the final configuration ("final_spins").
+    """
+    if algorithm == "swendsen_wang":
+        n_uniforms = 3 * N
+    elif algorithm == "wolff":
+        n_uniforms = 2 * N + 1
+    else:
+        raise ValueError("Unknown algorithm. Choose 'swendsen_wang' or 'wolff'.")
+
+    if initial_spins is None:
+        config = random_configuration(rng, N)
+    else:
+        config = numpy.array(initial_spins.get_spins(), dtype=numpy.int8)
+
+    values = ThermalAccumulator()
+    improved = BlockAccumulator(["M", "M2"])
+    flipped_sites = 0
+
+    block_size = max(1, BLOCK_UNIFORMS // n_uniforms)
+    total_steps = burn_steps + montecarlo_steps
+    done = 0
+    while done < total_steps:
+        n_updates = min(block_size, total_steps - done)
+        if done < burn_steps:
+            n_updates = min(n_updates, burn_steps - done)
+        uniforms = draw_uniforms(rng, n_updates, n_uniforms)
+        bond_sums = numpy.zeros(n_updates, dtype=numpy.int64)
+        mags = numpy.zeros(n_updates, dtype=numpy.int64)
+        estimators = numpy.zeros((n_updates, 2))
+        for k in range(n_updates):
+            if algorithm == "wolff":
+                size, estimators[k, 0], estimators[k, 1] = wolff_update(
+                    config, ham, temp, uniforms[k]
+                )
+            else:
+                estimators[k] = swendsen_wang_update(config, ham, temp, uniforms[k])
+                size = 0
+            if done + k >= burn_steps:
+                flipped_sites += size
+            bond_sums[k] = compute_bond_sum(config, ham.doPeriodicBoundaryConditions)
+            mags[k] = compute_magnetization(config)
+        if done >= burn_steps:
+            values.add_array(bond_energy(ham, bond_sums, mags), mags)
+            improved.add_array(estimators)
+        done += n_updates
+
+    avg_energy, avg_mag, heat_cap, mag_susceptibility = values.thermal_quantities(temp)
+    avg_mag = improved.mean("M")
+    mag_susceptibility = (improved.mean("M2") - avg_mag**2) / temp
+
+    if full_output:
+        info = values.info(temp)
+        info["improved_errors"] = {
+            "magnetization": improved.error("M"),
+            "mag_susceptibility": improved.jackknife_error(
+                lambda m: (m["M2"] - m["M"] ** 2) / temp
+            ),
+        }
+        info["improved_tau_int"] = improved.tau_int("M2")
+        if algorithm == "wolff":
+            info["mean_cluster_size"] = flipped_sites / max(montecarlo_steps, 1)
+        info["final_spins"] = to_spin_configuration(config)
+        return avg_energy, avg_mag, heat_cap, mag_susceptibility, info
+    return avg_energy, avg_mag, heat_cap, mag_susceptibility
+
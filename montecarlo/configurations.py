@@ -0,0 +1,60 @@
+"""
+Conversions between the representations of a spin configuration.
+
+The samplers store a configuration as a numpy array of 0's and 1's, which their kernels sweep in place,
+and return SpinConfiguration objects to the user. The functions here convert between the two and build
+the ordered configurations that some samplers start from.
+"""
+import numpy
+from .SpinConfiguration import SpinConfiguration
+from .backends import get_backend, bond_energy
+
+__all__ = ["to_spin_configuration", "ordered_configuration"]
+
+
+def to_spin_configuration(config):
+    """
+    Converts a configuration stored as an array of 0's and 1's into a SpinConfiguration object.
+
+    Parameters
+    ----------
+    config : numpy.ndarray
+        The configuration, one 0 or 1 per site.
+
+    Returns
+    -------
+    spins : SpinConfiguration
+        The spin configuration with the same spins.
+    """
+    spins = SpinConfiguration()
+    spins.initialize([int(s) for s in config])
+    return spins
+
+
+def ordered_configuration(N, ham):
+    """
+    Returns the configuration with the lowest energy among the all-up, all-down and the two alternating
+    configurations of N sites.
+
+    Parameters
+    ----------
+    N : int
+        The number of sites in the spin system.
+    ham : Hamiltonian
+        The Hamiltonian whose energy selects the configuration.
+
+    Returns
+    -------
+    config : numpy.ndarray
+        The ordered configuration, as an array of 0's and 1's.
+    """
+    candidates = [
+        numpy.zeros(N, dtype=numpy.int8),
+        numpy.ones(N, dtype=numpy.int8),
+        numpy.arange(N, dtype=numpy.int8) % 2,
+        1 - numpy.arange(N, dtype=numpy.int8) % 2,
+    ]
+    kernels = get_backend("numpy")
+    energies = [bond_energy(ham, *kernels.energy(c, ham)) for c in candidates]
+    ordered = candidates[int(numpy.argmin(energies))]
+    return ordered
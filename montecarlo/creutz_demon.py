@@ -0,0 +1,280 @@
+"""
+Microcanonical sampling of the Ising chain with Creutz demons.
+
+A demon is an extra degree of freedom that carries a non-negative energy. A spin flip is accepted if the
+demon can pay for it, i.e. if its energy stays non-negative after taking up -dE, and the demon receives the
+energy released by flips that lower the energy. The total energy of the chain and its demons is conserved,
+no exponentials are evaluated and the sites are visited in a fixed pattern, so an update costs a comparison
+and a few integer operations. The demon energies are Boltzmann distributed at the temperature that belongs
+to the energy of the chain, which is how the temperature is measured: it is the maximum-likelihood
+temperature of exp(-x / T) over the demon energies x that were visited.
+
+A flip changes the bond sum by 0 or +-4 and the magnetization by +-2, so every demon keeps its energy as an
+initial value plus integer amounts of bond sum and magnetization; the energies are rebuilt from these
+integers and never drift. Every chain has n_demons demons, each responsible for a contiguous segment of at
+least two sites. The ith sites of all segments are never neighbors, so they are updated together, and so
+are all chains of a batch.
+"""
+import numpy
+from .backends import get_backend, bond_energy, neighbor_sums
+from .accumulators import BlockAccumulator
+from .random_streams import draw_uniforms
+from .configurations import ordered_configuration
+
+__all__ = ["creutz_demon"]
+
+# number of kept sweeps collected before they are added to the accumulator and the demon histogram
+_FLUSH_SWEEPS = 256
+
+
+def creutz_demon(
+    N,
+    ham,
+    energy,
+    montecarlo_steps,
+    burn_steps=0,
+    n_chains=1,
+    n_demons=1,
+    rng=None,
+    full_output=False,
+):
+    """
+    Performs microcanonical (Creutz demon) sampling of an N-spin system at a fixed total energy. Every chain
+    starts from the ordered configuration with the lowest energy, and the rest of the energy is given to its
+    first demon. The temperature is inferred from the distribution of the energies of the other demons,
+    which start empty, or of the single demon if n_demons is 1.
+
+    The only random numbers are one shift of the starting site per chain and sweep, which makes the chains
+    of a batch independent; the even and then the odd sites of every segment are then visited in order.
+
+    Parameters
+    ----------
+    N : int
+        The number of sites in the spin system.
+    ham : Hamiltonian
+        The Hamiltonian used to describe the spin system.
+    energy : float
+        The total energy of every chain and its demons. It must not be lower than the energy of the
+        ordered configuration.
+    montecarlo_steps : int
+        The number of sweeps whose values are kept.
+    burn_steps : int, default: 0
+        The number of sweeps performed before values are kept, during which the demons hand their initial
+        energy to the chain.
+    n_chains : int, default: 1
+        The number of independent chains updated together.
+    n_demons : int, default: 1
+        The number of demons of every chain, at most N // 2. More demons let the energy of the chain
+        fluctuate more, bringing it closer to the canonical ensemble, and update more sites at once.
+    rng : numpy.random.Generator or CounterRNG, default: None
+        The random number generator of the starting-site shifts. If None, the random module is used.
+    full_output : bool, default: False
+        If True, a dictionary with additional information about the run is returned as a fourth value.
+
+    Returns
+    -------
+    temperature : float
+        The temperature inferred from the demon energies of all chains.
+    avg_energy : float
+        The average energy of the chains.
+    avg_mag : float
+        The average magnetization of the chains.
+    info : dict
+        Only returned if full_output is True. Contains the statistical errors of the three returned values
+        ("errors"; the error of the temperature is the spread between chains and needs n_chains > 1), the
+        magnetic susceptibility from the magnetization fluctuations at the inferred temperature
+        ("mag_susceptibility"), the mean energy per demon ("demon_energy"), the fraction of accepted flips
+        ("acceptance"), the number of kept sweeps ("steps") and the final configurations of the chains
+        ("final_configs").
+    """
+    if n_demons < 1 or n_demons > N // 2:
+        raise ValueError("n_demons must be between 1 and N // 2.")
+    periodic = ham.doPeriodicBoundaryConditions
+    kernels = get_backend("numpy")
+
+    ordered = ordered_configuration(N, ham)
+    ordered_bond_sum, ordered_mag = kernels.energy(ordered, ham)
+    ordered_energy = bond_energy(ham, ordered_bond_sum, ordered_mag)
+    if energy < ordered_energy - 1e-9:
+        raise ValueError(
+            "The energy is below the energy of the ordered configuration, "
+            + str(ordered_energy)
+            + "."
+        )
+    configs = numpy.tile(ordered, (n_chains, 1))
+    bond_sums = numpy.full(n_chains, ordered_bond_sum, dtype=numpy.int64)
+    mags = numpy.full(n_chains, ordered_mag, dtype=numpy.int64)
+
+    # every demon holds its initial energy plus the bond sum and magnetization it has taken up; the first
+    # demon of every chain starts with all the energy, which spreads along the chain during the burn-in
+    # (split evenly, every share could be smaller than the cheapest flip)
+    base_energy = numpy.zeros(n_demons)
+    base_energy[0] = max(energy - ordered_energy, 0.0)
+    demon_bonds = numpy.zeros((n_chains, n_demons), dtype=numpy.int64)
+    demon_mags = numpy.zeros((n_chains, n_demons), dtype=numpy.int64)
+
+    starts = numpy.arange(n_demons) * N // n_demons
+    lengths = numpy.diff(numpy.append(starts, N))
+    rows = numpy.arange(n_chains)[:, numpy.newaxis]
+    # the even sites of every segment are visited before the odd ones; in plain order a domain wall that
+    # costs no energy to move would be dragged through the whole segment in one sweep
+    offsets = numpy.concatenate(
+        [numpy.arange(0, lengths.max(), 2), numpy.arange(1, lengths.max(), 2)]
+    )
+    tolerance = 1e-9 * (abs(ham.J) + abs(ham.mu) + base_energy[0])
+
+    values = BlockAccumulator(["E", "M", "M2"])
+    pending = []  # chain averages of kept sweeps not yet added to values
+    demon_states = []  # demon states of kept sweeps not yet added to demon_counts
+    # (bond sum, magnetization) -> number of occurrences, for the first and the other demons of every chain
+    demon_counts = [[{}, {}] for r in range(n_chains)]
+    accepted = 0
+
+    for sweep in range(burn_steps + montecarlo_steps):
+        shifts = numpy.minimum(
+            (draw_uniforms(rng, 1, n_chains)[0] * N).astype(numpy.int64), N - 1
+        )[:, numpy.newaxis]
+        for k in offsets:
+            active = lengths > k
+            sites = (starts[active] + k + shifts) % N
+            h = neighbor_sums(configs, rows, sites, periodic)
+            new_spin = 1 - 2 * configs[rows, sites].astype(numpy.int64)
+            delta_bond = 2 * new_spin * h
+            delta_mag = 2 * new_spin
+            delta_energy = -ham.J * delta_bond + ham.mu * delta_mag
+
+            demon_energy = (
+                base_energy[active]
+                - ham.J * demon_bonds[:, active]
+                + ham.mu * demon_mags[:, active]
+            )
+            flip = demon_energy - delta_energy >= -tolerance
+            flip_rows, flip_columns = numpy.nonzero(flip)
+            configs[flip_rows, sites[flip_rows, flip_columns]] ^= 1
+            bond_sums += numpy.sum(numpy.where(flip, delta_bond, 0), axis=1)
+            mags += numpy.sum(numpy.where(flip, delta_mag, 0), axis=1)
+            demon_bonds[:, active] -= numpy.where(flip, delta_bond, 0)
+            demon_mags[:, active] -= numpy.where(flip, delta_mag, 0)
+            if sweep >= burn_steps:
+                accepted += len(flip_rows)
+
+        if sweep >= burn_steps:
+            energies = bond_energy(ham, bond_sums, mags)
+            pending.append([numpy.mean(energies), numpy.mean(mags), numpy.mean(mags**2.0)])
+            demon_states.append(numpy.stack([demon_bonds, demon_mags], axis=-1))
+            if len(pending) >= _FLUSH_SWEEPS or sweep == burn_steps + montecarlo_steps - 1:
+                values.add_array(numpy.array(pending))
+                _count_demon_states(demon_states, demon_counts)
+                pending = []
+                demon_states = []
+
+    # the demon energies of every chain with the number of times each occurred; the first demon starts
+    # with all the energy and has a support of its own, so it is only used if there are no other demons
+    group = 1 if n_demons > 1 else 0
+    chain_energies = [
+        _demon_energies(demon_counts[r][group], base_energy[group], ham) for r in range(n_chains)
+    ]
+    temperature = _demon_temperature(chain_energies)
+    avg_energy = values.mean("E")
+    avg_mag = values.mean("M")
+
+    if full_output:
+        if n_chains > 1:
+            chain_temperatures = [_demon_temperature([chain]) for chain in chain_energies]
+            temperature_error = float(numpy.std(chain_temperatures, ddof=1) / numpy.sqrt(n_chains))
+        else:
+            temperature_error = numpy.nan
+        all_energies = [
+            _demon_energies(demon_counts[r][g], base_energy[g], ham)
+            for r in range(n_chains)
+            for g in range(2)
+            if demon_counts[r][g]
+        ]
+        demon_energy = sum(numpy.sum(e * n) for e, n in all_energies) / sum(
+            numpy.sum(n) for e, n in all_energies
+        )
+        info = {
+            "errors": {
+                "temperature": temperature_error,
+                "energy": values.error("E"),
+                "magnetization": values.error("M"),
+            },
+            "mag_susceptibility": (values.mean("M2") - avg_mag**2) / temperature
+            if temperature > 0
+            else numpy.nan,
+            "demon_energy": float(demon_energy),
+            "acceptance": accepted / max(montecarlo_steps * n_chains * N, 1),
+            "steps": montecarlo_steps,
+            "final_configs": configs,
+        }
+        return temperature, avg_energy, avg_mag, info
+    return temperature, avg_energy, avg_mag
+
+
+def _count_demon_states(demon_states, demon_counts):
+    """
+    Adds the demon states (bond sum and magnetization taken up) of a list of sweeps, arrays of shape
+    (chains, demons, 2), to the counts of the first and the other demons of every chain.
+    """
+    states = numpy.stack(demon_states, axis=1)  # chains, sweeps, demons, 2
+    for r in range(len(demon_counts)):
+        for group, group_states in enumerate([states[r, :, :1], states[r, :, 1:]]):
+            if group_states.size == 0:
+                continue
+            pairs, counts = numpy.unique(group_states.reshape(-1, 2), axis=0, return_counts=True)
+            for pair, count in zip(map(tuple, pairs.tolist()), counts.tolist()):
+                demon_counts[r][group][pair] = demon_counts[r][group].get(pair, 0) + count
+
+
+def _demon_energies(counts, base_energy, ham):
+    """
+    Returns the distinct demon energies of a dictionary of (bond sum, magnetization) taken up -> number of
+    occurrences, and the number of occurrences of every energy.
+    """
+    states = numpy.array(list(counts.keys()), dtype=float).reshape(-1, 2)
+    occurrences = numpy.array(list(counts.values()), dtype=float)
+    energies = base_energy - ham.J * states[:, 0] + ham.mu * states[:, 1]
+    # states with the same energy up to rounding are the same energy level
+    scale = max(abs(ham.J), abs(ham.mu), 1.0) * 1e-9
+    levels, index = numpy.unique(numpy.round(energies / scale), return_inverse=True)
+    return levels * scale, numpy.bincount(index, weights=occurrences)
+
+
+def _demon_temperature(groups):
+    """
+    Returns the maximum-likelihood temperature of the demon energies. A demon has the energy x with the
+    probability exp(-x / T) / Z over the energies its group of demons visited; groups holds the observed
+    energies and their numbers of occurrences for every group, e.g. the demons of one chain.
+    """
+    groups = [(e, n) for e, n in groups if len(e) > 0]
+    observed = sum(numpy.sum(e * n) for e, n in groups)
+    if all(len(e) == 1 for e, n in groups):
+        return 0.0  # the demons never left their lowest level
+
+    def log_likelihood(beta):
+        total = -beta * observed
+        for e, n in groups:
+            exponents = -beta * e
+            largest = numpy.max(exponents)
+            total -= numpy.sum(n) * (largest + numpy.log(numpy.sum(numpy.exp(exponents - largest))))
+        return total
+
+    # Newton's method on the concave log likelihood of beta = 1 / T, halving steps that do not increase it
+    beta = 0.0
+    for iteration in range(100):
+        gradient = -observed
+        curvature = 0.0
+        for e, n in groups:
+            weights = numpy.exp(-beta * e - numpy.max(-beta * e))
+            weights /= numpy.sum(weights)
+            mean = weights @ e
+            gradient += numpy.sum(n) * mean
+            curvature -= numpy.sum(n) * (weights @ (e - mean) ** 2)
+        step = -gradient / curvature
+        current = log_likelihood(beta)
+        while log_likelihood(beta + step) < current and abs(step) > 1e-14 * max(abs(beta), 1):
+            step /= 2
+        beta += step
+        if abs(step) < 1e-12 * max(abs(beta), 1):
+            break
+    return float(1 / beta) if beta > 0 else numpy.inf
@@ -0,0 +1,188 @@
+"""
+Densities of states over the bond sum and magnetization of the Ising chain.
+
+The energy of a configuration, -J * bond_sum + mu * M, only depends on the integer bond sum and
+magnetization, so the number of configurations g(bond_sum, M) in every (bond_sum, M) class determines the
+thermal quantities at every temperature and field. A DensityOfStates holds ln g for the visited classes
+and evaluates the canonical averages from it. This only holds for the uniform nearest-neighbour chain of
+Hamiltonian; the energy of a chain with disordered or longer-range couplings is not a function of the
+bond sum and M, and its density of states cannot be stored here.
+"""
+import numpy
+
+__all__ = ["DensityOfStates"]
+
+
+class DensityOfStates:
+    def __init__(self, N, bond_sums, magnetizations, ln_g):
+        """
+        Creates a DensityOfStates object from the logarithm of the number of configurations of each class.
+
+        Parameters
+        ----------
+        N : int
+            The number of sites in the spin system.
+        bond_sums : numpy.ndarray
+            The bond sum of every class.
+        magnetizations : numpy.ndarray
+            The magnetization of every class.
+        ln_g : numpy.ndarray
+            The logarithm of the (relative) number of configurations of every class. It is normalized so
+            that the total number of configurations is 2^N.
+        """
+        self.N = N
+        self.bond_sums = numpy.asarray(bond_sums, dtype=numpy.int64)
+        self.magnetizations = numpy.asarray(magnetizations, dtype=numpy.int64)
+        ln_g = numpy.asarray(ln_g, dtype=numpy.float64)
+        # fixes the free constant of ln g with the total number of configurations
+        self.ln_g = ln_g - log_sum_exp(ln_g) + N * numpy.log(2)
+
+    def __str__(self):
+        return "DensityOfStates: N = " + str(self.N) + ", " + str(len(self.ln_g)) + " classes"
+
+    def energies(self, ham):
+        """
+        Returns the energy of every class for the given Hamiltonian.
+        """
+        energies = -ham.J * self.bond_sums + ham.mu * self.magnetizations
+        return energies
+
+    def ln_g_energy(self, ham):
+        """
+        Sums the classes of equal energy for the given Hamiltonian, giving the density of states of the
+        energy alone.
+
+        Parameters
+        ----------
+        ham : Hamiltonian
+            The Hamiltonian that assigns the energies.
+
+        Returns
+        -------
+        energies : numpy.ndarray
+            The distinct energies, in increasing order.
+        ln_g : numpy.ndarray
+            The logarithm of the number of configurations with each energy.
+        """
+        energies = numpy.round(self.energies(ham), 10)
+        unique_energies, index = numpy.unique(energies, return_inverse=True)
+        ln_g = numpy.array(
+            [log_sum_exp(self.ln_g[index == k]) for k in range(len(unique_energies))]
+        )
+        return unique_energies, ln_g
+
+    def free_energy(self, ham, temp):
+        """
+        Returns the free energy -T ln Z at the given temperature.
+        """
+        return -temp * log_sum_exp(self.ln_g - self.energies(ham) / temp)
+
+    def probabilities(self, ham, temp):
+        """
+        Returns the canonical probability of every class at the given temperature.
+        """
+        log_weights = self.ln_g - self.energies(ham) / temp
+        weights = numpy.exp(log_weights - numpy.max(log_weights))
+        probabilities = weights / numpy.sum(weights)
+        return probabilities
+
+    def thermal_quantities(self, ham, temp):
+        """
+        Calculates the average energy, average magnetization, heat capacity and magnetic susceptibility.
+
+        Parameters
+        ----------
+        ham : Hamiltonian
+            The Hamiltonian of the system. J and mu can differ from the values the density of states was
+            sampled with, but the boundary conditions must be the same.
+        temp : float
+            The temperature of the system.
+
+        Returns
+        -------
+        avg_energy : float
+            The average energy.
+        avg_mag : float
+            The average magnetization.
+        heat_cap : float
+            The heat capacity.
+        mag_susceptibility : float
+            The magnetic susceptibility.
+        """
+        probabilities = self.probabilities(ham, temp)
+        energies = self.energies(ham)
+        avg_energy = float(numpy.sum(probabilities * energies))
+        avg_mag = float(numpy.sum(probabilities * self.magnetizations))
+        heat_cap = float(numpy.sum(probabilities * (energies - avg_energy) ** 2)) / temp**2
+        mag_susceptibility = (
+            float(numpy.sum(probabilities * (self.magnetizations - avg_mag) ** 2)) / temp
+        )
+        return avg_energy, avg_mag, heat_cap, mag_susceptibility
+
+    def generate_thermal_quantities(self, ham, start=0.1, end=10, step=0.1):
+        """
+        Produces lists of the average energy, average magnetization, heat capacity and magnetic
+        susceptibility values over a specified temperature range, like
+        Hamiltonian.generate_thermal_quantities.
+
+        Parameters
+        ----------
+        ham : Hamiltonian
+            The Hamiltonian of the system.
+        start : float, default: 0.1
+            The starting temperature value for the graph.
+        end : float, default: 10
+            The ending temperature value for the graph.
+        step : float, default: 0.1
+            The spacing between successive temperature values.
+
+        Returns
+        -------
+        temps_list : list
+            The list of temperatures generated from the start, end, and step values.
+        energies_list : list
+            The list of average energies for the temperatures considered.
+        magnetization_list : list
+            The list of average magnetization values for the temperatures considered.
+        heat_capacity_list : list
+            The list of heat capacity values for the temperatures considered.
+        mag_susceptibility_list : list
+            The list of magnetic susceptibility values for the temperatures considered.
+        """
+        temps_list = []
+        temp = start
+        while temp < end:
+            temps_list.append(temp)
+            temp += step
+
+        energies_list = []
+        magnetization_list = []
+        heat_capacity_list = []
+        mag_susceptibility_list = []
+        for temp in temps_list:
+            energy, mag, heat_cap, mag_susceptibility = self.thermal_quantities(ham, temp)
+            energies_list.append(energy)
+            magnetization_list.append(mag)
+            heat_capacity_list.append(heat_cap)
+            mag_susceptibility_list.append(mag_susceptibility)
+
+        return (
+            temps_list,
+            energies_list,
+            magnetization_list,
+            heat_capacity_list,
+            mag_susceptibility_list,
+        )
+
+
+def log_sum_exp(values, axis=None):
+    """
+    Returns ln(sum(exp(values))) without overflow, over all values or along the given axis.
+    """
+    values = numpy.asarray(values, dtype=numpy.float64)
+    if axis is None:
+        largest = numpy.max(values)
+        return float(largest + numpy.log(numpy.sum(numpy.exp(values - largest))))
+    largest = numpy.max(values, axis=axis, keepdims=True)
+    sums = numpy.sum(numpy.exp(values - largest), axis=axis, keepdims=True)
+    return numpy.squeeze(largest + numpy.log(sums), axis=axis)
@@ -0,0 +1,185 @@
+"""
+Sampling of the Ising chain at fixed magnetization with nonlocal Kawasaki spin exchanges.
+
+A move exchanges an up spin and a down spin that may sit anywhere in the chain, so the magnetization never
+changes. Exchanging only nearest neighbors conserves M locally as well and makes the domains diffuse, which
+relaxes very slowly; the nonlocal exchange moves an up spin across the chain in one step. The sites of the
+up and the down spins are kept in two index arrays, so a random pair is drawn in O(1) and an accepted
+exchange only swaps two entries. The energy change only depends on the neighbors of the two sites.
+"""
+import numpy
+
+from .backends import (
+    compute_bond_sum,
+    compute_magnetization,
+    bond_energy,
+    flip_deltas,
+    jit_kernel,
+    BLOCK_UNIFORMS,
+)
+from .accumulators import ThermalAccumulator
+from .reweighting import JointHistogram
+from .random_streams import draw_uniforms
+from .configurations import to_spin_configuration
+
+__all__ = ["montecarlo_kawasaki"]
+
+
+def montecarlo_kawasaki(
+    N,
+    ham,
+    temp,
+    magnetization,
+    montecarlo_steps,
+    burn_steps=0,
+    rng=None,
+    initial_spins=None,
+    rule="metropolis",
+    histogram=False,
+    full_output=False,
+):
+    """
+    Performs Monte Carlo sampling of an N-spin system at fixed magnetization, with exchanges of an up and
+    a down spin anywhere in the chain. One sweep is N proposed exchanges. The results are those of
+    montecarlo_metropolis restricted to the configurations with the given magnetization, so the magnetic
+    susceptibility is 0.
+
+    Parameters
+    ----------
+    N : int
+        The number of sites in the spin system.
+    ham : Hamiltonian
+        The Hamiltonian used to describe the spin system.
+    temp : float
+        The temperature of the spin system.
+    magnetization : int
+        The magnetization (number of up spins minus number of down spins) of the ensemble. It must lie
+        between -N and N and have the parity of N.
+    montecarlo_steps : int
+        The number of sweeps whose values are kept.
+    burn_steps : int, default: 0
+        The number of sweeps performed before values are kept.
+    rng : numpy.random.Generator or CounterRNG, default: None
+        The random number generator of this run. If None, the random module is used.
+    initial_spins : SpinConfiguration, default: None
+        The configuration the chain starts from, which must have the given magnetization. If None, the up
+        spins are placed at random.
+    rule : str, default: "metropolis"
+        The acceptance rule of the exchanges, "metropolis" or "heat_bath" (see
+        Hamiltonian.flip_acceptance, with deltaE the energy change of the exchange).
+    histogram : bool, default: False
+        If True, the joint histogram of the bond sum and magnetization of the kept sweeps is recorded and
+        returned in info.
+    full_output : bool, default: False
+        If True, a dictionary with additional information about the run is returned as a fifth value.
+
+    Returns
+    -------
+    avg_energy : float
+        The average of the energy values produced by the kept sweeps.
+    avg_mag : float
+        The magnetization, which is fixed.
+    heat_cap : float
+        The heat capacity at fixed magnetization derived from the kept sweeps.
+    mag_susceptibility : float
+        The magnetic susceptibility, 0 at fixed magnetization.
+    info : dict
+        Only returned if full_output is True. Contains the entries of the info dictionary of
+        montecarlo_metropolis, and the fraction of accepted exchanges ("acceptance").
+    """
+    if abs(magnetization) > N or (N + magnetization) % 2 != 0:
+        raise ValueError("The magnetization must lie between -N and N and have the parity of N.")
+    periodic = ham.doPeriodicBoundaryConditions
+    n_up = (N + magnetization) // 2
+
+    if initial_spins is None:
+        # the up spins sit at the n_up sites with the smallest random keys
+        config = numpy.zeros(N, dtype=numpy.int8)
+        config[numpy.argsort(draw_uniforms(rng, 1, N)[0])[:n_up]] = 1
+    else:
+        config = numpy.array(initial_spins.get_spins(), dtype=numpy.int8)
+        if len(config) != N or compute_magnetization(config) != magnetization:
+            raise ValueError("initial_spins must have N sites and the given magnetization.")
+
+    # the sites of the up and the down spins, in no particular order
+    ups = numpy.flatnonzero(config == 1).astype(numpy.int64)
+    downs = numpy.flatnonzero(config == 0).astype(numpy.int64)
+
+    # acceptance probability of every change of the bond sum by an exchange, from -8 to 8 in steps of 2
+    # (steps of 4 with periodic boundary conditions)
+    table = numpy.array(
+        [ham.flip_acceptance(-ham.J * delta_bond, temp, rule) for delta_bond in range(-8, 9, 2)]
+    )
+
+    values = ThermalAccumulator()
+    joint_histogram = JointHistogram(N) if histogram else None
+    bond_sum = compute_bond_sum(config, periodic)
+    block_size = max(1, BLOCK_UNIFORMS // (3 * N))
+    accepted = 0
+    done = 0
+    while done < burn_steps + montecarlo_steps:
+        if done < burn_steps:
+            n_sweeps = min(block_size, burn_steps - done)
+        else:
+            n_sweeps = min(block_size, burn_steps + montecarlo_steps - done)
+        uniforms = draw_uniforms(rng, n_sweeps, 3 * N)
+        bond_sums = numpy.zeros(n_sweeps, dtype=numpy.int64)
+        bond_sum, n_accepted = _exchange_kernel(
+            config, periodic, table, ups, downs, bond_sum, uniforms, bond_sums
+        )
+        if done >= burn_steps:
+            accepted += n_accepted
+            mags = numpy.full(n_sweeps, magnetization, dtype=numpy.int64)
+            values.add_array(bond_energy(ham, bond_sums, mags), mags)
+            if histogram:
+                joint_histogram.add_array(bond_sums, mags)
+        done += n_sweeps
+
+    avg_energy, avg_mag, heat_cap, mag_susceptibility = values.thermal_quantities(temp)
+
+    if full_output:
+        info = values.info(temp)
+        info["burn_steps"] = burn_steps
+        info["final_spins"] = to_spin_configuration(config)
+        info["acceptance"] = accepted / max(montecarlo_steps * N, 1)
+        if histogram:
+            info["histogram"] = joint_histogram
+        return avg_energy, avg_mag, heat_cap, mag_susceptibility, info
+    return avg_energy, avg_mag, heat_cap, mag_susceptibility
+
+
+@jit_kernel
+def _exchange_kernel(config, periodic, table, ups, downs, bond_sum, uniforms, bond_sums):
+    """
+    Performs one sweep of N proposed exchanges per row of uniforms (three numbers per exchange: the up
+    spin, the down spin and the acceptance), updating config, ups and downs in place. Writes the
+    bond sum after every sweep to bond_sums and returns the final bond sum and the number of accepted
+    exchanges. Compiled with numba if it is installed.
+    """
+    n = config.shape[0]
+    n_up = ups.shape[0]
+    n_down = downs.shape[0]
+    accepted = 0
+    for sweep in range(uniforms.shape[0]):
+        if n_up == 0 or n_down == 0:
+            bond_sums[sweep] = bond_sum
+            continue
+        for k in range(n):
+            a = min(int(uniforms[sweep, 3 * k] * n_up), n_up - 1)
+            b = min(int(uniforms[sweep, 3 * k + 1] * n_down), n_down - 1)
+            i = ups[a]
+            j = downs[b]
+            # the bond sum changes of turning i down, and then j up with i already down
+            delta_bond = flip_deltas(config, i, periodic)[0]
+            config[i] = 0
+            delta_bond += flip_deltas(config, j, periodic)[0]
+            if uniforms[sweep, 3 * k + 2] < table[(delta_bond + 8) // 2]:
+                config[j] = 1
+                ups[a] = j
+                downs[b] = i
+                bond_sum += delta_bond
+                accepted += 1
+            else:
+                config[i] = 1
+        bond_sums[sweep] = bond_sum
+    return bond_sum, accepted
@@ -1,8 +1,53 @@
+import concurrent.futures
+import json
+import os
+import time
+
+import numpy
 from .SpinConfiguration import *
 from .Hamiltonian import *
+from .backends import get_backend, bond_energy, BLOCK_UNIFORMS
+from .accumulators import ThermalAccumulator
+from .reweighting import JointHistogram
+from .random_streams import (
+    draw_uniforms,
+    random_configuration,
+    spawn_seeds,
+    CounterRNG,
+    rng_state,
+    restore_rng_state,
+)
+from .checkpoint import save_checkpoint, load_checkpoint, sub_dictionary, prefixed
+from .configurations import to_spin_configuration, ordered_configuration
+
+# names of the quantities returned by montecarlo_metropolis
+_QUANTITY_NAMES = ["energy", "magnetization", "heat_capacity", "mag_susceptibility"]
+
+# length of the first window of the equilibration test, in sweeps
+_MIN_BURN_WINDOW = 16
+
+# minimum time in seconds between two checkpoints written while a temperature point runs
+_CHECKPOINT_INTERVAL = 300
 
 
-def montecarlo_metropolis(N, ham, temp, montecarlo_steps, burn_steps=0):
+def montecarlo_metropolis(
+    N,
+    ham,
+    temp,
+    montecarlo_steps,
+    burn_steps=0,
+    check_interval=0,
+    backend=None,
+    target_error=None,
+    equilibration="drift",
+    rng=None,
+    initial_spins=None,
+    rule="metropolis",
+    checkpoint_callback=None,
+    resume_state=None,
+    histogram=False,
+    full_output=False,
+):
     """
     Performs metropolis sampling to determine thermal quantities at the specified temperature
     for an N-spin system described by a particular Hamiltonian.
@@ -17,8 +62,47 @@ def montecarlo_metropolis(N, ham, temp, montecarlo_steps, burn_steps=0):
         The temperature of the spin system.
     montecarlo_steps : int
         The number of times the metropolis sweep is performed and the resulting values are kept.
-    burn_steps : int, default: 0
-        The number of times the metropolis sweep is performed before values are kept.
+    burn_steps : int or str, default: 0
+        The number of times the metropolis sweep is performed before values are kept. If "auto", sweeps are
+        discarded only until the chain has equilibrated (see detect_equilibration), with at most
+        montecarlo_steps discarded sweeps.
+    check_interval : int, default: 0
+        If positive, the energy and magnetization tracked through the sweeps are compared against a full
+        recomputation every check_interval sweeps, and a RuntimeError is raised if they have drifted apart.
+        Intended for debugging; 0 disables the check.
+    backend : str, default: None
+        The name of the backend that performs the sweeps ("python", "numpy" or "numba", see the backends
+        module). If None, the default backend is used. All backends give identical results.
+    target_error : dict, default: None
+        Maps any of "energy", "magnetization", "heat_capacity" and "mag_susceptibility" to the requested
+        relative statistical error of that quantity. If given, sampling stops as soon as every listed
+        quantity reaches its target, and montecarlo_steps is the maximum number of kept sweeps.
+    equilibration : str, default: "drift"
+        The test used when burn_steps is "auto", either "drift" or "hot_cold" (see detect_equilibration).
+    rng : numpy.random.Generator or CounterRNG, default: None
+        The random number generator of this run. If None, the random module is used, so that
+        random.seed reproduces the results.
+    initial_spins : SpinConfiguration, default: None
+        The configuration the chain starts from, e.g. the final configuration of a run at a nearby
+        temperature. If None, a random configuration with N sites is used.
+    rule : str, default: "metropolis"
+        The update rule of the sweeps: the single-site rules "metropolis" or "heat_bath" (see
+        Hamiltonian.flip_acceptance), or "block_gibbs", which draws blocks of spins exactly from their
+        conditional distribution (see block_gibbs_run).
+    checkpoint_callback : callable, default: None
+        If given, it is called with the state of the run (a dictionary of arrays, see resume_state) after
+        every block of sweeps and once at the end, e.g. to write it to a checkpoint file with
+        save_checkpoint.
+    resume_state : dict, default: None
+        A state passed to checkpoint_callback by an earlier call with the same arguments. The run continues
+        from that state, including the state of rng, and gives bit-for-bit the same results as the
+        uninterrupted run.
+    histogram : bool, default: False
+        If True, the joint histogram of the bond sum and magnetization of the kept sweeps is recorded and
+        returned in info, so that the results can be reweighted to nearby temperatures and fields with
+        reweight.
+    full_output : bool, default: False
+        If True, a dictionary with additional information about the run is returned as a fifth value.
 
     Returns
     -------
@@ -30,48 +114,295 @@ def montecarlo_metropolis(N, ham, temp, montecarlo_steps, burn_steps=0):
         The heat capacity derived from the average values produced by the kept metropolis sweeps.
     mag_susceptibility : float
         The magnetic susceptibility derived from the average values produced by the kept metropolis sweeps.
+    info : dict
+        Only returned if full_output is True. Contains the MomentAccumulator objects summarizing the
+        kept values ("energy", "magnetization" and "abs_magnetization"), which can be merged with those of
+        other runs, the Binder cumulant of the magnetization ("binder_cumulant"), the statistical errors of
+        the four returned quantities ("errors"), the integrated autocorrelation times of the energy and
+        magnetization in sweeps ("tau_int"), the number of kept sweeps ("steps") and the number of discarded
+        sweeps ("burn_steps") and the final configuration of the chain ("final_spins"). If histogram is
+        True, it also contains the JointHistogram of the kept sweeps ("histogram").
     """
+    kernels = get_backend(backend)
+    if target_error is not None:
+        for name in target_error:
+            if name not in _QUANTITY_NAMES:
+                raise ValueError(
+                    "Unknown quantity "
+                    + repr(name)
+                    + " in target_error. Choose from: "
+                    + ", ".join(_QUANTITY_NAMES)
+                )
+
+    # constant-memory summaries of the kept values, including the block averages used for the error bars
+    # and autocorrelation times
+    values = ThermalAccumulator()
+    joint_histogram = JointHistogram(N) if histogram else None
+
     # Initialize spin configuration with N sites
-    spins = SpinConfiguration()
-    spins.randomize(N)
+    burn_done = 0  # number of discarded sweeps performed so far
+    done = 0  # number of kept sweeps performed so far
+    if resume_state is not None:
+        config = numpy.array(resume_state["config"], dtype=numpy.int8)
+        restore_rng_state(rng, str(resume_state["rng"]))
+        values.set_state(sub_dictionary(resume_state, "values"))
+        if histogram:
+            joint_histogram.set_state(sub_dictionary(resume_state, "histogram"))
+        burn_steps = int(resume_state["burn_steps"])
+        burn_done = int(resume_state["burn_done"])
+        done = int(resume_state["done"])
+    elif initial_spins is None:
+        config = random_configuration(rng, N)
+    else:
+        config = numpy.array(initial_spins.get_spins(), dtype=numpy.int8)
+
+    def report_state():
+        if checkpoint_callback is not None:
+            state = {
+                "config": config.copy(),
+                "rng": rng_state(rng),
+                "burn_steps": burn_steps,
+                "burn_done": burn_done,
+                "done": done,
+            }
+            state.update(prefixed(values.get_state(), "values"))
+            if histogram:
+                state.update(prefixed(joint_histogram.get_state(), "histogram"))
+            checkpoint_callback(state)
 
-    energies = []
-    magnetizations = []
-    energies_squared = []
-    magnetizations_squared = []
+    # number of sweeps handed to the backend at once; the energy and magnetization are tracked by the
+    # backend, so only the values after each sweep come back
+    block_size = max(1, BLOCK_UNIFORMS // N)
 
     # runs sweep without producing values
-    for i in range(burn_steps):
-        spins = ham.metropolis_sweep(spins, temp)
+    if burn_steps == "auto":
+        burn_steps = detect_equilibration(
+            config,
+            ham,
+            temp,
+            max(montecarlo_steps, _MIN_BURN_WINDOW),
+            backend=kernels,
+            method=equilibration,
+            rng=rng,
+            rule=rule,
+        )
+        burn_done = burn_steps
+        report_state()
+    else:
+        while burn_done < burn_steps:
+            n_sweeps = min(block_size, burn_steps - burn_done)
+            kernels.run(config, ham, temp, draw_uniforms(rng, n_sweeps, N), rule, burn_done)
+            burn_done += n_sweeps
+            report_state()
 
     # runs sweep and populates lists
-    for i in range(montecarlo_steps):
-        spins = ham.metropolis_sweep(spins, temp)
-        E_step = ham.compute_energy(spins)
-        M_step = spins.compute_magnetization()
+    while done < montecarlo_steps:
+        n_sweeps = min(block_size, montecarlo_steps - done)
+        if target_error is not None:
+            # checks the errors at least every 1/8 of the sweeps done so far to limit the overrun
+            n_sweeps = min(n_sweeps, max(16, done // 8))
+        bond_sums, mags = _run_checked(
+            kernels,
+            config,
+            ham,
+            temp,
+            draw_uniforms(rng, n_sweeps, N),
+            done,
+            check_interval,
+            rule,
+            burn_steps + done,
+        )
+        done += n_sweeps
 
-        energies.append(E_step)
-        magnetizations.append(M_step)
-        energies_squared.append(E_step**2)
-        magnetizations_squared.append(M_step**2)
+        values.add_array(bond_energy(ham, bond_sums, mags), mags)
+        if histogram:
+            joint_histogram.add_array(bond_sums, mags)
+
+        if target_error is not None and values.target_reached(temp, target_error):
+            break
+        if done < montecarlo_steps:
+            report_state()
+    report_state()  # the final state holds everything needed to rebuild the results
 
     # calculates quantities of interest
-    avg_energy = sum(energies) / (montecarlo_steps)
-    avg_mag = sum(magnetizations) / (montecarlo_steps)
-    avg_energies_squared = sum(energies_squared) / (montecarlo_steps)
-    avg_magnetizations_squared = sum(magnetizations_squared) / (montecarlo_steps)
+    avg_energy, avg_mag, heat_cap, mag_susceptibility = values.thermal_quantities(temp)
 
-    heat_cap = (avg_energies_squared - avg_energy**2) / (temp**2)
-    mag_susceptibility = (avg_magnetizations_squared - avg_mag**2) / temp
+    if full_output:
+        info = values.info(temp)
+        info["burn_steps"] = burn_steps
+        info["final_spins"] = to_spin_configuration(config)
+        if histogram:
+            info["histogram"] = joint_histogram
+        return avg_energy, avg_mag, heat_cap, mag_susceptibility, info
     return avg_energy, avg_mag, heat_cap, mag_susceptibility
 
 
+def detect_equilibration(
+    config, ham, temp, max_steps, backend=None, method="drift", rng=None, rule="metropolis"
+):
+    """
+    Runs metropolis sweeps on a configuration until it has equilibrated, and returns the number of sweeps
+    that were needed. The energy series is cut into consecutive windows whose mean energies are compared.
+    Each window is split into sub-blocks whose spread gives the error of the window mean, so autocorrelated
+    but stationary series are not mistaken for drifting ones. The test passes once the two means agree
+    within three combined errors; otherwise the next window is twice as long, so the number of discarded
+    sweeps is at most about twice the number actually needed.
+
+    Two tests are available. "drift" compares the last two windows of the chain (sequential drift test).
+    "hot_cold" additionally runs a second chain from the lowest-energy ordered configuration (all up, all
+    down or alternating) and compares the windows of both chains; this also catches chains that are stuck
+    in long-lived metastable states at low temperature, at twice the cost per sweep.
+
+    Parameters
+    ----------
+    config : numpy.ndarray
+        The spin configuration (array of 0's and 1's). It is updated in place.
+    ham : Hamiltonian
+        The Hamiltonian used to describe the spin system.
+    temp : float
+        The temperature of the spin system.
+    max_steps : int
+        The maximum number of sweeps to be performed.
+    backend : str, default: None
+        The backend that performs the sweeps. If None, the default backend is used.
+    method : str, default: "drift"
+        The test used, either "drift" or "hot_cold".
+    rng : numpy.random.Generator, default: None
+        The random number generator. If None, the random module is used.
+    rule : str, default: "metropolis"
+        The update rule of the sweeps, "metropolis", "heat_bath" or "block_gibbs".
+
+    Returns
+    -------
+    steps : int
+        The number of sweeps performed before the chain was found to be equilibrated (or max_steps).
+    """
+    if method not in ["drift", "hot_cold"]:
+        raise ValueError("Unknown equilibration method. Choose 'drift' or 'hot_cold'.")
+    kernels = get_backend(backend)
+    N = len(config)
+    if method == "hot_cold":
+        cold_config = ordered_configuration(N, ham)
+
+    window = _MIN_BURN_WINDOW
+    steps = 0
+    previous = None  # (mean, error) of the previous window of the chain
+    while steps < max_steps:
+        n_sweeps = min(window, max_steps - steps)
+        bond_sums, mags = kernels.run(
+            config, ham, temp, draw_uniforms(rng, n_sweeps, N), rule, steps
+        )
+        current = _window_statistics(bond_energy(ham, bond_sums, mags))
+        if method == "hot_cold":
+            bond_sums, mags = kernels.run(
+                cold_config, ham, temp, draw_uniforms(rng, n_sweeps, N), rule, steps
+            )
+            previous = _window_statistics(bond_energy(ham, bond_sums, mags))
+        steps += n_sweeps
+        if previous is not None:
+            difference = abs(current[0] - previous[0])
+            if difference <= 3 * numpy.sqrt(current[1] ** 2 + previous[1] ** 2):
+                break
+            window *= 2
+        previous = current
+    return steps
+
+
+def _window_statistics(energies, n_sub_blocks=8):
+    """
+    Returns the mean of a window of energies and its error, estimated from the spread of the means of
+    n_sub_blocks equal sub-blocks.
+    """
+    usable = len(energies) - len(energies) % n_sub_blocks
+    sub_means = numpy.mean(
+        numpy.asarray(energies[:usable]).reshape(n_sub_blocks, -1), axis=1
+    )
+    error = numpy.std(sub_means, ddof=1) / numpy.sqrt(n_sub_blocks)
+    return float(numpy.mean(energies)), float(error)
+
+
+def _run_checked(
+    kernels,
+    config,
+    ham,
+    temp,
+    uniforms,
+    done,
+    check_interval,
+    rule="metropolis",
+    first_sweep=0,
+):
+    """
+    Runs one block of sweeps with the backend, the first of which is sweep first_sweep of the chain. If
+    check_interval is positive, the block is split after every multiple of check_interval sweeps (counted
+    from the first kept sweep, done sweeps before this block) and the tracked values are compared against a
+    full recomputation there.
+    """
+    if check_interval <= 0:
+        return kernels.run(config, ham, temp, uniforms, rule, first_sweep)
+
+    bond_parts = []
+    mag_parts = []
+    start = 0
+    while start < len(uniforms):
+        stop = min(
+            len(uniforms), start + check_interval - (done + start) % check_interval
+        )
+        bond_sums, mags = kernels.run(
+            config, ham, temp, uniforms[start:stop], rule, first_sweep + start
+        )
+        bond_parts.append(bond_sums)
+        mag_parts.append(mags)
+        if (done + stop) % check_interval == 0:
+            spins = to_spin_configuration(config)
+            _check_tracked_values(
+                ham, spins, bond_energy(ham, bond_sums[-1], mags[-1]), mags[-1]
+            )
+        start = stop
+    return numpy.concatenate(bond_parts), numpy.concatenate(mag_parts)
+
+
+def _check_tracked_values(ham, spins, energy, magnetization):
+    """
+    Compares a tracked energy and magnetization against a full recomputation from the spin configuration.
+    Raises a RuntimeError if they do not agree.
+    """
+    exact_energy = ham.compute_energy(spins)
+    exact_magnetization = spins.compute_magnetization()
+    if not numpy.isclose(energy, exact_energy) or magnetization != exact_magnetization:
+        raise RuntimeError(
+            "Tracked values (E = "
+            + str(energy)
+            + ", M = "
+            + str(magnetization)
+            + ") have drifted from the recomputed values (E = "
+            + str(exact_energy)
+            + ", M = "
+            + str(exact_magnetization)
+            + ")."
+        )
+
+
 def generate_montecarlo_thermal_quantities(
-    N, ham, start=1, end=10, step=0.1, m_steps=1000, burn_steps=100
+    N,
+    ham,
+    start=1,
+    end=10,
+    step=0.1,
+    m_steps=1000,
+    burn_steps=100,
+    seed=None,
+    processes=None,
+    checkpoint=None,
+    full_output=False,
+    **options,
 ):
     """
     Uses metropolis sampling to generate lists of the average energy, average magnetization, heat
     capacity, and magnetic susceptibility values for an N-spin system over a specified range of temperatures.
+    Every temperature point is an independent run of montecarlo_metropolis from a random configuration;
+    annealed_thermal_quantities carries the configuration from point to point instead, and
+    parallel_tempering samples all temperatures together.
 
     Parameters
     ----------
@@ -87,8 +418,33 @@ def generate_montecarlo_thermal_quantities(
         The size of the gap between successive temperature values.
     m_steps : int, default: 1000
         The number of times the metropolis sweep is run and the results are kept.
-    burn_steps : int, default: 100
-        The number of times the metropolis sweep is run before the results are kept.
+    burn_steps : int or str, default: 100
+        The number of times the metropolis sweep is run before the results are kept. If "auto", every
+        temperature point detects its own equilibration (see montecarlo_metropolis).
+    seed : int, numpy.random.SeedSequence or CounterRNG, default: None
+        Root seed from which every temperature point derives its own independent random number generator
+        (see spawn_generators). The results then do not depend on the number of processes. If a CounterRNG
+        is given, the ith point uses CounterRNG(seed.seed, i), whose random numbers are a fixed function of
+        (seed, i, sweep, site), so any point can be rerun on its own with montecarlo_metropolis, also from
+        the middle of the chain (see CounterRNG.seek). If None and processes is not used, all points share
+        the random module instead.
+    processes : int, default: None
+        The number of worker processes the temperature points are distributed over, lowest temperatures
+        (the slowest to sample) first. If None or 1, the points are run one after another. If seed is None,
+        a fresh root seed is drawn.
+    checkpoint : str, default: None
+        Path of a checkpoint file (see save_checkpoint). If the file exists, the run resumes from it and
+        gives bit-for-bit the same results as an uninterrupted run; the other arguments must be the same
+        as in the interrupted call. The file holds the finished temperature points and, without processes,
+        the state of the running point (configuration, random number generator, accumulators and sweep
+        index), and is written whenever a point finishes and at most every 5 minutes while a point runs.
+    full_output : bool, default: False
+        If True, a list with the info dictionary of montecarlo_metropolis for every temperature is
+        returned as a sixth value.
+    **options
+        Further keyword arguments of montecarlo_metropolis used by every temperature point, e.g. rule,
+        equilibration, backend or histogram. With histogram=True, the histograms of all points can be
+        combined with wham_thermal_quantities.
 
     Returns
     -------
@@ -102,27 +458,215 @@ def generate_montecarlo_thermal_quantities(
         The generated list of heat capacity values.
     mag_susceptibility_list : list
         The generated list of magnetic susceptibility values.
+    info_list : list
+        Only returned if full_output is True. The info dictionaries of the temperature points; e.g.
+        info_list[i]["burn_steps"] is the burn-in chosen for temps_list[i].
 
     """
+    temps_list = _temperature_list(start, end, step)
+    pooled = processes is not None and processes > 1
+    checkpoint = _open_checkpoint(
+        checkpoint, "independent", N, ham, temps_list, m_steps, burn_steps, seed, options
+    )
+    tasks = _point_tasks(N, ham, temps_list, m_steps, burn_steps, seed, pooled, checkpoint, options)
+    if pooled:
+        results = _pooled_points(tasks, processes, checkpoint)
+    else:
+        results = _serial_points(tasks, checkpoint)
+    return _sweep_lists(temps_list, results, full_output)
 
-    temps_list = []
-    energies_list = []
-    magnetization_list = []
-    heat_capacity_list = []
-    mag_susceptibility_list = []
 
+def annealed_thermal_quantities(
+    N,
+    ham,
+    start=1,
+    end=10,
+    step=0.1,
+    m_steps=1000,
+    burn_steps=100,
+    cooling=True,
+    seed=None,
+    checkpoint=None,
+    full_output=False,
+    **options,
+):
+    """
+    Generates the same lists as generate_montecarlo_thermal_quantities, but walks the temperatures from
+    highest to lowest (cooling) or from lowest to highest (heating) and starts every point from the final
+    configuration of the previous one. Only the first point uses burn_steps in full; the others
+    re-equilibrate with detect_equilibration, discarding at most burn_steps (or m_steps if burn_steps is
+    "auto") sweeps.
+
+    Parameters
+    ----------
+    N : int
+        The number of spins in the system.
+    ham : Hamiltonian
+        The Hamiltonian used to characterize the system.
+    start : float, default: 1
+        The start of the temperature range.
+    end : float, default: 10
+        The end of the temperature range.
+    step : float, default: 0.1
+        The size of the gap between successive temperature values.
+    m_steps : int, default: 1000
+        The number of times the metropolis sweep is run and the results are kept.
+    burn_steps : int or str, default: 100
+        The number of sweeps discarded at the first point, and the largest number discarded at the others.
+    cooling : bool, default: True
+        If True, the temperatures are walked from highest to lowest, otherwise from lowest to highest.
+    seed : int, numpy.random.SeedSequence or CounterRNG, default: None
+        The root seed of the random number generators of the points (see
+        generate_montecarlo_thermal_quantities). If None, all points share the random module.
+    checkpoint : str, default: None
+        Path of a checkpoint file. The run resumes after the last temperature point that was finished when
+        the file was written.
+    full_output : bool, default: False
+        If True, a list with the info dictionary of montecarlo_metropolis for every temperature is
+        returned as a sixth value.
+    **options
+        Further keyword arguments of montecarlo_metropolis used by every temperature point, e.g. rule,
+        equilibration, backend or histogram.
+
+    Returns
+    -------
+    temps_list, energies_list, magnetization_list, heat_capacity_list, mag_susceptibility_list : list
+        The temperatures in increasing order and the thermal quantities at each of them.
+    info_list : list
+        Only returned if full_output is True. The info dictionaries of the temperature points.
+    """
+    temps_list = _temperature_list(start, end, step)
+    method = "cooling" if cooling else "heating"
+    checkpoint = _open_checkpoint(
+        checkpoint, method, N, ham, temps_list, m_steps, burn_steps, seed, options
+    )
+    tasks = _point_tasks(N, ham, temps_list, m_steps, burn_steps, seed, False, checkpoint, options)
+    results = _annealed_points(tasks, cooling, checkpoint)
+    return _sweep_lists(temps_list, results, full_output)
+
+
+def _temperature_list(start, end, step):
+    """
+    Returns the temperatures from start up to (but excluding) end in steps of step.
+    """
+    temps_list = []
     temp = start
     while temp < end:
         temps_list.append(temp)
         temp += step
+    return temps_list
+
+
+def _open_checkpoint(path, method, N, ham, temps_list, m_steps, burn_steps, seed, options):
+    """
+    Returns the _SweepCheckpoint of a temperature sweep, or None if path is None. The signature stored in
+    the file identifies the arguments of the run.
+    """
+    if path is None:
+        return None
+    signature = [N, ham.J, ham.mu, ham.doPeriodicBoundaryConditions, temps_list, m_steps]
+    signature += [burn_steps, method, options]
+    if isinstance(seed, CounterRNG):
+        signature.append(["counter", str(seed.seed.entropy)])
+    elif isinstance(seed, numpy.random.SeedSequence):
+        signature.append(str(seed.entropy))
+    else:
+        signature.append(None if seed is None else str(seed))
+    return _SweepCheckpoint(path, _CHECKPOINT_INTERVAL, json.dumps(signature, sort_keys=True, default=str))
 
-    for temp in temps_list:
-        a, b, c, d = montecarlo_metropolis(N, ham, temp, m_steps, burn_steps)
+
+def _point_tasks(N, ham, temps_list, m_steps, burn_steps, seed, pooled, checkpoint, options):
+    """
+    Returns the task of every temperature point, with the random number generator (or its seed) derived
+    from the root seed. Points run in worker processes need their own streams, so a root seed is drawn if
+    pooled is True and seed is None.
+    """
+    if pooled and seed is None:
+        seed = numpy.random.SeedSequence()
+        if checkpoint is not None:
+            # a resumed run has to use the root seed of the interrupted run
+            seed = checkpoint.root_seed(seed)
+    if isinstance(seed, CounterRNG):
+        seeds = [CounterRNG(seed.seed, i) for i in range(len(temps_list))]
+    elif seed is None:
+        seeds = [None] * len(temps_list)  # every point uses the random module
+    else:
+        seeds = spawn_seeds(seed, len(temps_list))
+    tasks = [
+        (N, ham, temp, m_steps, burn_steps, seed_i, options) for temp, seed_i in zip(temps_list, seeds)
+    ]
+    return tasks
+
+
+def _serial_points(tasks, checkpoint=None):
+    """
+    Runs the temperature points one after another in this process. If a _SweepCheckpoint is given,
+    finished points are taken from it, the running point resumes from its saved state, and the state of
+    the running point is written to it while it runs.
+    """
+    results = []
+    for i, task in enumerate(tasks):
+        if checkpoint is None:
+            results.append(_temperature_point(task))
+        elif checkpoint.finished(i):
+            results.append(checkpoint.result(i, task[2]))
+        else:
+            results.append(
+                _temperature_point(task, checkpoint.resume_state(i), checkpoint.progress(i))
+            )
+            checkpoint.finish(i)
+    return results
+
+
+def _pooled_points(tasks, processes, checkpoint=None):
+    """
+    Runs the temperature points in a pool of worker processes, lowest temperatures first. If a
+    _SweepCheckpoint is given, finished points are taken from it and every newly finished point is written
+    to it.
+    """
+    # low temperatures decorrelate most slowly, so they are submitted first
+    order = sorted(range(len(tasks)), key=lambda i: tasks[i][2])
+    results = [None] * len(tasks)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = {}
+        for i in order:
+            if checkpoint is not None and checkpoint.finished(i):
+                results[i] = checkpoint.result(i, tasks[i][2])
+            else:
+                futures[executor.submit(_temperature_point_with_state, tasks[i])] = i
+        for future in concurrent.futures.as_completed(futures):
+            i = futures[future]
+            results[i], state = future.result()
+            if checkpoint is not None:
+                checkpoint.finish(i, state)
+    return results
+
+
+def _sweep_lists(temps_list, results, full_output):
+    """
+    Splits the results of the temperature points into the lists returned by the temperature sweeps.
+    """
+    energies_list = []
+    magnetization_list = []
+    heat_capacity_list = []
+    mag_susceptibility_list = []
+    info_list = []
+    for a, b, c, d, info in results:
         energies_list.append(a)
         magnetization_list.append(b)
         heat_capacity_list.append(c)
         mag_susceptibility_list.append(d)
+        info_list.append(info)
 
+    if full_output:
+        return (
+            temps_list,
+            energies_list,
+            magnetization_list,
+            heat_capacity_list,
+            mag_susceptibility_list,
+            info_list,
+        )
     return (
         temps_list,
         energies_list,
@@ -130,3 +674,207 @@ def generate_montecarlo_thermal_quantities(
         heat_capacity_list,
         mag_susceptibility_list,
     )
+
+
+def _temperature_point(task, resume_state=None, checkpoint_callback=None):
+    """
+    Runs montecarlo_metropolis for one temperature point of generate_montecarlo_thermal_quantities. Defined
+    at module level so that it can be sent to worker processes.
+    """
+    N, ham, temp, m_steps, burn_steps, seed, options = task
+    result = montecarlo_metropolis(
+        N,
+        ham,
+        temp,
+        m_steps,
+        burn_steps,
+        rng=_point_rng(seed),
+        checkpoint_callback=checkpoint_callback,
+        resume_state=resume_state,
+        full_output=True,
+        **options,
+    )
+    return result
+
+
+def _temperature_point_with_state(task):
+    """
+    Runs _temperature_point in a worker process and returns its result together with the final state of
+    the run, which is written to the checkpoint.
+    """
+    states = []
+    result = _temperature_point(task, checkpoint_callback=states.append)
+    return result, states[-1]
+
+
+def _point_rng(seed):
+    """
+    Returns the random number generator of a temperature point from its entry in the task: None (the
+    random module), a CounterRNG, or a seed for a numpy.random.Generator.
+    """
+    if seed is None or isinstance(seed, CounterRNG):
+        return seed
+    rng = numpy.random.default_rng(seed)
+    return rng
+
+
+def _annealed_points(tasks, cooling, checkpoint=None):
+    """
+    Runs the temperature points of annealed_thermal_quantities one after another in order of
+    decreasing (cooling) or increasing temperature, starting every point from the final configuration of
+    the previous point. Returns the results in the order of tasks. If a _SweepCheckpoint is given, finished
+    points are taken from it and every newly finished point is written to it.
+    """
+    order = sorted(range(len(tasks)), key=lambda i: tasks[i][2], reverse=cooling)
+    results = [None] * len(tasks)
+    spins = None  # final configuration of the previous point
+    for i in order:
+        N, ham, temp, m_steps, burn_steps, seed, options = tasks[i]
+        if checkpoint is not None and checkpoint.finished(i):
+            results[i] = checkpoint.result(i, temp)
+            spins = results[i][4]["final_spins"]
+            continue
+        rng = _point_rng(seed)
+        states = []  # states of the run, the last one is written to the checkpoint
+        if spins is None:
+            result = montecarlo_metropolis(
+                N,
+                ham,
+                temp,
+                m_steps,
+                burn_steps,
+                rng=rng,
+                checkpoint_callback=states.append,
+                full_output=True,
+                **options,
+            )
+        else:
+            # short adaptive re-equilibration of the configuration carried over
+            config = numpy.array(spins.get_spins(), dtype=numpy.int8)
+            max_steps = m_steps if burn_steps == "auto" else burn_steps
+            point_burn_steps = detect_equilibration(
+                config,
+                ham,
+                temp,
+                max_steps,
+                backend=options.get("backend"),
+                method=options.get("equilibration", "drift"),
+                rng=rng,
+                rule=options.get("rule", "metropolis"),
+            )
+            result = montecarlo_metropolis(
+                N,
+                ham,
+                temp,
+                m_steps,
+                0,
+                rng=rng,
+                initial_spins=to_spin_configuration(config),
+                checkpoint_callback=states.append,
+                full_output=True,
+                **options,
+            )
+            result[4]["burn_steps"] = point_burn_steps
+            states[-1]["burn_steps"] = point_burn_steps
+        if checkpoint is not None:
+            checkpoint.finish(i, states[-1])
+        spins = result[4]["final_spins"]
+        results[i] = result
+    return results
+
+
+class _SweepCheckpoint:
+    def __init__(self, path, interval, signature):
+        """
+        Creates the checkpoint of a generate_montecarlo_thermal_quantities run, reading the file at path if
+        it exists. The arrays of finished point i are stored under "point<i>/", the state of the running
+        point under "current/", and signature identifies the arguments of the run.
+        """
+        self.path = path
+        self.interval = interval
+        self.last_save = time.time()
+        self.latest = None  # latest state of the running point
+        if os.path.exists(path):
+            self.arrays = load_checkpoint(path)
+            if str(self.arrays["signature"]) != signature:
+                raise ValueError(
+                    "The checkpoint " + path + " belongs to a run with different arguments."
+                )
+            # the points that share the random module continue from its saved state
+            restore_rng_state(None, str(self.arrays["random_state"]))
+        else:
+            self.arrays = {"signature": signature}
+
+    def root_seed(self, seed):
+        """
+        Returns the root seed of the run: the one stored in the checkpoint if there is one, otherwise seed,
+        which is then stored.
+        """
+        if "root_entropy" in self.arrays:
+            return numpy.random.SeedSequence(int(str(self.arrays["root_entropy"])))
+        self.arrays["root_entropy"] = str(seed.entropy)
+        return seed
+
+    def finished(self, i):
+        return "point" + str(i) + "/config" in self.arrays
+
+    def result(self, i, temp):
+        """
+        Rebuilds the result of montecarlo_metropolis for finished point i from its final state.
+        """
+        state = sub_dictionary(self.arrays, "point" + str(i))
+        values = ThermalAccumulator()
+        values.set_state(sub_dictionary(state, "values"))
+        info = values.info(temp)
+        info["burn_steps"] = int(state["burn_steps"])
+        info["final_spins"] = to_spin_configuration(state["config"])
+        if "histogram/keys" in state:
+            info["histogram"] = JointHistogram(int(state["histogram/N"]))
+            info["histogram"].set_state(sub_dictionary(state, "histogram"))
+        return values.thermal_quantities(temp) + (info,)
+
+    def resume_state(self, i):
+        """
+        Returns the saved state of point i if it was running when the checkpoint was written, else None.
+        """
+        if int(self.arrays.get("current_point", -1)) != i:
+            return None
+        return sub_dictionary(self.arrays, "current")
+
+    def progress(self, i):
+        """
+        Returns the checkpoint_callback for running point i, which keeps the latest state and writes it
+        once the interval of the checkpoint has passed since the last checkpoint.
+        """
+
+        def callback(state):
+            self.latest = state
+            if time.time() - self.last_save >= self.interval:
+                self._set_current(i, state)
+                self.save()
+
+        return callback
+
+    def finish(self, i, state=None):
+        """
+        Stores the final state of point i (by default the latest state passed to its progress callback)
+        and writes the checkpoint.
+        """
+        if state is None:
+            state = self.latest
+        self._set_current(-1, {})
+        self.arrays.update(prefixed(state, "point" + str(i)))
+        self.latest = None
+        self.save()
+
+    def save(self):
+        self.arrays["random_state"] = rng_state(None)
+        save_checkpoint(self.path, self.arrays)
+        self.last_save = time.time()
+
+    def _set_current(self, i, state):
+        for name in list(self.arrays):
+            if name.startswith("current/"):
+                del self.arrays[name]
+        self.arrays["current_point"] = i
+        self.arrays.update(prefixed(state, "current"))
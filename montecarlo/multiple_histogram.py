@@ -0,0 +1,267 @@
+"""
+Multiple-histogram (WHAM) combination of runs at several temperatures.
+
+Every run of a temperature sweep estimates the density of states over the classes it visited, well where
+it visits them often and badly in its tails. The weighted histogram analysis method of Ferrenberg and
+Swendsen combines all runs with the weights that minimize the variance of the combined estimate, which
+solves
+
+    g(k) = sum_i H_i(k) / sum_i n_i exp(f_i - E(k) / T_i),    exp(-f_i) = sum_k g(k) exp(-E(k) / T_i)
+
+self-consistently for the free energies f_i of the runs. The iteration is done in log space on the array of
+all (run, class) pairs at once.
+"""
+import random
+
+import numpy
+from .density_of_states import DensityOfStates, log_sum_exp
+
+__all__ = ["wham", "wham_thermal_quantities"]
+
+
+def wham(
+    histograms,
+    ham,
+    temps,
+    statistical_inefficiencies=None,
+    tolerance=1e-10,
+    max_iterations=100000,
+    full_output=False,
+):
+    """
+    Combines the joint histograms of runs at several temperatures into a single estimate of the density of
+    states with the multiple-histogram method (WHAM).
+
+    Parameters
+    ----------
+    histograms : list
+        The JointHistogram of every run, e.g. info_list[i]["histogram"] of
+        generate_montecarlo_thermal_quantities called with histogram=True.
+    ham : Hamiltonian
+        The Hamiltonian all runs were sampled with.
+    temps : list
+        The temperature of every run.
+    statistical_inefficiencies : list, default: None
+        The number of sweeps per independent sample of every run, e.g. twice the larger of the integrated
+        autocorrelation times info["tau_int"]["energy"] and info["tau_int"]["magnetization"]. Runs with
+        strongly correlated sweeps then get less weight. If None, all sweeps count as independent.
+    tolerance : float, default: 1e-10
+        The iteration stops when no free energy changes by more than tolerance.
+    max_iterations : int, default: 100000
+        The maximum number of iterations.
+    full_output : bool, default: False
+        If True, a dictionary with additional information is returned as a second value.
+
+    Returns
+    -------
+    dos : DensityOfStates
+        The combined density of states of the classes visited by any run.
+    info : dict
+        Only returned if full_output is True. Contains the free energy -T ln Z of every run
+        ("free_energies"), the number of iterations ("iterations") and whether the tolerance was reached
+        ("converged"). The free energies are absolute only if the runs visited every class, e.g. with one
+        run at a high temperature; otherwise only the differences of F / T between runs are meaningful.
+    """
+    bond_sums, magnetizations, counts, log_boltzmann = _wham_arrays(histograms, ham, temps)
+    inefficiencies = _inefficiencies(statistical_inefficiencies, len(histograms))
+    ln_g, f, iterations, converged = _solve_wham(
+        counts / inefficiencies[:, numpy.newaxis],
+        counts.sum(axis=1) / inefficiencies,
+        log_boltzmann,
+        numpy.zeros(len(histograms)),
+        tolerance,
+        max_iterations,
+    )
+    dos = DensityOfStates(histograms[0].N, bond_sums, magnetizations, ln_g)
+    if full_output:
+        info = {
+            "free_energies": [dos.free_energy(ham, temp) for temp in temps],
+            "iterations": iterations,
+            "converged": converged,
+        }
+        return dos, info
+    return dos
+
+
+def wham_thermal_quantities(
+    histograms,
+    ham,
+    temps,
+    new_temps,
+    new_ham=None,
+    statistical_inefficiencies=None,
+    n_bootstrap=50,
+    rng=None,
+    tolerance=1e-10,
+    max_iterations=100000,
+    full_output=False,
+):
+    """
+    Calculates the thermal quantities on any temperature grid from the joint histograms of runs at several
+    temperatures, combined with wham. The statistical errors are estimated with a bootstrap: every
+    histogram is resampled with as many independent samples as its run holds, the combination is repeated,
+    and the errors are the standard deviations of the results.
+
+    Parameters
+    ----------
+    histograms : list
+        The JointHistogram of every run.
+    ham : Hamiltonian
+        The Hamiltonian all runs were sampled with.
+    temps : list
+        The temperature of every run.
+    new_temps : list
+        The temperatures at which the thermal quantities are calculated. They should lie within the range
+        covered by the runs.
+    new_ham : Hamiltonian, default: None
+        The Hamiltonian at which the thermal quantities are calculated, e.g. with a slightly different mu.
+        It must have the same boundary conditions as ham. If None, ham is used.
+    statistical_inefficiencies : list, default: None
+        The number of sweeps per independent sample of every run (see wham).
+    n_bootstrap : int, default: 50
+        The number of bootstrap samples used for the errors. If 0, no errors are computed.
+    rng : numpy.random.Generator, default: None
+        The random number generator of the bootstrap. If None, it is seeded from the random module.
+    tolerance : float, default: 1e-10
+        The tolerance of the free energies (see wham).
+    max_iterations : int, default: 100000
+        The maximum number of iterations of every combination (see wham).
+    full_output : bool, default: False
+        If True, a dictionary with the errors and additional information is returned as a fifth value.
+
+    Returns
+    -------
+    energies_list : list
+        The average energy at every temperature of new_temps.
+    magnetization_list : list
+        The average magnetization at every temperature.
+    heat_capacity_list : list
+        The heat capacity at every temperature.
+    mag_susceptibility_list : list
+        The magnetic susceptibility at every temperature.
+    info : dict
+        Only returned if full_output is True. Contains the bootstrap errors of the four lists ("errors",
+        with the keys "energy", "magnetization", "heat_capacity" and "mag_susceptibility"), the combined
+        DensityOfStates ("dos") and the info dictionary of wham ("wham").
+    """
+    if new_ham is None:
+        new_ham = ham
+    dos, wham_info = wham(
+        histograms,
+        ham,
+        temps,
+        statistical_inefficiencies,
+        tolerance,
+        max_iterations,
+        full_output=True,
+    )
+    results = numpy.array([dos.thermal_quantities(new_ham, temp) for temp in new_temps])
+    energies_list = results[:, 0].tolist()
+    magnetization_list = results[:, 1].tolist()
+    heat_capacity_list = results[:, 2].tolist()
+    mag_susceptibility_list = results[:, 3].tolist()
+
+    if not full_output:
+        return energies_list, magnetization_list, heat_capacity_list, mag_susceptibility_list
+
+    errors = numpy.full(results.shape, numpy.nan)
+    if n_bootstrap > 0:
+        if rng is None:
+            rng = numpy.random.default_rng(random.getrandbits(64))
+        bond_sums, magnetizations, counts, log_boltzmann = _wham_arrays(histograms, ham, temps)
+        n_samples = counts.sum(axis=1)
+        inefficiencies = _inefficiencies(statistical_inefficiencies, len(histograms))
+        n_independent = numpy.maximum(numpy.round(n_samples / inefficiencies), 1).astype(int)
+        # starts every bootstrap combination from the free energies of the data, which are close
+        f = numpy.array(wham_info["free_energies"]) / numpy.asarray(temps, dtype=float)
+        f -= f[0]
+
+        samples = numpy.zeros((n_bootstrap,) + results.shape)
+        for b in range(n_bootstrap):
+            resampled = numpy.array(
+                [
+                    rng.multinomial(n_independent[i], counts[i] / n_samples[i])
+                    for i in range(len(histograms))
+                ],
+                dtype=float,
+            )
+            visited = resampled.sum(axis=0) > 0
+            ln_g = _solve_wham(
+                resampled[:, visited],
+                n_independent.astype(float),
+                log_boltzmann[:, visited],
+                f,
+                tolerance,
+                max_iterations,
+            )[0]
+            sample_dos = DensityOfStates(dos.N, bond_sums[visited], magnetizations[visited], ln_g)
+            samples[b] = [sample_dos.thermal_quantities(new_ham, temp) for temp in new_temps]
+        if n_bootstrap > 1:
+            errors = numpy.std(samples, axis=0, ddof=1)
+
+    info = {
+        "errors": {
+            "energy": errors[:, 0].tolist(),
+            "magnetization": errors[:, 1].tolist(),
+            "heat_capacity": errors[:, 2].tolist(),
+            "mag_susceptibility": errors[:, 3].tolist(),
+        },
+        "dos": dos,
+        "wham": wham_info,
+    }
+    return energies_list, magnetization_list, heat_capacity_list, mag_susceptibility_list, info
+
+
+def _wham_arrays(histograms, ham, temps):
+    """
+    Returns the bond sums and magnetizations of the classes visited by any of the histograms, the matrix
+    of the counts of every histogram (rows) in every class (columns), and the matrix of the log Boltzmann
+    factors -E(k) / T_i.
+    """
+    N = histograms[0].N
+    for histogram in histograms:
+        if histogram.N != N:
+            raise ValueError("All histograms must belong to systems with the same N.")
+    keys = numpy.unique(numpy.concatenate([histogram.keys for histogram in histograms]))
+    counts = numpy.zeros((len(histograms), len(keys)))
+    for i, histogram in enumerate(histograms):
+        counts[i, numpy.searchsorted(keys, histogram.keys)] = histogram.counts
+    bond_sums = keys // (2 * N + 1) - N
+    magnetizations = keys % (2 * N + 1) - N
+    energies = -ham.J * bond_sums + ham.mu * magnetizations
+    log_boltzmann = -numpy.outer(1 / numpy.asarray(temps, dtype=float), energies)
+    return bond_sums, magnetizations, counts, log_boltzmann
+
+
+def _inefficiencies(statistical_inefficiencies, n_runs):
+    """
+    Returns the statistical inefficiency of every run, at least 1, with 1 for all runs if None is given.
+    """
+    if statistical_inefficiencies is None:
+        return numpy.ones(n_runs)
+    return numpy.maximum(numpy.asarray(statistical_inefficiencies, dtype=float), 1)
+
+
+def _solve_wham(counts, n_samples, log_boltzmann, f, tolerance, max_iterations):
+    """
+    Iterates the WHAM equations for the (run, class) counts, the number of samples of every run and the
+    log Boltzmann factors -E(k) / T_i, starting from the free energies f. Returns ln g, the free energies
+    (with f[0] = 0), the number of iterations and whether the tolerance was reached.
+    """
+    ln_total = numpy.log(counts.sum(axis=0))
+    ln_n = numpy.log(n_samples)[:, numpy.newaxis]
+    f = numpy.array(f, dtype=float)
+    converged = False
+    iterations = 0
+    while iterations < max_iterations:
+        iterations += 1
+        ln_g = ln_total - log_sum_exp(ln_n + f[:, numpy.newaxis] + log_boltzmann, axis=0)
+        new_f = -log_sum_exp(ln_g + log_boltzmann, axis=1)
+        new_f -= new_f[0]
+        change = numpy.max(numpy.abs(new_f - f))
+        f = new_f
+        if change < tolerance:
+            converged = True
+            break
+    ln_g = ln_total - log_sum_exp(ln_n + f[:, numpy.newaxis] + log_boltzmann, axis=0)
+    return ln_g, f, iterations, converged
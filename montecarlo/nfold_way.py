@@ -0,0 +1,242 @@
+"""
+Rejection-free (n-fold way) sampling of the Ising chain, after Bortz, Kalos and Lebowitz.
+
+A single spin flip is fully described by the value of the spin and the sum of its neighbors, so every
+site belongs to one of 10 flip classes, and all sites of a class flip with the same probability. The
+n-fold way keeps the sites bucketed by class, picks the next flip directly with probability proportional
+to the class rates, and advances a continuous time by the mean time the configuration would have survived
+under single-site updates at random sites. Observables are weighted by these residence times, so the
+averages are the same as those of metropolis sampling, but every step performs a flip. At low temperature,
+where almost every proposed flip is rejected, this costs far less than sweeping.
+"""
+import numpy
+from .backends import compute_bond_sum, compute_magnetization, bond_energy, neighbor_sum
+from .accumulators import BlockAccumulator
+from .random_streams import draw_uniforms, random_configuration
+from .configurations import to_spin_configuration
+
+__all__ = ["nfold_way"]
+
+# number of flips whose random numbers are drawn at once
+_BLOCK_EVENTS = 4096
+
+# number of completed time bins collected before they are added to the accumulator
+_FLUSH_BINS = 1024
+
+
+def nfold_way(
+    N,
+    ham,
+    temp,
+    montecarlo_steps,
+    burn_steps=0,
+    rng=None,
+    initial_spins=None,
+    rule="metropolis",
+    full_output=False,
+):
+    """
+    Performs rejection-free n-fold way sampling to determine thermal quantities at the specified
+    temperature for an N-spin system described by a particular Hamiltonian. Time is counted in sweeps
+    (N attempted single-site updates), so montecarlo_steps and burn_steps have the same meaning as in
+    montecarlo_metropolis. The kept time is divided into bins of one sweep, and the time-weighted average
+    of every bin plays the role of the value after one metropolis sweep in the error analysis.
+
+    Parameters
+    ----------
+    N : int
+        The number of sites in the spin system.
+    ham : Hamiltonian
+        The Hamiltonian used to describe the spin system.
+    temp : float
+        The temperature of the spin system.
+    montecarlo_steps : int
+        The number of sweeps of simulated time whose values are kept.
+    burn_steps : int, default: 0
+        The number of sweeps of simulated time discarded first.
+    rng : numpy.random.Generator, default: None
+        The random number generator of this run. If None, the random module is used.
+    initial_spins : SpinConfiguration, default: None
+        The configuration the chain starts from. If None, a random configuration with N sites is used.
+    rule : str, default: "metropolis"
+        The single-site update rule whose dynamics is simulated, "metropolis" or "heat_bath".
+    full_output : bool, default: False
+        If True, a dictionary with additional information about the run is returned as a fifth value.
+
+    Returns
+    -------
+    avg_energy : float
+        The time-weighted average energy.
+    avg_mag : float
+        The time-weighted average magnetization.
+    heat_cap : float
+        The heat capacity derived from the time-weighted averages.
+    mag_susceptibility : float
+        The magnetic susceptibility derived from the time-weighted averages.
+    info : dict
+        Only returned if full_output is True. Contains the statistical errors of the four returned
+        quantities ("errors"), the integrated autocorrelation times of the energy and magnetization in
+        sweeps ("tau_int"), the number of kept sweeps ("steps"), the number of flips performed while
+        values were kept ("events") and the final configuration ("final_spins").
+    """
+    if initial_spins is None:
+        config = random_configuration(rng, N)
+    else:
+        config = numpy.array(initial_spins.get_spins(), dtype=numpy.int8)
+    periodic = ham.doPeriodicBoundaryConditions
+    spins = config.tolist()
+
+    # flip rate of every class c = 5 * s + h + 2, for spin value s and neighbor sum h
+    table = ham.flip_probability_table(temp, rule)
+    rates = [min(1.0, float(p)) for p in table.reshape(-1)]
+
+    # buckets of the sites of every class, with the position of every site in its bucket
+    members = [[] for c in range(10)]
+    site_class = [0] * N
+    position = [0] * N
+    for i in range(N):
+        c = _flip_class(spins, i, periodic)
+        site_class[i] = c
+        position[i] = len(members[c])
+        members[c].append(i)
+
+    bond_sum = compute_bond_sum(config, periodic)
+    magnetization = compute_magnetization(config)
+
+    blocks = BlockAccumulator(["E", "E2", "M", "M2"])
+    bins = []  # completed time bins not yet added to the accumulator
+    bin_sums = [0.0, 0.0, 0.0, 0.0]  # time integrals of E, E^2, M and M^2 in the current bin
+    bin_time = 0.0  # time spent in the current bin
+    events = 0
+
+    uniforms = []
+    next_uniform = 0
+    time = 0.0
+    total_time = burn_steps + montecarlo_steps
+    while time < total_time:
+        # mean residence time of the configuration, in sweeps
+        total_rate = 0.0
+        for c in range(10):
+            total_rate += len(members[c]) * rates[c]
+        if total_rate > 0:
+            dt = 1 / total_rate
+        else:
+            dt = total_time  # no flip is possible, the configuration is frozen
+        if time + dt > total_time:
+            dt = total_time - time
+
+        # values are kept for the part of the residence time after the burn-in
+        kept = min(dt, time + dt - burn_steps)
+        if kept > 0:
+            energy = float(bond_energy(ham, bond_sum, magnetization))
+            values = [energy, energy * energy, float(magnetization), float(magnetization**2)]
+            while kept > 0:
+                part = min(kept, 1 - bin_time)
+                for k in range(4):
+                    bin_sums[k] += values[k] * part
+                bin_time += part
+                kept -= part
+                if bin_time >= 1 - 1e-12:
+                    bins.append(bin_sums)
+                    bin_sums = [0.0, 0.0, 0.0, 0.0]
+                    bin_time = 0.0
+                    # the configuration fills whole bins on its own
+                    n_whole = min(int(kept), montecarlo_steps - blocks.count - len(bins))
+                    bins.extend([list(values)] * n_whole)
+                    kept -= n_whole
+                if len(bins) >= _FLUSH_BINS:
+                    blocks.add_array(numpy.array(bins))
+                    bins = []
+        time += dt
+        if time >= total_time or total_rate == 0:
+            break
+
+        # picks the class of the next flip with probability proportional to its total rate, then a site
+        if next_uniform == len(uniforms):
+            uniforms = draw_uniforms(rng, _BLOCK_EVENTS, 2).tolist()
+            next_uniform = 0
+        u_class, u_site = uniforms[next_uniform]
+        next_uniform += 1
+        target = u_class * total_rate
+        for c in range(10):
+            class_rate = len(members[c]) * rates[c]
+            if class_rate > 0:
+                chosen = c  # guards against rounding in the last step
+                if target < class_rate:
+                    break
+                target -= class_rate
+        c = chosen
+        i = members[c][min(int(u_site * len(members[c])), len(members[c]) - 1)]
+
+        h = (c % 5) - 2
+        new_spin = 1 - 2 * spins[i]
+        spins[i] = 1 - spins[i]
+        bond_sum += 2 * new_spin * h
+        magnetization += 2 * new_spin
+        if time > burn_steps:
+            events += 1
+
+        # the flip changes the classes of the site and its neighbors
+        for j in [i - 1, i, i + 1]:
+            if not periodic and (j < 0 or j >= N):
+                continue
+            j = j % N
+            _move_site(j, _flip_class(spins, j, periodic), site_class, position, members)
+
+    if bin_time > 1e-12 and blocks.count + len(bins) < montecarlo_steps:
+        bins.append([value / bin_time for value in bin_sums])
+    if bins:
+        blocks.add_array(numpy.array(bins))
+
+    avg_energy = blocks.mean("E")
+    avg_mag = blocks.mean("M")
+    heat_cap = (blocks.mean("E2") - avg_energy**2) / temp**2
+    mag_susceptibility = (blocks.mean("M2") - avg_mag**2) / temp
+
+    if full_output:
+        info = {
+            "errors": {
+                "energy": blocks.error("E"),
+                "magnetization": blocks.error("M"),
+                "heat_capacity": blocks.jackknife_error(
+                    lambda m: (m["E2"] - m["E"] ** 2) / temp**2
+                ),
+                "mag_susceptibility": blocks.jackknife_error(
+                    lambda m: (m["M2"] - m["M"] ** 2) / temp
+                ),
+            },
+            "tau_int": {
+                "energy": blocks.tau_int("E"),
+                "magnetization": blocks.tau_int("M"),
+            },
+            "steps": blocks.count,
+            "events": events,
+            "final_spins": to_spin_configuration(spins),
+        }
+        return avg_energy, avg_mag, heat_cap, mag_susceptibility, info
+    return avg_energy, avg_mag, heat_cap, mag_susceptibility
+
+
+def _flip_class(spins, i, periodic):
+    """
+    Returns the flip class 5 * s + h + 2 of site i, where s is its spin and h the sum of its neighbors
+    (each counted as -1 or +1).
+    """
+    return 5 * spins[i] + neighbor_sum(spins, i, periodic) + 2
+
+
+def _move_site(i, new_class, site_class, position, members):
+    """
+    Moves site i into the bucket of new_class, filling its old place with the last site of the old bucket.
+    """
+    old_class = site_class[i]
+    if old_class == new_class:
+        return
+    bucket = members[old_class]
+    last = bucket.pop()
+    if last != i:
+        bucket[position[i]] = last
+        position[last] = position[i]
+    site_class[i] = new_class
+    position[i] = len(members[new_class])
+    members[new_class].append(i)
@@ -0,0 +1,196 @@
+import numpy
+from .backends import get_backend, bond_energy
+from .accumulators import ThermalAccumulator
+from .reweighting import JointHistogram
+from .random_streams import draw_uniforms, random_configuration
+
+# number of kept sweeps collected before they are added to the accumulators
+_FLUSH_SWEEPS = 1024
+
+
+def parallel_tempering(
+    N,
+    ham,
+    temps,
+    montecarlo_steps,
+    burn_steps=0,
+    swap_interval=1,
+    backend=None,
+    rng=None,
+    rule="metropolis",
+    histogram=False,
+    full_output=False,
+):
+    """
+    Samples an N-spin system at several temperatures at once with replica exchange (parallel tempering).
+    One replica is kept per temperature. All replicas are updated together with the batched metropolis
+    sweep of the backend, and every swap_interval sweeps neighboring temperatures attempt to exchange
+    their configurations, alternating between even and odd pairs. An exchange between temperatures T_k and
+    T_l with energies E_k and E_l is accepted with probability min(1, exp((1/T_k - 1/T_l)(E_k - E_l))),
+    which lets configurations trapped at low temperature escape through the high-temperature replicas.
+
+    Parameters
+    ----------
+    N : int
+        The number of sites in the spin system.
+    ham : Hamiltonian
+        The Hamiltonian used to describe the spin system.
+    temps : list
+        The temperatures of the replicas.
+    montecarlo_steps : int
+        The number of sweeps whose values are kept.
+    burn_steps : int, default: 0
+        The number of sweeps (with exchanges) performed before values are kept.
+    swap_interval : int, default: 1
+        The number of sweeps between two rounds of exchange attempts.
+    backend : str, default: None
+        The backend that performs the sweeps. If None, the default backend is used.
+    rng : numpy.random.Generator, default: None
+        The random number generator. If None, the random module is used.
+    rule : str, default: "metropolis"
+        The single-site update rule of the sweeps, "metropolis" or "heat_bath".
+    histogram : bool, default: False
+        If True, the JointHistogram of the kept sweeps at every temperature is recorded and returned in
+        the info dictionary of that temperature ("histogram").
+    full_output : bool, default: False
+        If True, a dictionary with additional information about the run is returned as a fifth value.
+
+    Returns
+    -------
+    energies_list : list
+        The average energy at every temperature, in the order of temps.
+    magnetization_list : list
+        The average magnetization at every temperature.
+    heat_capacity_list : list
+        The heat capacity at every temperature.
+    mag_susceptibility_list : list
+        The magnetic susceptibility at every temperature.
+    info : dict
+        Only returned if full_output is True. Contains "swap_acceptance", the fraction of accepted
+        exchanges between the ith and (i+1)th lowest temperatures; "round_trip_times", the number of sweeps
+        each completed round trip of a replica from the lowest to the highest temperature and back took;
+        and "points", the info dictionary of every temperature (see ThermalAccumulator.info), in the order
+        of temps.
+    """
+    kernels = get_backend(backend)
+    order = numpy.argsort(temps)  # slot k holds the kth lowest temperature
+    slot_temps = numpy.array(temps, dtype=float)[order]
+    betas = 1 / slot_temps
+    n_slots = len(slot_temps)
+
+    configs = numpy.array([random_configuration(rng, N) for k in range(n_slots)])
+    bond_sums = numpy.zeros(n_slots, dtype=numpy.int64)
+    mags = numpy.zeros(n_slots, dtype=numpy.int64)
+    for k in range(n_slots):
+        bond_sums[k], mags[k] = kernels.energy(configs[k], ham)
+    energies = bond_energy(ham, bond_sums, mags)
+
+    accumulators = [ThermalAccumulator() for k in range(n_slots)]
+    histograms = [JointHistogram(N) for k in range(n_slots)] if histogram else None
+    attempts = numpy.zeros(max(n_slots - 1, 0), dtype=numpy.int64)
+    accepted = numpy.zeros(max(n_slots - 1, 0), dtype=numpy.int64)
+
+    # bookkeeping for the round trips of the replicas between the lowest and highest temperature
+    replica_at_slot = numpy.arange(n_slots)
+    trip_start = numpy.full(n_slots, -1)  # sweep at which each replica last left the lowest temperature
+    visited_top = numpy.zeros(n_slots, dtype=bool)
+    round_trip_times = []
+
+    pending = []  # values of kept sweeps not yet handed to the accumulators
+    n_pending = 0
+
+    total_steps = burn_steps + montecarlo_steps
+    done = 0
+    parity = 0
+    while done < total_steps:
+        # chunks end at the next exchange round and at the end of the burn-in
+        n_sweeps = swap_interval - done % swap_interval
+        if done < burn_steps:
+            n_sweeps = min(n_sweeps, burn_steps - done)
+        n_sweeps = min(n_sweeps, total_steps - done)
+
+        uniforms = draw_uniforms(rng, n_sweeps * n_slots, N).reshape(
+            n_sweeps, n_slots, N
+        )
+        chunk_bonds, chunk_mags = kernels.batch_run(
+            configs, ham, slot_temps, uniforms, rule, done
+        )
+        chunk_energies = bond_energy(ham, chunk_bonds, chunk_mags)
+        if done >= burn_steps:
+            pending.append((chunk_energies, chunk_mags, chunk_bonds))
+            n_pending += n_sweeps
+        done += n_sweeps
+        if n_pending >= _FLUSH_SWEEPS or (done == total_steps and n_pending > 0):
+            # the values are handed to the accumulators in large blocks, which is much cheaper
+            pending_energies = numpy.concatenate([p[0] for p in pending])
+            pending_mags = numpy.concatenate([p[1] for p in pending])
+            for k in range(n_slots):
+                accumulators[k].add_array(pending_energies[:, k], pending_mags[:, k])
+            if histogram:
+                pending_bonds = numpy.concatenate([p[2] for p in pending])
+                for k in range(n_slots):
+                    histograms[k].add_array(pending_bonds[:, k], pending_mags[:, k])
+            pending = []
+            n_pending = 0
+        energies = chunk_energies[-1].copy()
+        mags = chunk_mags[-1].copy()
+
+        if done % swap_interval == 0 and n_slots > 1:
+            pairs = numpy.arange(parity, n_slots - 1, 2)
+            parity = 1 - parity
+            checks = draw_uniforms(rng, 1, len(pairs))[0]
+            for k, check_num in zip(pairs, checks):
+                attempts[k] += 1
+                exponent = (betas[k] - betas[k + 1]) * (energies[k] - energies[k + 1])
+                if exponent >= 0 or numpy.exp(exponent) > check_num:
+                    accepted[k] += 1
+                    for array in (configs, energies, mags, replica_at_slot):
+                        array[[k, k + 1]] = array[[k + 1, k]]
+
+            _record_round_trips(
+                replica_at_slot, trip_start, visited_top, round_trip_times, done
+            )
+
+    results = [accumulators[k].thermal_quantities(slot_temps[k]) for k in range(n_slots)]
+    # slot of every temperature in the order of temps
+    slot_of_temp = numpy.empty(n_slots, dtype=int)
+    slot_of_temp[order] = numpy.arange(n_slots)
+    energies_list = [results[k][0] for k in slot_of_temp]
+    magnetization_list = [results[k][1] for k in slot_of_temp]
+    heat_capacity_list = [results[k][2] for k in slot_of_temp]
+    mag_susceptibility_list = [results[k][3] for k in slot_of_temp]
+
+    if full_output:
+        info = {
+            "swap_acceptance": (accepted / numpy.maximum(attempts, 1)).tolist(),
+            "round_trip_times": round_trip_times,
+            "points": [
+                accumulators[k].info(slot_temps[k]) for k in slot_of_temp
+            ],
+        }
+        if histogram:
+            for i, k in enumerate(slot_of_temp):
+                info["points"][i]["histogram"] = histograms[k]
+        return (
+            energies_list,
+            magnetization_list,
+            heat_capacity_list,
+            mag_susceptibility_list,
+            info,
+        )
+    return energies_list, magnetization_list, heat_capacity_list, mag_susceptibility_list
+
+
+def _record_round_trips(replica_at_slot, trip_start, visited_top, round_trip_times, time):
+    """
+    Updates the round-trip bookkeeping after an exchange round. A round trip is complete when a replica
+    that left the lowest temperature has reached the highest temperature and come back.
+    """
+    bottom = replica_at_slot[0]
+    top = replica_at_slot[-1]
+    if trip_start[top] >= 0:
+        visited_top[top] = True
+    if visited_top[bottom]:
+        round_trip_times.append(int(time - trip_start[bottom]))
+        visited_top[bottom] = False
+    trip_start[bottom] = time
@@ -0,0 +1,282 @@
+"""
+Population annealing of the Ising chain.
+
+A population of R configurations starts from exact samples at infinite temperature (random configurations)
+and is cooled through a sequence of temperatures. At every step from 1/T to 1/T', every configuration is
+reweighted by exp(-(1/T' - 1/T) E) and the population is resampled with these weights, so that it
+represents the Boltzmann distribution at T' again, and a few sweeps at T' restore its diversity. The mean
+weight of every step is the ratio Z(T') / Z(T) of the partition functions, so the free energy at every
+temperature is a by-product. Resampled configurations descend from the same initial configuration
+("family"), and the spread of the observables between families gives the statistical errors.
+"""
+import concurrent.futures
+import ctypes
+import multiprocessing
+
+import numpy
+from .backends import get_backend, bond_energy
+from .random_streams import draw_uniforms, random_configuration
+
+__all__ = ["population_annealing"]
+
+# shared population and random number arrays of a worker process, set by _init_worker
+_shared = {}
+
+
+def population_annealing(
+    N,
+    ham,
+    start=1,
+    end=10,
+    step=0.1,
+    population=1000,
+    sweeps_per_step=10,
+    backend=None,
+    rng=None,
+    processes=None,
+    rule="metropolis",
+    full_output=False,
+):
+    """
+    Uses population annealing to generate lists of the average energy, average magnetization, heat
+    capacity and magnetic susceptibility values over the temperatures of
+    generate_montecarlo_thermal_quantities. The population is cooled from infinite temperature through the
+    temperatures from highest to lowest.
+
+    Parameters
+    ----------
+    N : int
+        The number of spins in the system.
+    ham : Hamiltonian
+        The Hamiltonian used to characterize the system.
+    start : float, default: 1
+        The start of the temperature range.
+    end : float, default: 10
+        The end of the temperature range.
+    step : float, default: 0.1
+        The size of the gap between successive temperature values.
+    population : int, default: 1000
+        The number of configurations in the population.
+    sweeps_per_step : int, default: 10
+        The number of sweeps of every configuration after every resampling.
+    backend : str, default: None
+        The name of the backend that performs the sweeps. If None, the default backend is used. With
+        processes, it must be a registered name.
+    rng : numpy.random.Generator or CounterRNG, default: None
+        The random number generator. If None, the random module is used.
+    processes : int, default: None
+        The number of worker processes the sweeps of the population are split over. The population and
+        the random numbers of every step are held in shared memory, which the workers update in place, so
+        the results do not depend on the number of processes. If None or 1, the sweeps run in this
+        process.
+    rule : str, default: "metropolis"
+        The single-site update rule of the sweeps, "metropolis" or "heat_bath".
+    full_output : bool, default: False
+        If True, a dictionary with additional information about the run is returned as a sixth value.
+
+    Returns
+    -------
+    temps_list : list
+        The list generated from the start, step, and end temperature values.
+    energies_list : list
+        The average energy of the population at every temperature.
+    magnetization_list : list
+        The average magnetization of the population at every temperature.
+    heat_capacity_list : list
+        The heat capacity from the energy variance of the population at every temperature.
+    mag_susceptibility_list : list
+        The magnetic susceptibility from the magnetization variance of the population at every
+        temperature.
+    info : dict
+        Only returned if full_output is True. Contains, for every temperature of temps_list: the free
+        energy -T ln Z ("free_energies"); the statistical errors of the four returned quantities ("errors"),
+        from the variation between families; the effective size (sum of the weights)^2 / (sum of the
+        squared weights) of the reweighted population divided by its size ("effective_population"), which
+        should stay close to 1; and the number of surviving families ("families"). It also contains the
+        final configurations of the population ("final_configs").
+    """
+    temps_list = []
+    temp = start
+    while temp < end:
+        temps_list.append(temp)
+        temp += step
+
+    kernels = get_backend(backend)
+    configs = numpy.array([random_configuration(rng, N) for k in range(population)])
+    families = numpy.arange(population)
+    bond_sums = numpy.zeros(population, dtype=numpy.int64)
+    mags = numpy.zeros(population, dtype=numpy.int64)
+    for k in range(population):
+        bond_sums[k], mags[k] = kernels.energy(configs[k], ham)
+
+    executor = None
+    if processes is not None and processes > 1:
+        # the workers update slices of the shared population in place, so it never has to be sent
+        config_buffer = multiprocessing.RawArray(ctypes.c_int8, population * N)
+        uniform_buffer = multiprocessing.RawArray(ctypes.c_double, sweeps_per_step * population * N)
+        shared_configs = numpy.frombuffer(config_buffer, dtype=numpy.int8).reshape(population, N)
+        shared_configs[:] = configs
+        configs = shared_configs
+        uniforms = numpy.frombuffer(uniform_buffer, dtype=numpy.float64).reshape(
+            sweeps_per_step, population, N
+        )
+        executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=processes,
+            initializer=_init_worker,
+            initargs=(config_buffer, uniform_buffer, (sweeps_per_step, population, N)),
+        )
+        bounds = numpy.linspace(0, population, processes + 1).astype(int)
+
+    n_temps = len(temps_list)
+    results = numpy.zeros((n_temps, 4))
+    errors = numpy.zeros((n_temps, 4))
+    free_energies = numpy.zeros(n_temps)
+    effective_population = numpy.zeros(n_temps)
+    n_families = numpy.zeros(n_temps, dtype=int)
+
+    ln_z = N * numpy.log(2)  # the partition function at infinite temperature counts all configurations
+    beta = 0.0
+    sweeps_done = 0  # sweeps of every member of the population so far
+    try:
+        for t in sorted(range(n_temps), key=lambda i: temps_list[i], reverse=True):
+            temp = temps_list[t]
+            energies = bond_energy(ham, bond_sums, mags)
+
+            # reweights the population to the new temperature; the mean weight is Z(T') / Z(T)
+            log_weights = -(1 / temp - beta) * energies
+            largest = numpy.max(log_weights)
+            weights = numpy.exp(log_weights - largest)
+            ln_z += largest + numpy.log(numpy.mean(weights))
+            beta = 1 / temp
+            free_energies[t] = -temp * ln_z
+            effective_population[t] = numpy.sum(weights) ** 2 / numpy.sum(weights**2) / population
+
+            # systematic resampling keeps the population size fixed
+            cumulative = numpy.cumsum(weights)
+            positions = (draw_uniforms(rng, 1, 1)[0, 0] + numpy.arange(population)) * (
+                cumulative[-1] / population
+            )
+            ancestors = numpy.minimum(
+                numpy.searchsorted(cumulative, positions, side="right"), population - 1
+            )
+            configs[:] = configs[ancestors]
+            families = families[ancestors]
+
+            if executor is None:
+                uniforms = draw_uniforms(rng, sweeps_per_step * population, N).reshape(
+                    sweeps_per_step, population, N
+                )
+                step_bonds, step_mags = kernels.batch_run(
+                    configs, ham, numpy.full(population, temp), uniforms, rule, sweeps_done
+                )
+                bond_sums, mags = step_bonds[-1], step_mags[-1]
+            else:
+                uniforms[:] = draw_uniforms(rng, sweeps_per_step * population, N).reshape(
+                    sweeps_per_step, population, N
+                )
+                futures = [
+                    executor.submit(
+                        _sweep_slice,
+                        bounds[p],
+                        bounds[p + 1],
+                        ham,
+                        temp,
+                        backend,
+                        rule,
+                        sweeps_done,
+                    )
+                    for p in range(processes)
+                ]
+                parts = [future.result() for future in futures]
+                bond_sums = numpy.concatenate([part[0] for part in parts])
+                mags = numpy.concatenate([part[1] for part in parts])
+            sweeps_done += sweeps_per_step
+
+            energies = bond_energy(ham, bond_sums, mags)
+            results[t], errors[t] = _population_quantities(energies, mags, families, temp)
+            n_families[t] = len(numpy.unique(families))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    energies_list = results[:, 0].tolist()
+    magnetization_list = results[:, 1].tolist()
+    heat_capacity_list = results[:, 2].tolist()
+    mag_susceptibility_list = results[:, 3].tolist()
+
+    if full_output:
+        info = {
+            "free_energies": free_energies.tolist(),
+            "errors": {
+                "energy": errors[:, 0].tolist(),
+                "magnetization": errors[:, 1].tolist(),
+                "heat_capacity": errors[:, 2].tolist(),
+                "mag_susceptibility": errors[:, 3].tolist(),
+            },
+            "effective_population": effective_population.tolist(),
+            "families": n_families.tolist(),
+            "final_configs": numpy.array(configs),
+        }
+        return (
+            temps_list,
+            energies_list,
+            magnetization_list,
+            heat_capacity_list,
+            mag_susceptibility_list,
+            info,
+        )
+    return temps_list, energies_list, magnetization_list, heat_capacity_list, mag_susceptibility_list
+
+
+def _population_quantities(energies, mags, families, temp):
+    """
+    Returns the thermal quantities of the population and their errors. Configurations of the same family
+    are correlated, so the error of a population mean is estimated from the family sums of the deviations,
+    sqrt(sum_f (sum_{j in f} (x_j - mean))^2) / R.
+    """
+    population = len(energies)
+    avg_energy = numpy.mean(energies)
+    avg_mag = numpy.mean(mags)
+    energy_deviations = energies - avg_energy
+    mag_deviations = mags - avg_mag
+    squared_energy = energy_deviations**2 / temp**2
+    squared_mag = mag_deviations**2 / temp
+    values = numpy.array(
+        [avg_energy, avg_mag, numpy.mean(squared_energy), numpy.mean(squared_mag)]
+    )
+
+    _, family_index = numpy.unique(families, return_inverse=True)
+    errors = numpy.zeros(4)
+    deviations = [
+        energy_deviations,
+        mag_deviations,
+        squared_energy - values[2],
+        squared_mag - values[3],
+    ]
+    for k in range(4):
+        family_sums = numpy.bincount(family_index, weights=deviations[k])
+        errors[k] = numpy.sqrt(numpy.sum(family_sums**2)) / population
+    return values, errors
+
+
+def _init_worker(config_buffer, uniform_buffer, shape):
+    """
+    Maps the shared population and random numbers into a worker process.
+    """
+    n_sweeps, population, N = shape
+    _shared["configs"] = numpy.frombuffer(config_buffer, dtype=numpy.int8).reshape(population, N)
+    _shared["uniforms"] = numpy.frombuffer(uniform_buffer, dtype=numpy.float64).reshape(shape)
+
+
+def _sweep_slice(first, last, ham, temp, backend, rule, first_sweep):
+    """
+    Performs the sweeps of the configurations first to last - 1 of the shared population in a worker
+    process, in place, and returns their bond sums and magnetizations after the last sweep. The first sweep
+    is sweep first_sweep of the population.
+    """
+    configs = _shared["configs"][first:last]
+    uniforms = _shared["uniforms"][:, first:last]
+    bond_sums, mags = get_backend(backend).batch_run(
+        configs, ham, numpy.full(last - first, temp), uniforms, rule, first_sweep
+    )
+    return bond_sums[-1], mags[-1]
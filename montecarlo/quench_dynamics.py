@@ -0,0 +1,195 @@
+"""
+Relaxation of an ensemble of chains after a quench.
+
+A batch of independent chains starts from an initial ensemble (random, ordered, equilibrated at another
+temperature or with another Hamiltonian, or given explicitly) and is swept at the final temperature with
+the final Hamiltonian. The mean and the variance over the chains of the energy and the magnetization are
+written to preallocated arrays at the measurement times, which may be logarithmically spaced, so the
+memory of a run only grows with the number of measurements and not with the number of sweeps.
+"""
+import numpy
+from .backends import get_backend, bond_energy, BLOCK_UNIFORMS
+from .random_streams import draw_uniforms, random_configuration
+from .configurations import ordered_configuration
+
+__all__ = ["quench_dynamics"]
+
+
+def quench_dynamics(
+    N,
+    ham,
+    temp,
+    sweeps,
+    n_chains=100,
+    initial="random",
+    initial_ham=None,
+    prepare_sweeps=1000,
+    times="log",
+    n_times=50,
+    backend=None,
+    rng=None,
+    rule="metropolis",
+    full_output=False,
+):
+    """
+    Sweeps a batch of chains from an initial ensemble at a new temperature or with a new Hamiltonian, and
+    returns the ensemble averages and variances of the energy and the magnetization at the measurement
+    times.
+
+    Parameters
+    ----------
+    N : int
+        The number of sites in the spin system.
+    ham : Hamiltonian
+        The Hamiltonian after the quench.
+    temp : float
+        The temperature after the quench.
+    sweeps : int
+        The number of sweeps after the quench.
+    n_chains : int, default: 100
+        The number of chains of the ensemble.
+    initial : str, float or numpy.ndarray, default: "random"
+        The initial ensemble. "random" is the infinite-temperature ensemble, "ordered" starts every chain
+        from the lowest-energy ordered configuration of initial_ham (all up, all down or alternating), a
+        float is a temperature at which every chain is equilibrated with initial_ham for prepare_sweeps
+        sweeps from a random configuration, and an array of shape (n_chains, N) of 0's and 1's gives the
+        configurations.
+    initial_ham : Hamiltonian, default: None
+        The Hamiltonian before the quench, used by the "ordered" and the temperature ensembles. If None,
+        it is ham, so the quench only changes the temperature.
+    prepare_sweeps : int, default: 1000
+        The number of sweeps that equilibrate the chains when initial is a temperature.
+    times : str or array_like, default: "log"
+        The numbers of sweeps after the quench at which the ensemble is measured. "log" gives n_times
+        times spaced logarithmically between 1 and sweeps, "linear" measures after every sweep, and an
+        array gives the times. The initial ensemble (time 0) is always measured.
+    n_times : int, default: 50
+        The number of logarithmically spaced times. Times that round to the same sweep are measured once.
+    backend : str, default: None
+        The name of the backend that performs the sweeps. If None, the default backend is used.
+    rng : numpy.random.Generator or CounterRNG, default: None
+        The random number generator of this run. If None, the random module is used.
+    rule : str, default: "metropolis"
+        The update rule of the sweeps, "metropolis", "heat_bath" or "block_gibbs".
+    full_output : bool, default: False
+        If True, a dictionary with additional information about the run is returned as a sixth value.
+
+    Returns
+    -------
+    times : numpy.ndarray
+        The measurement times, in sweeps after the quench, starting with 0.
+    avg_energy : numpy.ndarray
+        The mean energy of the chains at every measurement time.
+    avg_mag : numpy.ndarray
+        The mean magnetization of the chains at every measurement time.
+    energy_variance : numpy.ndarray
+        The variance of the energy over the chains at every measurement time.
+    mag_variance : numpy.ndarray
+        The variance of the magnetization over the chains at every measurement time.
+    info : dict
+        Only returned if full_output is True. Contains the statistical errors of the mean energy and
+        magnetization at every time ("errors", which needs n_chains > 1), the mean absolute magnetization
+        at every time ("abs_magnetization") and the final configurations of the chains ("final_configs").
+    """
+    kernels = get_backend(backend)
+    if initial_ham is None:
+        initial_ham = ham
+
+    # the measurement times, strictly increasing and starting with the initial ensemble
+    if isinstance(times, str):
+        if times == "log":
+            # without sweeps only the initial ensemble is measured
+            times = numpy.logspace(0, numpy.log10(sweeps), n_times) if sweeps > 0 else []
+        elif times == "linear":
+            times = numpy.arange(1, sweeps + 1)
+        else:
+            raise ValueError('times must be "log", "linear" or an array of sweep numbers.')
+    times = numpy.round(numpy.asarray(times, dtype=float)).astype(numpy.int64)
+    if numpy.any(times < 0) or numpy.any(times > sweeps):
+        raise ValueError("The measurement times must lie between 0 and sweeps.")
+    times = numpy.union1d([0], times)
+
+    # the initial ensemble; first_sweep is the number of sweeps that prepared it
+    first_sweep = 0
+    if isinstance(initial, str):
+        if initial == "random":
+            configs = numpy.array([random_configuration(rng, N) for k in range(n_chains)])
+        elif initial == "ordered":
+            configs = numpy.tile(ordered_configuration(N, initial_ham), (n_chains, 1))
+        else:
+            raise ValueError('initial must be "random", "ordered", a temperature or an array.')
+    elif numpy.ndim(initial) == 0:
+        configs = numpy.array([random_configuration(rng, N) for k in range(n_chains)])
+        _batch_sweeps(kernels, configs, initial_ham, float(initial), prepare_sweeps, rng, rule)
+        first_sweep = prepare_sweeps
+    else:
+        configs = numpy.array(initial, dtype=numpy.int8)
+        if configs.shape != (n_chains, N):
+            raise ValueError("The initial configurations must have the shape (n_chains, N).")
+
+    energy_mean = numpy.zeros(len(times))
+    energy_variance = numpy.zeros(len(times))
+    mag_mean = numpy.zeros(len(times))
+    mag_variance = numpy.zeros(len(times))
+    abs_mag_mean = numpy.zeros(len(times))
+
+    def measure(index, energies, mags):
+        energy_mean[index] = numpy.mean(energies)
+        energy_variance[index] = numpy.var(energies)
+        mag_mean[index] = numpy.mean(mags)
+        mag_variance[index] = numpy.var(mags)
+        abs_mag_mean[index] = numpy.mean(numpy.abs(mags))
+
+    energies = numpy.zeros(n_chains)
+    mags = numpy.zeros(n_chains)
+    for k in range(n_chains):
+        bond_sum, mags[k] = kernels.energy(configs[k], ham)
+        energies[k] = bond_energy(ham, bond_sum, mags[k])
+    measure(0, energies, mags)
+
+    temps = numpy.full(n_chains, temp)
+    block_size = max(1, BLOCK_UNIFORMS // (N * n_chains))
+    done = 0
+    index = 1
+    while done < sweeps:
+        # measures the sweeps of the block that are measurement times
+        n_sweeps = min(block_size, sweeps - done)
+        uniforms = draw_uniforms(rng, n_sweeps * n_chains, N).reshape(n_sweeps, n_chains, N)
+        bond_sums, block_mags = kernels.batch_run(
+            configs, ham, temps, uniforms, rule, first_sweep + done
+        )
+        while index < len(times) and times[index] <= done + n_sweeps:
+            row = times[index] - done - 1
+            measure(
+                index, bond_energy(ham, bond_sums[row], block_mags[row]), block_mags[row]
+            )
+            index += 1
+        done += n_sweeps
+
+    if full_output:
+        scale = numpy.sqrt(1 / (n_chains - 1)) if n_chains > 1 else numpy.nan
+        info = {
+            "errors": {
+                "energy": numpy.sqrt(energy_variance) * scale,
+                "magnetization": numpy.sqrt(mag_variance) * scale,
+            },
+            "abs_magnetization": abs_mag_mean,
+            "final_configs": configs,
+        }
+        return times, energy_mean, mag_mean, energy_variance, mag_variance, info
+    return times, energy_mean, mag_mean, energy_variance, mag_variance
+
+
+def _batch_sweeps(kernels, configs, ham, temp, sweeps, rng, rule):
+    """
+    Sweeps all chains of configs at one temperature, in place, in blocks of sweeps.
+    """
+    n_chains, N = configs.shape
+    temps = numpy.full(n_chains, temp)
+    block_size = max(1, BLOCK_UNIFORMS // (N * n_chains))
+    done = 0
+    while done < sweeps:
+        n_sweeps = min(block_size, sweeps - done)
+        uniforms = draw_uniforms(rng, n_sweeps * n_chains, N).reshape(n_sweeps, n_chains, N)
+        kernels.batch_run(configs, ham, temps, uniforms, rule, done)
+        done += n_sweeps
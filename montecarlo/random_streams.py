@@ -0,0 +1,211 @@
+"""
+Sources of random numbers for the Monte Carlo functions of this package.
+
+Every function that samples accepts an rng argument. If it is None, the random numbers come from the
+module-level state of Python's random module, so results can be reproduced with random.seed exactly as
+before. Otherwise it is a numpy.random.Generator that belongs to a single simulation; independent
+generators for several simulations are derived from one root seed with spawn_generators. It can also be
+a CounterRNG, whose random numbers are a fixed function of (seed, chain, sweep, site), so any chain or
+sweep can be regenerated on its own.
+"""
+import json
+import random
+
+import numpy
+
+__all__ = ["spawn_generators", "CounterRNG"]
+
+# counter streams of a CounterRNG
+_SWEEP_STREAM = 0
+_CONFIGURATION_STREAM = 1
+
+
+def spawn_generators(seed, n):
+    """
+    Creates n statistically independent random number generators from a single root seed, using
+    numpy.random.SeedSequence.spawn.
+
+    Parameters
+    ----------
+    seed : int or numpy.random.SeedSequence
+        The root seed.
+    n : int
+        The number of generators.
+
+    Returns
+    -------
+    generators : list
+        List of n numpy.random.Generator objects. The same seed always gives the same generators.
+    """
+    generators = [numpy.random.default_rng(child) for child in spawn_seeds(seed, n)]
+    return generators
+
+
+def spawn_seeds(seed, n):
+    """
+    Creates n independent child seed sequences from a root seed. Unlike generators, seed sequences are
+    cheap to send to worker processes.
+    """
+    if not isinstance(seed, numpy.random.SeedSequence):
+        seed = numpy.random.SeedSequence(seed)
+    children = seed.spawn(n)
+    return children
+
+
+class CounterRNG:
+    def __init__(self, seed, chain=0):
+        """
+        Creates a counter-based random number generator for one chain. The uniform number used at a given
+        site in a given sweep is computed directly from (seed, chain, sweep, site) with the Philox
+        generator: the seed and chain form the key, and the position in the chain forms the counter. The
+        random numbers of a chain therefore do not depend on how many chains are run, in which order, in
+        which process or in which batch, and any range of sweeps can be regenerated without replaying the
+        sweeps before it.
+
+        The Monte Carlo functions read the uniforms row by row, one row per sweep (or per update, for the
+        engines that draw a different number of random numbers per step), starting at the current
+        position, which seek changes.
+
+        Parameters
+        ----------
+        seed : int or numpy.random.SeedSequence
+            The root seed, shared by all chains of a simulation.
+        chain : int, default: 0
+            The number of the chain.
+        """
+        if not isinstance(seed, numpy.random.SeedSequence):
+            seed = numpy.random.SeedSequence(seed)
+        self.seed = seed
+        self.chain = chain
+        self.key = [int(seed.generate_state(1, numpy.uint64)[0]), int(chain)]
+        self.sweep = 0  # row at which the next uniforms are read
+        self.n_configurations = 0  # number of configurations drawn so far
+
+    def __str__(self):
+        return (
+            "CounterRNG: chain "
+            + str(self.chain)
+            + ", sweep "
+            + str(self.sweep)
+        )
+
+    def seek(self, sweep):
+        """
+        Moves the position of the generator, so that the next uniforms are those of the given sweep.
+
+        Parameters
+        ----------
+        sweep : int
+            The row (sweep) at which the next uniforms are read.
+        """
+        self.sweep = sweep
+
+    def sweep_uniforms(self, first_sweep, n_sweeps, N):
+        """
+        Computes the uniform random numbers of a range of sweeps, without changing the position.
+
+        Parameters
+        ----------
+        first_sweep : int
+            The first sweep of the range.
+        n_sweeps : int
+            The number of sweeps.
+        N : int
+            The number of uniforms per sweep.
+
+        Returns
+        -------
+        uniforms : numpy.ndarray
+            Array of shape (n_sweeps, N); entry [k, i] is the number of site i in sweep first_sweep + k.
+        """
+        return self._stream_uniforms(_SWEEP_STREAM, first_sweep, n_sweeps, N)
+
+    def uniforms(self, n_sweeps, N):
+        """
+        Returns the uniform random numbers of the next n_sweeps sweeps of N sites and advances the
+        position.
+        """
+        uniforms = self.sweep_uniforms(self.sweep, n_sweeps, N)
+        self.sweep += n_sweeps
+        return uniforms
+
+    def configuration(self, N):
+        """
+        Returns a random configuration of N spins (0's and 1's). Every call gives the next configuration of
+        a separate counter stream, so drawing configurations does not shift the sweep uniforms.
+        """
+        uniforms = self._stream_uniforms(_CONFIGURATION_STREAM, self.n_configurations, 1, N)[0]
+        self.n_configurations += 1
+        return (uniforms < 0.5).astype(numpy.int8)
+
+    def _stream_uniforms(self, stream, first_row, n_rows, width):
+        """
+        Computes rows of uniforms of one counter stream. Each Philox counter value gives four 64-bit
+        words, so every row starts at its own counter value first_row * ceil(width / 4).
+        """
+        blocks_per_row = -(-width // 4)
+        bit_generator = numpy.random.Philox(
+            key=self.key, counter=[first_row * blocks_per_row, 0, stream, 0]
+        )
+        raw = bit_generator.random_raw(n_rows * blocks_per_row * 4)
+        raw = raw.reshape(n_rows, blocks_per_row * 4)[:, :width]
+        # the top 53 bits give a double in [0, 1), as in numpy.random.Generator.random
+        uniforms = (raw >> numpy.uint64(11)) * (1.0 / 2**53)
+        return uniforms
+
+
+def draw_uniforms(rng, n_sweeps, N):
+    """
+    Draws the uniform random numbers for n_sweeps sweeps of N sites, as an array of shape (n_sweeps, N).
+    With rng None they come from the random module, in the same order in which
+    Hamiltonian.metropolis_sweep consumes them.
+    """
+    if isinstance(rng, CounterRNG):
+        return rng.uniforms(n_sweeps, N)
+    if rng is None:
+        uniforms = numpy.array([random.random() for i in range(n_sweeps * N)])
+        return uniforms.reshape(n_sweeps, N)
+    uniforms = rng.random((n_sweeps, N))
+    return uniforms
+
+
+def random_configuration(rng, N):
+    """
+    Draws a random configuration of N spins, as an array of 0's and 1's. With rng None it comes from the
+    random module, in the same way as SpinConfiguration.randomize.
+    """
+    if isinstance(rng, CounterRNG):
+        return rng.configuration(N)
+    if rng is None:
+        config = numpy.array([random.choice([0, 1]) for i in range(N)], dtype=numpy.int8)
+        return config
+    config = rng.integers(0, 2, N, dtype=numpy.int8)
+    return config
+
+
+def rng_state(rng):
+    """
+    Returns the state of a random number generator as a JSON string: the state of the random module if rng
+    is None, the position of a CounterRNG, or the bit generator state of a numpy.random.Generator.
+    """
+    if rng is None:
+        version, internal_state, gauss_next = random.getstate()
+        return json.dumps([version, list(internal_state), gauss_next])
+    if isinstance(rng, CounterRNG):
+        return json.dumps({"sweep": rng.sweep, "n_configurations": rng.n_configurations})
+    return json.dumps(rng.bit_generator.state)
+
+
+def restore_rng_state(rng, state):
+    """
+    Restores a state returned by rng_state into the same kind of random number generator.
+    """
+    state = json.loads(state)
+    if rng is None:
+        version, internal_state, gauss_next = state
+        random.setstate((version, tuple(internal_state), gauss_next))
+    elif isinstance(rng, CounterRNG):
+        rng.sweep = state["sweep"]
+        rng.n_configurations = state["n_configurations"]
+    else:
+        rng.bit_generator.state = state
@@ -0,0 +1,202 @@
+"""
+Joint histograms of the bond sum and magnetization, and single-histogram (Ferrenberg-Swendsen) reweighting.
+
+A run at temperature T0 with field mu0 visits every (bond sum, M) class in proportion to
+g(bond sum, M) exp(-E / T0). Dividing the visit counts by the Boltzmann factor therefore estimates the
+density of states over the classes the run reached, and multiplying by the Boltzmann factor of another
+temperature and Hamiltonian gives the averages there, without a new simulation. The estimate is only good
+while the new distribution lies within the sampled one, which the effective sample size measures.
+"""
+import numpy
+from .density_of_states import DensityOfStates
+
+__all__ = ["JointHistogram", "reweight"]
+
+
+class JointHistogram:
+    def __init__(self, N):
+        """
+        Creates an empty JointHistogram of the (bond sum, M) values of an N-spin system. Only the classes
+        that were visited are stored, as sorted class indices with their counts, so the memory does not
+        grow with the number of sweeps and stays far below the (2N + 1)^2 classes of a dense grid.
+
+        Parameters
+        ----------
+        N : int
+            The number of sites in the spin system.
+        """
+        self.N = N
+        self.count = 0
+        self.keys = numpy.zeros(0, dtype=numpy.int64)  # (bond sum + N) * (2N + 1) + M + N
+        self.counts = numpy.zeros(0, dtype=numpy.int64)
+
+    def __str__(self):
+        return (
+            "JointHistogram: N = "
+            + str(self.N)
+            + ", count = "
+            + str(self.count)
+            + ", "
+            + str(len(self.keys))
+            + " classes"
+        )
+
+    def add_array(self, bond_sums, magnetizations):
+        """
+        Adds the bond sums and magnetizations of an array of sweeps to the histogram.
+
+        Parameters
+        ----------
+        bond_sums : numpy.ndarray
+            The bond sum after every sweep.
+        magnetizations : numpy.ndarray
+            The magnetization after every sweep.
+        """
+        bond_sums = numpy.asarray(bond_sums, dtype=numpy.int64).reshape(-1)
+        magnetizations = numpy.asarray(magnetizations, dtype=numpy.int64).reshape(-1)
+        if bond_sums.size == 0:
+            return
+        keys = (bond_sums + self.N) * (2 * self.N + 1) + magnetizations + self.N
+        keys, counts = numpy.unique(keys, return_counts=True)
+        self._add_counts(keys, counts)
+
+    def merge(self, other):
+        """
+        Merges the counts of another JointHistogram of the same system into this one.
+
+        Parameters
+        ----------
+        other : JointHistogram
+            The histogram to be merged. It is not modified.
+        """
+        if other.N != self.N:
+            raise ValueError("Cannot merge histograms of systems with different N.")
+        self._add_counts(other.keys, other.counts)
+
+    def _add_counts(self, keys, counts):
+        merged_keys, index = numpy.unique(
+            numpy.concatenate([self.keys, keys]), return_inverse=True
+        )
+        self.counts = numpy.bincount(
+            index, weights=numpy.concatenate([self.counts, counts]), minlength=len(merged_keys)
+        ).astype(numpy.int64)
+        self.keys = merged_keys
+        self.count = int(numpy.sum(self.counts))
+
+    def bond_sums(self):
+        """
+        Returns the bond sum of every stored class.
+        """
+        return self.keys // (2 * self.N + 1) - self.N
+
+    def magnetizations(self):
+        """
+        Returns the magnetization of every stored class.
+        """
+        return self.keys % (2 * self.N + 1) - self.N
+
+    def get_state(self):
+        """
+        Returns the state of the histogram as a dictionary of arrays, e.g. for writing it to a checkpoint.
+        """
+        state = {"N": numpy.array(self.N), "keys": self.keys.copy(), "counts": self.counts.copy()}
+        return state
+
+    def set_state(self, state):
+        """
+        Restores the state returned by get_state.
+        """
+        self.N = int(state["N"])
+        self.keys = numpy.array(state["keys"], dtype=numpy.int64)
+        self.counts = numpy.array(state["counts"], dtype=numpy.int64)
+        self.count = int(numpy.sum(self.counts))
+
+    def density_of_states(self, ham, temp):
+        """
+        Estimates the density of states of the visited classes from a histogram sampled with the
+        Hamiltonian ham at temperature temp.
+
+        Parameters
+        ----------
+        ham : Hamiltonian
+            The Hamiltonian the histogram was sampled with.
+        temp : float
+            The temperature the histogram was sampled at.
+
+        Returns
+        -------
+        dos : DensityOfStates
+            The density of states, normalized as if the visited classes held all 2^N configurations.
+        """
+        if self.count == 0:
+            raise ValueError("The histogram is empty.")
+        bond_sums = self.bond_sums()
+        magnetizations = self.magnetizations()
+        energies = -ham.J * bond_sums + ham.mu * magnetizations
+        ln_g = numpy.log(self.counts) + energies / temp
+        return DensityOfStates(self.N, bond_sums, magnetizations, ln_g)
+
+
+def reweight(histogram, ham, temp, new_temp, new_ham=None, full_output=False):
+    """
+    Extrapolates the thermal quantities of a single run to another temperature and Hamiltonian by
+    reweighting its joint histogram (Ferrenberg-Swendsen). Every sampled class is weighted by
+    exp(-E'/new_temp + E/temp), where E and E' are its energies under ham and new_ham.
+
+    The result is reliable while the reweighted distribution is carried by many sampled sweeps. The
+    effective sample size (sum of the weights)^2 / (sum of the squared weights) over the sampled sweeps
+    measures this: it equals the number of sweeps at the sampled point and drops as the new point moves
+    away. Because successive sweeps are correlated, the number of independent samples is about the
+    effective sample size divided by twice the integrated autocorrelation time of the run. Points whose
+    "overlap" (the effective sample size over the number of sweeps) falls below a few percent should not
+    be trusted.
+
+    Parameters
+    ----------
+    histogram : JointHistogram
+        The histogram of the run, e.g. info["histogram"] of montecarlo_metropolis called with
+        histogram=True.
+    ham : Hamiltonian
+        The Hamiltonian the histogram was sampled with.
+    temp : float
+        The temperature the histogram was sampled at.
+    new_temp : float
+        The temperature to extrapolate to.
+    new_ham : Hamiltonian, default: None
+        The Hamiltonian to extrapolate to, e.g. with a different mu. It must have the same boundary
+        conditions as ham. If None, ham is used.
+    full_output : bool, default: False
+        If True, a dictionary with the reliability of the reweighting is returned as a fifth value.
+
+    Returns
+    -------
+    avg_energy : float
+        The reweighted average energy.
+    avg_mag : float
+        The reweighted average magnetization.
+    heat_cap : float
+        The reweighted heat capacity.
+    mag_susceptibility : float
+        The reweighted magnetic susceptibility.
+    info : dict
+        Only returned if full_output is True. Contains the effective sample size ("effective_samples")
+        and its ratio to the number of sweeps in the histogram ("overlap").
+    """
+    if new_ham is None:
+        new_ham = ham
+    dos = histogram.density_of_states(ham, temp)
+    avg_energy, avg_mag, heat_cap, mag_susceptibility = dos.thermal_quantities(new_ham, new_temp)
+
+    if full_output:
+        # probability of every class at the new point, divided by its count, is the weight of one sweep
+        probabilities = dos.probabilities(new_ham, new_temp)
+        weights = probabilities / histogram.counts
+        effective_samples = float(
+            numpy.sum(histogram.counts * weights) ** 2 / numpy.sum(histogram.counts * weights**2)
+        )
+        info = {
+            "effective_samples": effective_samples,
+            "overlap": effective_samples / histogram.count,
+        }
+        return avg_energy, avg_mag, heat_cap, mag_susceptibility, info
+    return avg_energy, avg_mag, heat_cap, mag_susceptibility
@@ -0,0 +1,363 @@
+"""
+Simulated annealing search for the lowest-energy configuration of the Ising chain.
+
+Every restart starts from a random configuration and performs metropolis sweeps while the temperature is
+lowered, either geometrically from t_initial to t_final or adaptively, so that the fraction of accepted
+flips follows a target that decays geometrically. Like every other sampler of this package, the search
+works with the energy of the Hamiltonian, which only depends on the bond sum and the magnetization; these
+are updated with every accepted flip, so the energy never drifts. Chains with couplings or fields that
+differ from bond to bond or from site to site (disordered chains) are not supported.
+
+The lowest-energy configuration of a restart is tracked without copying the chain on every improvement:
+the sites where the current configuration differs from the best one are kept in a list, and on an
+improvement only those sites are copied. Every flip adds or removes at most one entry, so the tracking
+costs O(1) per accepted flip.
+"""
+import concurrent.futures
+import math
+import time
+
+import numpy
+
+from .backends import get_backend, bond_energy, flip_deltas, jit_kernel, BLOCK_UNIFORMS
+from .random_streams import draw_uniforms, random_configuration, spawn_seeds
+from .configurations import to_spin_configuration
+
+__all__ = ["simulated_annealing"]
+
+# gain of the adaptive schedule: the change of ln T per unit change of the log acceptance
+_ADAPTIVE_GAIN = 0.2
+
+# largest change of ln T per sweep in the adaptive schedule
+_ADAPTIVE_MAX_STEP = 0.1
+
+
+def simulated_annealing(
+    N,
+    ham,
+    sweeps=1000,
+    n_restarts=16,
+    schedule="geometric",
+    t_initial=None,
+    t_final=None,
+    target_acceptance=(0.5, None),
+    plateau_sweeps=None,
+    target_energy=None,
+    seed=None,
+    processes=None,
+    full_output=False,
+):
+    """
+    Searches for the lowest-energy configuration of an N-spin chain with independent simulated annealing
+    restarts, and returns the best configuration found with time-to-solution statistics of the restarts.
+    The couplings and fields are the uniform J and mu of ham; disordered chains are not supported.
+
+    Parameters
+    ----------
+    N : int
+        The number of sites in the spin system.
+    ham : Hamiltonian
+        The Hamiltonian used to describe the spin system.
+    sweeps : int, default: 1000
+        The largest number of sweeps of a restart.
+    n_restarts : int, default: 16
+        The number of independent restarts.
+    schedule : str, default: "geometric"
+        The cooling schedule. "geometric" lowers the temperature by a constant factor per sweep from
+        t_initial to t_final. "adaptive" changes the temperature after every sweep so that the fraction of
+        accepted flips follows target_acceptance, between t_final and t_initial.
+    t_initial : float, default: None
+        The initial temperature. If None, the largest energy change of a single flip is accepted with
+        probability 1/2 at it.
+    t_final : float, default: None
+        The final temperature. If None, twice the smaller nonzero value of |J| and |mu| is accepted as an
+        energy change with probability 1 / (100 N) at it.
+    target_acceptance : tuple, default: (0.5, None)
+        The initial and the final fraction of accepted flips of the adaptive schedule, between which the
+        target decays geometrically. A final value of None is 0.5 / N, half a flip per sweep.
+    plateau_sweeps : int, default: None
+        If given, a restart ends once its lowest energy has not decreased for this many sweeps.
+    target_energy : float, default: None
+        If given, a restart ends once it reaches this energy, and a restart is successful in the
+        time-to-solution statistics if it reached it. If None, a restart is successful if it reached the
+        lowest energy found by all restarts.
+    seed : int or numpy.random.SeedSequence, default: None
+        The root seed from which the random number generator of every restart is spawned. If None, the
+        random module is used, unless processes is given, in which case a fresh seed is drawn.
+    processes : int, default: None
+        The number of worker processes the restarts are split over. The results do not depend on it. If
+        None or 1, the restarts run in this process.
+    full_output : bool, default: False
+        If True, a dictionary with additional information about the restarts is returned as a fourth value.
+
+    Returns
+    -------
+    best_spins : SpinConfiguration
+        The lowest-energy configuration found.
+    best_energy : float
+        Its energy.
+    time_to_solution : dict
+        The time-to-solution statistics of the restarts: the fraction of successful restarts
+        ("success_probability"), the mean number of sweeps of a restart ("mean_sweeps"), the number of
+        sweeps after which every successful restart first reached its lowest energy ("sweeps_to_solution",
+        nan for the others), the number of sweeps needed to succeed at least once with probability 0.99
+        ("tts99", inf if no restart succeeded), and the same in seconds ("tts99_seconds").
+    info : dict
+        Only returned if full_output is True. Contains the lowest energy of every restart ("energies"), the
+        number of sweeps it ran ("sweeps"), its run time in seconds ("seconds"), its temperature after
+        every sweep ("temperatures", nan after it ended), and the lowest-energy configuration of every
+        restart as an array of 0's and 1's ("best_configs").
+    """
+    if schedule not in ["geometric", "adaptive"]:
+        raise ValueError('schedule must be "geometric" or "adaptive".')
+    periodic = ham.doPeriodicBoundaryConditions
+
+    # the largest energy change of a single flip and the smaller of |J| and |mu| set the default temperatures
+    scale = 4 * abs(ham.J) + 2 * abs(ham.mu)
+    magnitudes = [abs(value) for value in [ham.J, ham.mu] if value != 0]
+    if t_initial is None:
+        t_initial = max(scale, 1e-12) / math.log(2)
+    if t_final is None:
+        smallest = 2 * min(magnitudes) if len(magnitudes) > 0 else 1.0
+        t_final = min(smallest / math.log(100 * N), t_initial)
+    initial_acceptance, final_acceptance = target_acceptance
+    if final_acceptance is None:
+        final_acceptance = 0.5 / N
+    tolerance = 1e-9 * max(1.0, N * (abs(ham.J) + abs(ham.mu)))
+
+    if processes is not None and processes > 1 and seed is None:
+        seed = numpy.random.SeedSequence()
+    seeds = [None] * n_restarts if seed is None else spawn_seeds(seed, n_restarts)
+    tasks = [
+        (
+            N,
+            ham,
+            schedule == "adaptive",
+            t_initial,
+            t_final,
+            initial_acceptance,
+            final_acceptance,
+            sweeps,
+            0 if plateau_sweeps is None else plateau_sweeps,
+            -numpy.inf if target_energy is None else target_energy + tolerance,
+            tolerance,
+            seeds[r],
+        )
+        for r in range(n_restarts)
+    ]
+    if processes is not None and processes > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as executor:
+            results = list(executor.map(_anneal_restart, tasks))
+    else:
+        results = [_anneal_restart(task) for task in tasks]
+
+    best_configs = numpy.array([result[0] for result in results])
+    energies = numpy.array([result[1] for result in results])
+    best_sweeps = numpy.array([result[2] for result in results], dtype=float)
+    run_sweeps = numpy.array([result[3] for result in results])
+    seconds = numpy.array([result[4] for result in results])
+    best = int(numpy.argmin(energies))
+
+    # a restart succeeds if it reaches the target, or else the lowest energy of all restarts
+    if target_energy is None:
+        success = energies <= energies[best] + tolerance
+    else:
+        success = energies <= target_energy + tolerance
+    probability = float(numpy.mean(success))
+    mean_sweeps = float(numpy.mean(run_sweeps))
+    mean_seconds = float(numpy.mean(seconds))
+    if probability >= 0.99:
+        repetitions = 1.0
+    elif probability > 0:
+        repetitions = math.log(0.01) / math.log(1 - probability)
+    else:
+        repetitions = numpy.inf
+    time_to_solution = {
+        "success_probability": probability,
+        "mean_sweeps": mean_sweeps,
+        "sweeps_to_solution": numpy.where(success, best_sweeps, numpy.nan).tolist(),
+        "tts99": repetitions * mean_sweeps,
+        "tts99_seconds": repetitions * mean_seconds,
+    }
+
+    best_spins = to_spin_configuration(best_configs[best])
+    best_energy = float(energies[best])
+    if full_output:
+        info = {
+            "energies": energies.tolist(),
+            "sweeps": run_sweeps.tolist(),
+            "seconds": seconds.tolist(),
+            "temperatures": numpy.array([result[5] for result in results]),
+            "best_configs": best_configs,
+        }
+        return best_spins, best_energy, time_to_solution, info
+    return best_spins, best_energy, time_to_solution
+
+
+def _anneal_restart(task):
+    """
+    Runs one restart and returns its lowest-energy configuration, that energy, the number of sweeps after
+    which it was first reached, the number of sweeps run, the run time and the temperature of every sweep.
+    """
+    (
+        N,
+        ham,
+        adaptive,
+        t_initial,
+        t_final,
+        initial_acceptance,
+        final_acceptance,
+        sweeps,
+        plateau_sweeps,
+        target_energy,
+        tolerance,
+        seed,
+    ) = task
+    start = time.perf_counter()
+    rng = None if seed is None else numpy.random.default_rng(seed)
+    config = random_configuration(rng, N)
+    best_config = config.copy()
+    bond_sum, magnetization = get_backend("numpy").energy(config, ham)
+    best_energy = bond_energy(ham, bond_sum, magnetization)
+
+    # the sites where config differs from best_config, and the position of every site in that list
+    differs = numpy.zeros(N, dtype=numpy.bool_)
+    diff_sites = numpy.zeros(N, dtype=numpy.int64)
+    diff_positions = numpy.zeros(N, dtype=numpy.int64)
+    n_diff = 0
+
+    steps = numpy.arange(sweeps)
+    fraction = steps / max(sweeps - 1, 1)
+    if adaptive:
+        temperatures = numpy.full(sweeps, numpy.nan)
+        targets = initial_acceptance * (final_acceptance / initial_acceptance) ** fraction
+    else:
+        temperatures = t_initial * (t_final / t_initial) ** fraction
+        targets = numpy.zeros(sweeps)
+    log_t = math.log(t_initial)
+    log_t_bounds = numpy.array(sorted([math.log(t_final), math.log(t_initial)]))
+
+    block_size = max(1, BLOCK_UNIFORMS // N)
+    done = 0
+    best_sweep = 0
+    while done < sweeps:
+        n_sweeps = min(block_size, sweeps - done)
+        uniforms = draw_uniforms(rng, n_sweeps, N)
+        n_done, n_diff, bond_sum, magnetization, best_energy, best_sweep, log_t = _anneal_kernel(
+            config,
+            best_config,
+            differs,
+            diff_sites,
+            diff_positions,
+            n_diff,
+            ham.doPeriodicBoundaryConditions,
+            float(ham.J),
+            float(ham.mu),
+            adaptive,
+            temperatures[done : done + n_sweeps],
+            targets[done : done + n_sweeps],
+            log_t,
+            log_t_bounds,
+            bond_sum,
+            magnetization,
+            best_energy,
+            done,
+            best_sweep,
+            plateau_sweeps,
+            target_energy,
+            tolerance,
+            uniforms,
+        )
+        done += n_done
+        if n_done < n_sweeps:
+            break
+    temperatures[done:] = numpy.nan
+    return best_config, best_energy, best_sweep, done, time.perf_counter() - start, temperatures
+
+
+@jit_kernel
+def _anneal_kernel(
+    config,
+    best_config,
+    differs,
+    diff_sites,
+    diff_positions,
+    n_diff,
+    periodic,
+    coupling,
+    field,
+    adaptive,
+    temperatures,
+    targets,
+    log_t,
+    log_t_bounds,
+    bond_sum,
+    magnetization,
+    best_energy,
+    first_sweep,
+    best_sweep,
+    plateau_sweeps,
+    target_energy,
+    tolerance,
+    uniforms,
+):
+    """
+    Performs one metropolis sweep of the sites in order per row of uniforms, updating config, the best
+    configuration and the list of sites where they differ in place. With the adaptive schedule the
+    temperature of every sweep is written to temperatures, and otherwise read from it. Stops after the sweep
+    in which the restart reached target_energy or ran plateau_sweeps sweeps (if nonzero) without
+    improvement. Returns the number of sweeps performed, the length of the list, the bond sum, the
+    magnetization, the lowest energy, the number of sweeps after which it was reached and ln T. Compiled
+    with numba if it is installed.
+    """
+    n = config.shape[0]
+    n_sweeps = uniforms.shape[0]
+    for sweep in range(n_sweeps):
+        if adaptive:
+            temp = math.exp(log_t)
+            temperatures[sweep] = temp
+        else:
+            temp = temperatures[sweep]
+        accepted = 0
+        for i in range(n):
+            delta_bond, delta_mag = flip_deltas(config, i, periodic)
+            delta_energy = -coupling * delta_bond + field * delta_mag
+            if delta_energy > 0 and uniforms[sweep, i] >= math.exp(-delta_energy / temp):
+                continue
+            config[i] = 1 - config[i]
+            bond_sum += delta_bond
+            magnetization += delta_mag
+            accepted += 1
+            # adds the site to the list of differing sites, or removes it by moving the last entry
+            if differs[i]:
+                n_diff -= 1
+                last = diff_sites[n_diff]
+                diff_sites[diff_positions[i]] = last
+                diff_positions[last] = diff_positions[i]
+                differs[i] = False
+            else:
+                diff_sites[n_diff] = i
+                diff_positions[i] = n_diff
+                differs[i] = True
+                n_diff += 1
+            energy = -coupling * bond_sum + field * magnetization
+            if energy < best_energy - tolerance:
+                for k in range(n_diff):
+                    site = diff_sites[k]
+                    best_config[site] = config[site]
+                    differs[site] = False
+                n_diff = 0
+                best_energy = energy
+                best_sweep = first_sweep + sweep + 1
+        if adaptive:
+            # ln T moves toward the temperature at which the acceptance matches the target
+            acceptance = max(accepted / n, 0.5 * targets[sweep])
+            step = _ADAPTIVE_GAIN * (math.log(targets[sweep]) - math.log(acceptance))
+            step = min(max(step, -_ADAPTIVE_MAX_STEP), _ADAPTIVE_MAX_STEP)
+            log_t = min(max(log_t + step, log_t_bounds[0]), log_t_bounds[1])
+        done = first_sweep + sweep + 1
+        if best_energy <= target_energy or (
+            plateau_sweeps > 0 and done - best_sweep >= plateau_sweeps
+        ):
+            return sweep + 1, n_diff, bond_sum, magnetization, best_energy, best_sweep, log_t
+    return n_sweeps, n_diff, bond_sum, magnetization, best_energy, best_sweep, log_t
@@ -4,10 +4,14 @@ Unit and regression test for the montecarlo package.
 
 # Import package, test suite, and other packages as needed
 import sys
+import itertools
+import math
 
 import pytest
+import numpy
 
 import montecarlo
+from montecarlo.montecarlo_metropolis import _check_tracked_values
 
 import random
 
@@ -167,3 +171,1296 @@ def test_montecarlo_metropolis():
     assert round(magnetizations[index], 0) == -1
     assert round(heat_caps[index], 0) == 0
     assert round(mag_susts[index], 0) == 1
+
+
+def test_metropolis_sweep_tracked():
+    ham = montecarlo.Hamiltonian()
+    ham.initialize(-2, 1.1, True)
+    conf = montecarlo.SpinConfiguration()
+
+    # checks that the tracked sweep gives the same configuration as metropolis_sweep
+    random.seed(2)
+    conf.randomize(8)
+    energy = ham.compute_energy(conf)
+    mag = conf.compute_magnetization()
+    conf2, energy, mag = ham.metropolis_sweep_tracked(conf, 1, energy, mag)
+    assert conf2.get_spins() == [1, 0, 0, 1, 0, 0, 1, 0]
+
+
+def test_metropolis_sweep_tracked_values():
+    ham = montecarlo.Hamiltonian()
+    conf = montecarlo.SpinConfiguration()
+
+    # checks that the tracked values stay equal to a full recomputation
+    for periodic_flag in [True, False]:
+        ham.initialize(-1.3, 0.7, periodic_flag)
+        random.seed(5)
+        conf.randomize(11)
+        energy = ham.compute_energy(conf)
+        mag = conf.compute_magnetization()
+        for i in range(20):
+            conf, energy, mag = ham.metropolis_sweep_tracked(conf, 2, energy, mag)
+            assert round(energy, 8) == round(ham.compute_energy(conf), 8)
+            assert mag == conf.compute_magnetization()
+
+
+def test_montecarlo_metropolis_check_interval():
+    ham = montecarlo.Hamiltonian()
+    ham.initialize(-2, 1.1, True)
+
+    # checks that the debug mode of montecarlo_metropolis runs and leaves the results unchanged
+    random.seed(2)
+    energy, mag, heat_cap, mag_sust = montecarlo.montecarlo_metropolis(
+        8, ham, 10, 1000, 100, check_interval=10
+    )
+    random.seed(2)
+    assert montecarlo.montecarlo_metropolis(8, ham, 10, 1000, 100) == (
+        energy,
+        mag,
+        heat_cap,
+        mag_sust,
+    )
+
+    # checks that drifted values are detected
+    conf = montecarlo.SpinConfiguration()
+    conf.initialize([1, 1, 1, 1])
+    with pytest.raises(RuntimeError):
+        _check_tracked_values(ham, conf, 0.0, 4)
+
+
+def test_available_backends():
+    names = montecarlo.available_backends()
+    assert "python" in names and "numpy" in names
+
+    # checks the default backend selection and the error for unknown backends
+    montecarlo.set_default_backend("python")
+    assert montecarlo.get_backend().name == "python"
+    montecarlo.set_default_backend("numpy")
+    with pytest.raises(ValueError):
+        montecarlo.get_backend("fortran")
+
+
+def test_backends_sweep():
+    ham = montecarlo.Hamiltonian()
+    conf = montecarlo.SpinConfiguration()
+
+    # checks every backend against Hamiltonian.metropolis_sweep for the same random numbers
+    for periodic_flag in [True, False]:
+        ham.initialize(-2, 1.1, periodic_flag)
+        random.seed(2)
+        conf.randomize(9)
+        state = random.getstate()
+        reference = ham.metropolis_sweep(conf, 1)
+        random.setstate(state)
+        uniforms = numpy.array([random.random() for i in range(9)])
+        for name in montecarlo.available_backends():
+            config = numpy.array(conf.get_spins(), dtype=numpy.int8)
+            backend = montecarlo.get_backend(name)
+            delta_bond, delta_mag = backend.sweep(config, ham, 1, uniforms)
+            assert config.tolist() == reference.get_spins()
+            assert delta_mag == (
+                reference.compute_magnetization() - conf.compute_magnetization()
+            )
+            assert backend.energy(config, ham) == (
+                ham.compute_bond_sum(reference),
+                reference.compute_magnetization(),
+            )
+
+
+def test_backends_run():
+    ham = montecarlo.Hamiltonian()
+    ham.initialize(-2, 1.1, False)
+
+    # checks that the measurement loops of all backends agree
+    numpy.random.seed(3)
+    uniforms = numpy.random.random((50, 12))
+    start = numpy.random.randint(0, 2, 12).astype(numpy.int8)
+    results = []
+    for name in montecarlo.available_backends():
+        config = start.copy()
+        bond_sums, mags = montecarlo.get_backend(name).run(config, ham, 1.5, uniforms)
+        results.append((config.tolist(), bond_sums.tolist(), mags.tolist()))
+    assert all(result == results[0] for result in results)
+
+
+def test_montecarlo_metropolis_backends():
+    ham = montecarlo.Hamiltonian()
+    ham.initialize(-2, 1.1, True)
+
+    # checks that montecarlo_metropolis gives the same values with every backend
+    values = []
+    for name in montecarlo.available_backends():
+        random.seed(2)
+        values.append(montecarlo.montecarlo_metropolis(8, ham, 10, 200, 20, backend=name))
+    assert all(value == values[0] for value in values)
+
+
+def test_MomentAccumulator():
+    numpy.random.seed(4)
+    values = numpy.random.normal(2.0, 3.0, 1000) ** 2
+
+    # checks single additions against numpy
+    acc = montecarlo.MomentAccumulator()
+    for value in values:
+        acc.add(value)
+    assert acc.count == 1000
+    assert numpy.isclose(acc.mean(), numpy.mean(values))
+    assert numpy.isclose(acc.variance(), numpy.var(values))
+    for k in range(5):
+        assert numpy.isclose(acc.raw_moment(k), numpy.mean(values**k))
+        assert numpy.isclose(
+            acc.central_moment(k), numpy.mean((values - numpy.mean(values)) ** k)
+        )
+
+    with pytest.raises(ValueError):
+        acc.raw_moment(5)
+
+
+def test_MomentAccumulator_merge():
+    numpy.random.seed(4)
+    values = numpy.random.normal(2.0, 3.0, 1000) ** 2
+    acc = montecarlo.MomentAccumulator()
+    for value in values:
+        acc.add(value)
+
+    # checks that accumulators of separate parts merge into the accumulator of the whole
+    part1 = montecarlo.MomentAccumulator()
+    part2 = montecarlo.MomentAccumulator()
+    part1.add_array(values[:300])
+    part2.add_array(values[300:])
+    part1.merge(part2)
+    assert part1.count == acc.count
+    for k in range(5):
+        assert numpy.isclose(part1.raw_moment(k), acc.raw_moment(k))
+
+
+def test_binder_cumulant():
+    # checks the Binder cumulant for a constant magnetization
+    mag_acc = montecarlo.MomentAccumulator()
+    mag_acc.add_array([4, -4, 4])
+    assert numpy.isclose(montecarlo.binder_cumulant(mag_acc), 2 / 3)
+
+
+def test_montecarlo_metropolis_accumulators():
+    ham = montecarlo.Hamiltonian()
+    ham.initialize(-2, 1.1, True)
+
+    # checks the accumulators returned by montecarlo_metropolis
+    random.seed(2)
+    energy, mag, heat_cap, mag_sust, info = montecarlo.montecarlo_metropolis(
+        8, ham, 10, 1000, 100, full_output=True
+    )
+    assert info["energy"].count == 1000
+    assert info["energy"].mean() == energy
+    assert numpy.isclose(info["magnetization"].variance() / 10, mag_sust)
+    assert info["abs_magnetization"].mean() >= abs(mag)
+    assert info["binder_cumulant"] <= 2 / 3
+
+
+def test_BlockAccumulator():
+    # checks the binning analysis on uncorrelated values
+    numpy.random.seed(6)
+    values = numpy.random.normal(1.0, 2.0, 20000)
+    blocks = montecarlo.BlockAccumulator(["x"], max_blocks=16)
+    blocks.add_array(values[:777])
+    blocks.add_array(values[777:])
+    assert blocks.n_blocks < 16
+    assert blocks.count == 20000
+    assert numpy.isclose(blocks.mean("x"), numpy.mean(values))
+    assert 0.25 < blocks.tau_int("x") < 1.0
+    assert 0.5 < blocks.error("x") / (2.0 / numpy.sqrt(20000)) < 2.0
+    assert 0.5 < blocks.jackknife_error(lambda m: m["x"]) / blocks.error("x") < 2.0
+
+    with pytest.raises(ValueError):
+        montecarlo.BlockAccumulator(["x"], max_blocks=7)
+
+
+def test_BlockAccumulator_correlated():
+    # checks that correlated values (each repeated 10 times) give a longer autocorrelation time
+    numpy.random.seed(6)
+    values = numpy.random.normal(1.0, 2.0, 2000)
+    blocks = montecarlo.BlockAccumulator(["x"])
+    blocks.add_array(numpy.repeat(values, 10))
+    assert blocks.tau_int("x") > 3
+
+
+def test_BlockAccumulator_large_mean():
+    # a large mean does not cancel the variance of the autocorrelation time
+    values = 1e8 + numpy.random.default_rng(3).normal(size=20000)
+    blocks = montecarlo.BlockAccumulator(["x"], max_blocks=16)
+    blocks.add_array(values)
+    assert numpy.isclose(blocks.mean("x"), numpy.mean(values))
+    assert 0.25 < blocks.tau_int("x") < 1.0
+
+
+def test_BlockAccumulator_merge():
+    values = numpy.random.default_rng(4).normal(1.0, 2.0, (5000, 2))
+    whole = montecarlo.BlockAccumulator(["x", "y"], max_blocks=16)
+    whole.add_array(values)
+    merged = montecarlo.BlockAccumulator(["x", "y"], max_blocks=16)
+    merged.add_array(values[:1234])
+    part = montecarlo.BlockAccumulator(["x", "y"], max_blocks=16)
+    part.add_array(values[1234:])
+    merged.merge(part)
+    assert merged.count == whole.count
+    assert numpy.isclose(merged.mean("y"), whole.mean("y"))
+    assert numpy.isclose(merged.moments[0].variance(), numpy.var(values[:, 0]))
+    assert merged.n_blocks <= 16 and merged.block_size >= part.block_size
+    assert 0.25 < merged.tau_int("x") < 1.0
+
+    with pytest.raises(ValueError):
+        merged.merge(montecarlo.BlockAccumulator(["x"], max_blocks=16))
+
+
+def test_ThermalAccumulator_merge():
+    rng = numpy.random.default_rng(5)
+    energies = rng.normal(-10, 2, 3000)
+    mags = rng.integers(-8, 9, 3000)
+    whole = montecarlo.ThermalAccumulator()
+    whole.add_array(energies, mags)
+    merged = montecarlo.ThermalAccumulator()
+    merged.add_array(energies[:1000], mags[:1000])
+    part = montecarlo.ThermalAccumulator()
+    part.add_array(energies[1000:], mags[1000:])
+    merged.merge(part)
+    assert numpy.allclose(merged.thermal_quantities(2.0), whole.thermal_quantities(2.0))
+    assert merged.info(2.0)["steps"] == 3000
+
+
+def test_montecarlo_metropolis_target_error():
+    ham = montecarlo.Hamiltonian()
+    ham.initialize(-2, 1.1, True)
+
+    # checks that montecarlo_metropolis stops once the requested error is reached
+    random.seed(2)
+    energy, mag, heat_cap, mag_sust, info = montecarlo.montecarlo_metropolis(
+        8, ham, 10, 100000, 100, target_error={"heat_capacity": 0.05}, full_output=True
+    )
+    assert info["steps"] < 100000
+    assert info["errors"]["heat_capacity"] <= 0.05 * heat_cap
+    assert abs(heat_cap - 0.326) < 5 * info["errors"]["heat_capacity"]
+    assert info["tau_int"]["energy"] > 0
+
+    with pytest.raises(ValueError):
+        montecarlo.montecarlo_metropolis(8, ham, 10, 100, target_error={"entropy": 0.1})
+
+
+def test_montecarlo_metropolis_auto_burn_in():
+    ham = montecarlo.Hamiltonian()
+    ham.initialize(-2, 1.1, True)
+
+    # checks that the automatic burn-in is reported and short at high temperature
+    random.seed(2)
+    energy, mag, heat_cap, mag_sust, info = montecarlo.montecarlo_metropolis(
+        8, ham, 10, 10000, "auto", full_output=True
+    )
+    assert 16 <= info["burn_steps"] <= 256
+    assert abs(energy + 3.68) < 0.3  # exact value: -3.68
+
+
+def test_detect_equilibration():
+    ham = montecarlo.Hamiltonian()
+    ham.initialize(-2, 1.1, True)
+
+    # checks the hot/cold test and that the burn-in never exceeds the maximum
+    random.seed(3)
+    config = numpy.zeros(64, dtype=numpy.int8)
+    steps = montecarlo.detect_equilibration(config, ham, 0.3, 500, method="hot_cold")
+    assert steps <= 500
+    with pytest.raises(ValueError):
+        montecarlo.detect_equilibration(config, ham, 1, 100, method="guess")
+
+
+def test_temperature_sweep_burn_in():
+    ham = montecarlo.Hamiltonian()
+    ham.initialize(-2, 1.1, True)
+
+    # checks that generate_montecarlo_thermal_quantities reports the burn-in of every point
+    random.seed(2)
+    results = montecarlo.generate_montecarlo_thermal_quantities(
+        8, ham, 5, 10, 2, 500, "auto", full_output=True
+    )
+    assert len(results[5]) == len(results[0]) == 3
+    assert all(info["burn_steps"] >= 16 for info in results[5])
+
+
+def test_spawn_generators():
+    # checks that spawned generators are reproducible and independent
+    gen1 = montecarlo.spawn_generators(7, 2)
+    gen2 = montecarlo.spawn_generators(7, 2)
+    assert gen1[0].random() == gen2[0].random()
+    assert gen1[0].random() != gen1[1].random()
+
+
+def test_parallel_temperature_sweep():
+    ham = montecarlo.Hamiltonian()
+    ham.initialize(-2, 1.1, True)
+
+    # checks that serial and parallel sweeps give identical results for the same seed
+    serial = montecarlo.generate_montecarlo_thermal_quantities(
+        8, ham, 1, 10, 3, 300, 30, seed=11
+    )
+    parallel = montecarlo.generate_montecarlo_thermal_quantities(
+        8, ham, 1, 10, 3, 300, 30, seed=11, processes=2
+    )
+    assert serial == parallel
+    assert len(serial[0]) == 3
+
+
+def test_temperature_sweep_seed():
+    ham = montecarlo.Hamiltonian()
+    ham.initialize(-2, 1.1, True)
+
+    # checks that a different seed gives different results
+    results = montecarlo.generate_montecarlo_thermal_quantities(
+        8, ham, 1, 10, 3, 300, 30, seed=11
+    )
+    other = montecarlo.generate_montecarlo_thermal_quantities(
+        8, ham, 1, 10, 3, 300, 30, seed=12
+    )
+    assert other[1] != results[1]
+
+
+def test_montecarlo_metropolis_initial_spins():
+    ham = montecarlo.Hamiltonian()
+    ham.initialize(-2, 1.1, True)
+
+    # checks that a run can start from a given configuration and returns its final configuration
+    conf = montecarlo.SpinConfiguration()
+    conf.initialize([0, 1] * 8)
+    random.seed(2)
+    results = montecarlo.montecarlo_metropolis(
+        16, ham, 0.1, 50, 0, initial_spins=conf, full_output=True
+    )
+    assert results[0] == -32  # the ground state is kept at very low temperature
+    assert results[4]["final_spins"].get_spins() == [0, 1] * 8
+
+
+def test_annealed_temperature_sweep():
+    ham = montecarlo.Hamiltonian()
+    ham.initialize(-2, 1.1, True)
+
+    # checks cooling and heating walks
+    for cooling in [True, False]:
+        temps, energies, mags, heat_caps, mag_susts, infos = montecarlo.annealed_thermal_quantities(
+            16, ham, 0.5, 5, 1.5, 500, 200, cooling=cooling, seed=3, full_output=True
+        )
+        assert len(energies) == len(temps) == 3
+        assert energies[0] < energies[1] < energies[2]
+        first = 2 if cooling else 0
+        assert infos[first]["burn_steps"] == 200
+        assert all(info["burn_steps"] <= 200 for info in infos)
+
+
+def test_backends_batch_run():
+    ham = montecarlo.Hamiltonian()
+    ham.initialize(-2, 1.1, True)
+
+    # checks the batched sweep of every backend against single-chain runs
+    rng = numpy.random.default_rng(1)
+    start = rng.integers(0, 2, (5, 9), dtype=numpy.int8)
+    uniforms = rng.random((6, 5, 9))
+    temps = [0.5, 1, 2, 3, 4]
+    for name in montecarlo.available_backends():
+        backend = montecarlo.get_backend(name)
+        configs = start.copy()
+        bond_sums, mags = backend.batch_run(configs, ham, temps, uniforms)
+        for r in range(5):
+            config = start[r].copy()
+            bond_sums_r, mags_r = backend.run(config, ham, temps[r], uniforms[:, r])
+            assert config.tolist() == configs[r].tolist()
+            assert bond_sums_r.tolist() == bond_sums[:, r].tolist()
+
+
+def test_parallel_tempering():
+    ham = montecarlo.Hamiltonian()
+    ham.initialize(-2, 1.1, True)
+    conf_sys = montecarlo.SpinConfigurationSystem()
+    conf_sys.initialize(8)
+
+    # checks parallel tempering against the exact values (temperatures given out of order)
+    temps = [2.0, 0.5, 1.0, 1.5]
+    energies, mags, heat_caps, mag_susts, info = montecarlo.parallel_tempering(
+        8, ham, temps, 4000, 200, rng=numpy.random.default_rng(2), full_output=True
+    )
+    for i in range(4):
+        assert abs(energies[i] - ham.compute_average_energy(temps[i], conf_sys)) < 0.3
+    assert len(info["swap_acceptance"]) == 3
+    assert all(0 < rate <= 1 for rate in info["swap_acceptance"])
+    assert len(info["round_trip_times"]) > 0
+    assert info["points"][1]["steps"] == 4000
+
+
+def test_cluster_montecarlo():
+    conf_sys = montecarlo.SpinConfigurationSystem()
+    conf_sys.initialize(8)
+    ham = montecarlo.Hamiltonian()
+
+    # checks both cluster algorithms against the exact values, with and without a field
+    for J, mu in [(2, 1.1), (-2, 0)]:
+        ham.initialize(J, mu, True)
+        for algorithm in ["swendsen_wang", "wolff"]:
+            energy, mag, heat_cap, mag_sus = montecarlo.cluster_montecarlo(
+                8, ham, 1.5, 20000, 100, algorithm, rng=numpy.random.default_rng(1)
+            )
+            assert abs(energy - ham.compute_average_energy(1.5, conf_sys)) < 0.2
+            assert abs(mag - ham.compute_average_mag(1.5, conf_sys)) < 0.1
+            exact_sus = ham.compute_mag_susceptibility(1.5, conf_sys)
+            assert abs(mag_sus - exact_sus) < 0.05 * exact_sus + 0.02
+
+    with pytest.raises(ValueError):
+        montecarlo.cluster_montecarlo(8, ham, 1.0, 10, algorithm="heat_bath")
+
+
+def test_swendsen_wang_open_boundaries():
+    ham = montecarlo.Hamiltonian()
+    ham.initialize(2, 0, False)
+
+    # checks that clusters follow the boundary conditions: with open boundaries the two halves of a
+    # frozen ferromagnetic chain are never joined across the ends
+    config = numpy.array([0, 0, 0, 0, 1, 1, 1, 1], dtype=numpy.int8)
+    uniforms = numpy.zeros(25)
+    uniforms[16:] = [0.9, 0.1] + [0.9] * 7  # flip only the second cluster
+    montecarlo.swendsen_wang_update(config, ham, 1.0, uniforms)
+    assert config.tolist() == [0, 0, 0, 0, 0, 0, 0, 0]
+
+
+def test_cluster_montecarlo_decorrelation():
+    ham = montecarlo.Hamiltonian()
+    ham.initialize(2, 0, True)
+
+    # checks that the cluster updates decorrelate a cold ferromagnetic chain
+    info = montecarlo.cluster_montecarlo(
+        32, ham, 0.7, 2000, 100, "wolff", rng=numpy.random.default_rng(2), full_output=True
+    )[4]
+    assert info["improved_tau_int"] < 5
+    assert info["mean_cluster_size"] > 16
+
+
+def test_heat_bath_acceptance():
+    ham = montecarlo.Hamiltonian()
+    ham.initialize(-2, 1.1, True)
+
+    # checks the heat-bath flip probabilities, including flips that would overflow the exponential
+    assert ham.flip_acceptance(0, 1.0, "heat_bath") == 0.5
+    assert numpy.isclose(
+        ham.flip_acceptance(1.0, 2.0, "heat_bath") + ham.flip_acceptance(-1.0, 2.0, "heat_bath"), 1
+    )
+    assert ham.flip_acceptance(1e5, 0.1, "heat_bath") == 0
+    assert ham.flip_acceptance(-1e5, 0.1, "heat_bath") == 1
+    with pytest.raises(ValueError):
+        ham.flip_probability_table(1.0, "glauber")
+
+
+def test_heat_bath_sweep():
+    ham = montecarlo.Hamiltonian()
+    ham.initialize(-2, 1.1, True)
+
+    # checks that heat_bath_sweep and every backend produce the same configurations
+    spins = montecarlo.SpinConfiguration()
+    spins.initialize([0, 1, 1, 0, 0, 0, 1, 0])
+    random.seed(3)
+    new_spins = ham.heat_bath_sweep(spins, 1.5)
+    random.seed(3)
+    uniforms = numpy.array([[random.random() for i in range(8)]])
+    for name in montecarlo.available_backends():
+        config = numpy.array(spins.get_spins(), dtype=numpy.int8)
+        montecarlo.get_backend(name).run(config, ham, 1.5, uniforms, "heat_bath")
+        assert config.tolist() == new_spins.get_spins()
+
+
+def test_heat_bath_montecarlo():
+    ham = montecarlo.Hamiltonian()
+    ham.initialize(-2, 1.1, True)
+    conf_sys = montecarlo.SpinConfigurationSystem()
+    conf_sys.initialize(8)
+
+    # checks the heat-bath sampling against the exact values
+    energy, mag, heat_cap, mag_sus = montecarlo.montecarlo_metropolis(
+        8, ham, 1.5, 20000, 500, rng=numpy.random.default_rng(5), rule="heat_bath"
+    )
+    assert abs(energy - ham.compute_average_energy(1.5, conf_sys)) < 0.2
+    assert abs(mag - ham.compute_average_mag(1.5, conf_sys)) < 0.1
+
+
+def test_nfold_way():
+    conf_sys = montecarlo.SpinConfigurationSystem()
+    conf_sys.initialize(8)
+    ham = montecarlo.Hamiltonian()
+
+    # checks the time-weighted averages against the exact values, with both boundary conditions
+    for periodic in [True, False]:
+        ham.initialize(-2, 1.1, periodic)
+        energy, mag, heat_cap, mag_sus, info = montecarlo.nfold_way(
+            8, ham, 1.5, 20000, 100, rng=numpy.random.default_rng(6), full_output=True
+        )
+        assert abs(energy - ham.compute_average_energy(1.5, conf_sys)) < 0.15
+        assert abs(mag - ham.compute_average_mag(1.5, conf_sys)) < 0.05
+        assert abs(heat_cap - ham.compute_heat_capacity(1.5, conf_sys)) < 0.3
+        assert info["steps"] == 20000
+        # far fewer flips than attempted metropolis updates
+        assert info["events"] < 20000 * 8 / 4
+
+
+def test_nfold_way_frozen():
+    ham = montecarlo.Hamiltonian()
+    ham.initialize(-2, 1.1, True)
+
+    # checks that a frozen configuration is handled
+    ground_state = montecarlo.SpinConfiguration()
+    ground_state.initialize([0, 1, 0, 1, 0, 1, 0, 1])
+    energy, mag, heat_cap, mag_sus = montecarlo.nfold_way(
+        8, ham, 0.001, 100, initial_spins=ground_state
+    )
+    assert energy == -16 and mag == 0 and heat_cap == 0
+
+
+def test_block_random_numbers():
+    ham = montecarlo.Hamiltonian()
+    ham.initialize(-2, 1.1, True)
+    conf = montecarlo.SpinConfiguration()
+    conf.initialize([0, 1, 1, 0, 1, 1, 1, 0, 0, 1])
+
+    # checks that the compatibility mode consumes random.random exactly like a per-site sweep
+    random.seed(11)
+    new_conf, energy, mag = ham.metropolis_sweep_tracked(
+        conf, 1.3, ham.compute_energy(conf), conf.compute_magnetization()
+    )
+    random.seed(11)
+    config = numpy.array(conf.get_spins(), dtype=numpy.int8)
+    montecarlo.get_backend("python").sweep(
+        config, ham, 1.3, [random.random() for i in range(10)]
+    )
+    assert new_conf.get_spins() == config.tolist()
+    assert numpy.isclose(energy, ham.compute_energy(new_conf))
+    assert mag == new_conf.compute_magnetization()
+
+
+def test_metropolis_sweep_generator():
+    ham = montecarlo.Hamiltonian()
+    ham.initialize(-2, 1.1, True)
+    conf = montecarlo.SpinConfiguration()
+    conf.initialize([0, 1, 1, 0, 1, 1, 1, 0, 0, 1])
+
+    # checks that a generator gives reproducible sweeps that leave the random module alone
+    random.seed(1)
+    state = random.getstate()
+    sweeps = [
+        ham.metropolis_sweep(conf, 1.3, rng=numpy.random.default_rng(8)).get_spins()
+        for i in range(2)
+    ]
+    assert sweeps[0] == sweeps[1]
+    assert random.getstate() == state
+
+
+def test_counter_rng():
+    # checks that any range of sweeps can be regenerated on its own
+    rng = montecarlo.CounterRNG(12, chain=3)
+    uniforms = rng.uniforms(10, 7)
+    assert rng.sweep_uniforms(4, 3, 7).tolist() == uniforms[4:7].tolist()
+    assert montecarlo.CounterRNG(12, chain=4).uniforms(10, 7).tolist() != uniforms.tolist()
+
+
+def test_counter_rng_resume():
+    ham = montecarlo.Hamiltonian()
+    ham.initialize(-2, 1.1, True)
+
+    # checks that a chain can be resumed from the middle
+    full = montecarlo.montecarlo_metropolis(
+        8, ham, 2, 100, rng=montecarlo.CounterRNG(12), full_output=True
+    )[4]["final_spins"]
+    half = montecarlo.montecarlo_metropolis(
+        8, ham, 2, 50, rng=montecarlo.CounterRNG(12), full_output=True
+    )[4]["final_spins"]
+    rng = montecarlo.CounterRNG(12)
+    rng.seek(50)
+    resumed = montecarlo.montecarlo_metropolis(
+        8, ham, 2, 50, rng=rng, initial_spins=half, full_output=True
+    )[4]["final_spins"]
+    assert resumed.get_spins() == full.get_spins()
+
+
+def test_counter_rng_temperature_sweep():
+    ham = montecarlo.Hamiltonian()
+    ham.initialize(-2, 1.1, True)
+
+    # checks that temperature points do not depend on how they are run
+    serial = montecarlo.generate_montecarlo_thermal_quantities(
+        8, ham, 1, 3, 0.5, 200, 20, seed=montecarlo.CounterRNG(9)
+    )
+    parallel = montecarlo.generate_montecarlo_thermal_quantities(
+        8, ham, 1, 3, 0.5, 200, 20, seed=montecarlo.CounterRNG(9), processes=2
+    )
+    assert serial == parallel
+    single = montecarlo.montecarlo_metropolis(
+        8, ham, serial[0][2], 200, 20, rng=montecarlo.CounterRNG(9, chain=2)
+    )
+    assert single[0] == serial[1][2]
+
+
+def test_checkpoint_arrays(tmp_path):
+    # checks that a checkpoint file round-trips its arrays
+    path = str(tmp_path / "arrays.npz")
+    montecarlo.save_checkpoint(path, {"a/b": numpy.arange(3), "text": "x"})
+    arrays = montecarlo.load_checkpoint(path)
+    assert arrays["a/b"].tolist() == [0, 1, 2] and str(arrays["text"]) == "x"
+
+
+def test_checkpoint_resume(tmp_path, monkeypatch):
+    metropolis_module = sys.modules["montecarlo.montecarlo_metropolis"]
+
+    ham = montecarlo.Hamiltonian()
+    ham.initialize(-2, 1.1, True)
+
+    # interrupts runs after a few checkpoints and checks that resuming reproduces them exactly
+    save = metropolis_module.save_checkpoint
+
+    def interrupting_save(path, arrays):
+        save(path, arrays)
+        interrupting_save.calls += 1
+        if interrupting_save.calls == 3:
+            raise KeyboardInterrupt
+
+    for seed, processes in [(None, None), (7, 2)]:
+        args = (256, ham, 1, 3, 0.5, 1000, 100)
+        random.seed(4)
+        reference = montecarlo.generate_montecarlo_thermal_quantities(
+            *args, seed=seed, processes=processes
+        )
+
+        path = str(tmp_path / ("run" + str(seed) + ".npz"))
+        interrupting_save.calls = 0
+        monkeypatch.setattr(metropolis_module, "save_checkpoint", interrupting_save)
+        monkeypatch.setattr(metropolis_module, "_CHECKPOINT_INTERVAL", 0)
+        random.seed(4)
+        with pytest.raises(KeyboardInterrupt):
+            montecarlo.generate_montecarlo_thermal_quantities(
+                *args, seed=seed, processes=processes, checkpoint=path
+            )
+        monkeypatch.setattr(metropolis_module, "save_checkpoint", save)
+
+        random.seed(5)
+        resumed = montecarlo.generate_montecarlo_thermal_quantities(
+            *args, seed=seed, processes=processes, checkpoint=path
+        )
+        assert resumed == reference
+
+    # checks that a checkpoint of another run is refused
+    with pytest.raises(ValueError):
+        montecarlo.generate_montecarlo_thermal_quantities(
+            256, ham, 1, 3, 0.5, 1000, 100, seed=8, checkpoint=path
+        )
+
+
+def test_wang_landau():
+    ham = montecarlo.Hamiltonian()
+    ham.initialize(-2, 1.1, True)
+
+    dos, info = montecarlo.wang_landau(
+        8, ham, 1e-5, rng=numpy.random.default_rng(1), full_output=True
+    )
+    assert info["converged"]
+    # the 8-site ring has 2 configurations with bond sum -8 (both with M = 0) and 2^8 in total
+    assert numpy.isclose(numpy.exp(dos.ln_g[dos.bond_sums == -8]).sum(), 2, rtol=0.05)
+
+
+def test_wang_landau_thermal_quantities():
+    conf_sys = montecarlo.SpinConfigurationSystem()
+    conf_sys.initialize(8)
+    ham = montecarlo.Hamiltonian()
+    ham.initialize(-2, 1.1, True)
+    dos = montecarlo.wang_landau(8, ham, 1e-5, rng=numpy.random.default_rng(1))
+
+    # checks the thermal quantities at other temperatures and fields against the exact values
+    temps, energies, mags, heat_caps, mag_susts = dos.generate_thermal_quantities(ham, 0.5, 4, 1.0)
+    for i in range(len(temps)):
+        assert abs(energies[i] - ham.compute_average_energy(temps[i], conf_sys)) < 0.05
+        assert abs(heat_caps[i] - ham.compute_heat_capacity(temps[i], conf_sys)) < 0.05
+    ham.initialize(1, -0.5, True)
+    energy, mag, heat_cap, mag_sus = dos.thermal_quantities(ham, 2)
+    assert abs(mag - ham.compute_average_mag(2, conf_sys)) < 0.05
+    assert abs(mag_sus - ham.compute_mag_susceptibility(2, conf_sys)) < 0.1
+
+
+def test_wang_landau_energy():
+    ham = montecarlo.Hamiltonian()
+    ham.initialize(-2, 1.1, True)
+    dos = montecarlo.wang_landau(8, ham, 1e-5, rng=numpy.random.default_rng(1))
+
+    # checks the density of states of the energy alone
+    energies, ln_g = dos.ln_g_energy(ham)
+    assert numpy.isclose(numpy.exp(ln_g).sum(), 2**8)
+    assert len(energies) == len(numpy.unique(energies))
+
+
+def test_reweighting():
+    ham = montecarlo.Hamiltonian()
+    ham.initialize(-2, 1.1, True)
+
+    results = montecarlo.montecarlo_metropolis(
+        8, ham, 2.0, 50000, 1000, rng=numpy.random.default_rng(3), histogram=True, full_output=True
+    )
+    histogram = results[4]["histogram"]
+    assert histogram.count == 50000
+
+    # reweighting to the sampled point reproduces the averages of the run
+    assert numpy.allclose(montecarlo.reweight(histogram, ham, 2.0, 2.0), results[:4])
+
+
+def test_reweighting_nearby():
+    conf_sys = montecarlo.SpinConfigurationSystem()
+    conf_sys.initialize(8)
+    ham = montecarlo.Hamiltonian()
+    ham.initialize(-2, 1.1, True)
+    histogram = montecarlo.montecarlo_metropolis(
+        8, ham, 2.0, 50000, 1000, rng=numpy.random.default_rng(3), histogram=True, full_output=True
+    )[4]["histogram"]
+
+    # reweighting to nearby temperatures and fields agrees with the exact values
+    for temp in [1.8, 2.4]:
+        energy, mag, heat_cap, mag_sus, info = montecarlo.reweight(
+            histogram, ham, 2.0, temp, full_output=True
+        )
+        assert abs(energy - ham.compute_average_energy(temp, conf_sys)) < 0.1
+        assert abs(heat_cap - ham.compute_heat_capacity(temp, conf_sys)) < 0.1
+        assert 0.5 < info["overlap"] < 1
+    new_ham = montecarlo.Hamiltonian()
+    new_ham.initialize(-2, 1.3, True)
+    energy, mag, heat_cap, mag_sus = montecarlo.reweight(histogram, ham, 2.0, 2.0, new_ham)
+    assert abs(mag - new_ham.compute_average_mag(2.0, conf_sys)) < 0.05
+
+
+def test_reweighting_overlap():
+    ham = montecarlo.Hamiltonian()
+    ham.initialize(-2, 1.1, True)
+    histogram = montecarlo.montecarlo_metropolis(
+        8, ham, 2.0, 50000, 1000, rng=numpy.random.default_rng(3), histogram=True, full_output=True
+    )[4]["histogram"]
+
+    # far from the sampled point the overlap collapses
+    new_ham = montecarlo.Hamiltonian()
+    new_ham.initialize(-2, -5, True)
+    info = montecarlo.reweight(histogram, ham, 2.0, 0.5, new_ham, full_output=True)[4]
+    assert info["overlap"] < 0.01
+
+
+def test_JointHistogram_merge():
+    ham = montecarlo.Hamiltonian()
+    ham.initialize(-2, 1.1, True)
+    histogram = montecarlo.montecarlo_metropolis(
+        8, ham, 2.0, 50000, 1000, rng=numpy.random.default_rng(3), histogram=True, full_output=True
+    )[4]["histogram"]
+
+    # histograms of separate runs merge, and survive get_state and set_state
+    other = montecarlo.JointHistogram(8)
+    other.set_state(histogram.get_state())
+    other.merge(histogram)
+    assert other.count == 100000
+    assert numpy.array_equal(other.counts, 2 * histogram.counts)
+
+
+def test_wham():
+    conf_sys = montecarlo.SpinConfigurationSystem()
+    conf_sys.initialize(8)
+    ham = montecarlo.Hamiltonian()
+    ham.initialize(-2, 1.1, True)
+
+    temps, energies, mags, heat_caps, mag_susts, info_list = (
+        montecarlo.generate_montecarlo_thermal_quantities(
+            8, ham, 0.8, 4.5, 0.6, m_steps=5000, seed=4, histogram=True, full_output=True
+        )
+    )
+    histograms = [info["histogram"] for info in info_list]
+    inefficiencies = [
+        2 * max(info["tau_int"]["energy"], info["tau_int"]["magnetization"])
+        for info in info_list
+    ]
+
+    # the combined histograms give the thermal quantities between the sampled temperatures
+    new_temps = [1.0, 1.7, 2.3, 3.5]
+    energies, mags, heat_caps, mag_susts, info = montecarlo.wham_thermal_quantities(
+        histograms,
+        ham,
+        temps,
+        new_temps,
+        statistical_inefficiencies=inefficiencies,
+        n_bootstrap=20,
+        rng=numpy.random.default_rng(0),
+        full_output=True,
+    )
+    assert info["wham"]["converged"]
+    for i, temp in enumerate(new_temps):
+        exact_energy = ham.compute_average_energy(temp, conf_sys)
+        exact_heat_cap = ham.compute_heat_capacity(temp, conf_sys)
+        assert 0 < info["errors"]["energy"][i] < 0.2
+        assert abs(energies[i] - exact_energy) < 4 * info["errors"]["energy"][i]
+        assert abs(heat_caps[i] - exact_heat_cap) < 4 * info["errors"]["heat_capacity"][i] + 0.01
+
+
+def test_wham_single_histogram():
+    ham = montecarlo.Hamiltonian()
+    ham.initialize(-2, 1.1, True)
+    histogram = montecarlo.montecarlo_metropolis(
+        8, ham, 0.8, 5000, rng=numpy.random.default_rng(4), histogram=True, full_output=True
+    )[4]["histogram"]
+
+    # a single histogram reduces to single-histogram reweighting
+    dos = montecarlo.wham([histogram], ham, [0.8])
+    assert numpy.allclose(
+        dos.thermal_quantities(ham, 1.0), montecarlo.reweight(histogram, ham, 0.8, 1.0)
+    )
+
+
+def test_population_annealing():
+    conf_sys = montecarlo.SpinConfigurationSystem()
+    conf_sys.initialize(8)
+    ham = montecarlo.Hamiltonian()
+    ham.initialize(-2, 1.1, True)
+
+    temps, energies, mags, heat_caps, mag_susts, info = montecarlo.population_annealing(
+        8,
+        ham,
+        0.5,
+        4,
+        0.5,
+        population=2000,
+        sweeps_per_step=5,
+        rng=numpy.random.default_rng(1),
+        full_output=True,
+    )
+    for i, temp in enumerate(temps):
+        exact_energy = ham.compute_average_energy(temp, conf_sys)
+        exact_heat_cap = ham.compute_heat_capacity(temp, conf_sys)
+        assert abs(energies[i] - exact_energy) < 4 * info["errors"]["energy"][i] + 0.01
+        assert abs(heat_caps[i] - exact_heat_cap) < 4 * info["errors"]["heat_capacity"][i] + 0.02
+        assert 0 < info["effective_population"][i] <= 1
+        assert 0 < info["families"][i] <= 2000
+        exact_free_energy = -temp * numpy.log(ham.partition_function(temp, conf_sys))
+        assert abs(info["free_energies"][i] - exact_free_energy) < 0.3
+
+
+def test_population_annealing_processes():
+    ham = montecarlo.Hamiltonian()
+    ham.initialize(-2, 1.1, True)
+
+    # the sweeps split over worker processes give the same results
+    results = montecarlo.population_annealing(
+        8, ham, 1, 3, 1, population=200, sweeps_per_step=2, rng=numpy.random.default_rng(2)
+    )
+    shared = montecarlo.population_annealing(
+        8,
+        ham,
+        1,
+        3,
+        1,
+        population=200,
+        sweeps_per_step=2,
+        rng=numpy.random.default_rng(2),
+        processes=2,
+    )
+    assert results == shared
+
+
+def test_creutz_demon():
+    ham = montecarlo.Hamiltonian()
+    ham.initialize(-2, 1.1, True)
+
+    temperature, avg_energy, avg_mag, info = montecarlo.creutz_demon(
+        100,
+        ham,
+        -150,
+        1000,
+        200,
+        n_chains=16,
+        n_demons=10,
+        rng=numpy.random.default_rng(0),
+        full_output=True,
+    )
+    # the chains take up most of the energy, the demons hold about T each
+    assert -150 - 10 * 3 * temperature < avg_energy < -150
+    assert 0 < info["errors"]["temperature"] < 0.05 * temperature
+    assert 0 < info["demon_energy"] < 3 * temperature
+
+    # the canonical ensemble at the inferred temperature has the same energy
+    canonical_energy = montecarlo.montecarlo_metropolis(
+        100, ham, temperature, 4000, 500, rng=numpy.random.default_rng(1), rule="heat_bath"
+    )[0]
+    assert abs(avg_energy - canonical_energy) < 0.02 * abs(canonical_energy)
+
+
+def test_creutz_demon_unreachable_energy():
+    ham = montecarlo.Hamiltonian()
+    ham.initialize(-2, 1.1, True)
+
+    with pytest.raises(ValueError):
+        montecarlo.creutz_demon(100, ham, -1000, 10)
+
+
+def test_montecarlo_kawasaki():
+    N, magnetization, temp = 8, 2, 1.5
+    for periodic in [True, False]:
+        ham = montecarlo.Hamiltonian()
+        ham.initialize(-2, 1.1, periodic)
+
+        # exact averages over the configurations with the given magnetization
+        energies = []
+        for spins in itertools.product([0, 1], repeat=N):
+            config = numpy.array(spins, dtype=numpy.int8)
+            if 2 * numpy.sum(config) - N == magnetization:
+                energies.append(
+                    -ham.J * montecarlo.backends.compute_bond_sum(config, periodic)
+                    + ham.mu * magnetization
+                )
+        energies = numpy.array(energies)
+        weights = numpy.exp(-(energies - numpy.min(energies)) / temp)
+        weights /= numpy.sum(weights)
+        exact_energy = weights @ energies
+        exact_heat_cap = (weights @ energies**2 - exact_energy**2) / temp**2
+
+        for rule in ["metropolis", "heat_bath"]:
+            energy, mag, heat_cap, mag_sust, info = montecarlo.montecarlo_kawasaki(
+                N,
+                ham,
+                temp,
+                magnetization,
+                20000,
+                100,
+                rng=numpy.random.default_rng(0),
+                rule=rule,
+                full_output=True,
+            )
+            assert abs(energy - exact_energy) < 4 * info["errors"]["energy"]
+            assert abs(heat_cap - exact_heat_cap) < 4 * info["errors"]["heat_capacity"] + 0.01
+            assert mag == magnetization
+            assert mag_sust == 0
+            assert 0 < info["acceptance"] < 1
+            spins = numpy.array(info["final_spins"].get_spins())
+            assert 2 * numpy.sum(spins) - N == magnetization
+
+
+def test_montecarlo_kawasaki_parity():
+    ham = montecarlo.Hamiltonian()
+    ham.initialize(-2, 1.1, True)
+
+    with pytest.raises(ValueError):
+        montecarlo.montecarlo_kawasaki(8, ham, 1.5, 1, 10)
+
+
+def test_block_gibbs():
+    conf_sys = montecarlo.SpinConfigurationSystem()
+    conf_sys.initialize(8)
+    for periodic in [True, False]:
+        ham = montecarlo.Hamiltonian()
+        ham.initialize(-2, 1.1, periodic)
+        for temp in [0.7, 2.0]:
+            energy, mag, heat_cap, mag_sust, info = montecarlo.montecarlo_metropolis(
+                8,
+                ham,
+                temp,
+                5000,
+                100,
+                rng=numpy.random.default_rng(0),
+                rule="block_gibbs",
+                full_output=True,
+            )
+            exact_energy = ham.compute_average_energy(temp, conf_sys)
+            exact_heat_cap = ham.compute_heat_capacity(temp, conf_sys)
+            assert abs(energy - exact_energy) < 4 * info["errors"]["energy"] + 1e-3
+            assert abs(heat_cap - exact_heat_cap) < 4 * info["errors"]["heat_capacity"] + 0.01
+
+
+def test_block_gibbs_batch_run():
+    ham = montecarlo.Hamiltonian()
+    ham.initialize(-2, 1.1, False)
+
+    # the batched sweeps of several chains are those of the chains run one after another
+    uniforms = numpy.random.default_rng(1).random((20, 3, 50))
+    configs = numpy.random.default_rng(2).integers(0, 2, (3, 50), dtype=numpy.int8)
+    single = configs.copy()
+    bond_sums, mags = montecarlo.get_backend("numpy").batch_run(
+        configs, ham, [0.5, 1.0, 2.0], uniforms, "block_gibbs"
+    )
+    for r, temp in enumerate([0.5, 1.0, 2.0]):
+        bond_sums_r, mags_r = montecarlo.block_gibbs_run(single[r], ham, temp, uniforms[:, r])
+        assert numpy.array_equal(bond_sums[:, r], bond_sums_r)
+        assert numpy.array_equal(configs[r], single[r])
+
+
+def test_block_gibbs_first_sweep():
+    ham = montecarlo.Hamiltonian()
+    ham.initialize(1, 0.1, True)
+
+    # the block boundaries keep alternating when the sweeps are run one at a time
+    start = numpy.random.default_rng(4).integers(0, 2, 40, dtype=numpy.int8)
+    uniforms = numpy.random.default_rng(5).random((6, 40))
+    together = start.copy()
+    montecarlo.block_gibbs_run(together, ham, 3.0, uniforms)
+    one_by_one = start.copy()
+    unshifted = start.copy()
+    for step in range(6):
+        montecarlo.block_gibbs_run(one_by_one, ham, 3.0, uniforms[step : step + 1], first_sweep=step)
+        montecarlo.block_gibbs_run(unshifted, ham, 3.0, uniforms[step : step + 1])
+    assert numpy.array_equal(together, one_by_one)
+    assert not numpy.array_equal(together, unshifted)
+    spins = montecarlo.SpinConfiguration()
+    spins.initialize([int(s) for s in start])
+    rng = numpy.random.default_rng(5)
+    for step in range(6):
+        spins = ham.metropolis_sweep(spins, 3.0, "block_gibbs", rng, first_sweep=step)
+    assert list(spins.get_spins()) == list(together)
+
+
+def test_block_gibbs_decorrelation():
+    ham = montecarlo.Hamiltonian()
+    ham.initialize(1, 0.1, True)
+
+    # long domains decorrelate much faster than with single-site updates
+    taus = {}
+    for rule in ["heat_bath", "block_gibbs"]:
+        info = montecarlo.montecarlo_metropolis(
+            200, ham, 0.8, 3000, 500, rng=numpy.random.default_rng(3), rule=rule, full_output=True
+        )[4]
+        taus[rule] = info["tau_int"]["magnetization"]
+    assert taus["block_gibbs"] < taus["heat_bath"] / 4
+
+
+def energy_log_probabilities(ham, N, temp):
+    """
+    Returns the exact log-probability of every energy of an N-site chain, keyed by the energy rounded
+    to 6 decimals, from all its configurations.
+    """
+    periodic = ham.doPeriodicBoundaryConditions
+    probabilities = {}
+    for spins in itertools.product([0, 1], repeat=N):
+        config = numpy.array(spins, dtype=numpy.int8)
+        energy = -ham.J * montecarlo.backends.compute_bond_sum(
+            config, periodic
+        ) + ham.mu * (2 * numpy.sum(config) - N)
+        key = round(energy, 6)
+        probabilities[key] = probabilities.get(key, 0) + numpy.exp(-energy / temp)
+    total = sum(probabilities.values())
+    return {key: numpy.log(value / total) for key, value in probabilities.items()}
+
+
+def test_umbrella_sampling():
+    # without coupling the distribution of M is binomial, down to the fully aligned chains
+    N, temp = 60, 5.0
+    ham = montecarlo.Hamiltonian()
+    ham.initialize(0, 0.5, True)
+    values, log_p, info = montecarlo.umbrella_sampling(N, ham, temp, seed=1, full_output=True)
+    assert values == list(range(-N, N + 1, 2))
+    exact = numpy.array(
+        [
+            math.lgamma(N + 1)
+            - math.lgamma((N + M) // 2 + 1)
+            - math.lgamma((N - M) // 2 + 1)
+            - ham.mu * M / temp
+            for M in values
+        ]
+    )
+    exact -= numpy.log(numpy.sum(numpy.exp(exact - numpy.max(exact)))) + numpy.max(exact)
+    assert exact[-1] < -40
+    assert numpy.max(numpy.abs(numpy.array(log_p) - exact)) < 0.3
+    assert len(info["windows"]) == 8
+
+
+def test_umbrella_sampling_energy():
+    # the energy distribution of a small chain, from all its configurations
+    N, temp = 8, 1.5
+    ham = montecarlo.Hamiltonian()
+    for periodic in [True, False]:
+        ham.initialize(-2, 1.1, periodic)
+        log_probabilities = energy_log_probabilities(ham, N, temp)
+        values, log_p = montecarlo.umbrella_sampling(
+            N, ham, temp, "energy", n_windows=3, sweeps=10000, seed=2
+        )
+        assert len(values) == len(log_probabilities)
+        exact = [log_probabilities[round(value, 6)] for value in values]
+        assert numpy.max(numpy.abs(numpy.array(log_p) - exact)) < 0.25
+
+
+def test_umbrella_sampling_default_windows():
+    ham = montecarlo.Hamiltonian()
+
+    # the default windows of the energy connect for the Hamiltonians of this file
+    for J, mu, temp, N, periodic in [(-2, 1.1, 2.0, 8, True), (1, 0.3, 1.5, 10, False)]:
+        ham.initialize(J, mu, periodic)
+        log_probabilities = energy_log_probabilities(ham, N, temp)
+        values, log_p = montecarlo.umbrella_sampling(N, ham, temp, "energy", seed=1)
+        assert len(values) == len(log_probabilities)
+        exact = [log_probabilities[round(value, 6)] for value in values]
+        assert numpy.max(numpy.abs(numpy.array(log_p) - exact)) < 0.5
+
+
+def test_umbrella_sampling_merged_windows():
+    ham = montecarlo.Hamiltonian()
+    ham.initialize(-1, 0.2, True)
+
+    # windows that do not connect in short runs at low temperature are merged instead of failing
+    values, log_p, info = montecarlo.umbrella_sampling(
+        11, ham, 0.5, sweeps=100, iterations=2, burn_steps=10, seed=1, full_output=True
+    )
+    assert len(info["windows"]) < 4
+    assert set(values) <= set(range(-11, 12, 2))
+
+
+def test_umbrella_sampling_processes():
+    ham = montecarlo.Hamiltonian()
+    ham.initialize(-2, 1.1, False)
+
+    # the windows give the same results in worker processes
+    N, temp = 8, 1.5
+    results = montecarlo.umbrella_sampling(N, ham, temp, n_windows=3, sweeps=200, seed=3)
+    shared = montecarlo.umbrella_sampling(
+        N, ham, temp, n_windows=3, sweeps=200, seed=3, processes=2
+    )
+    assert results == shared
+
+
+def test_forked_chains():
+    N = 8
+    ham = montecarlo.Hamiltonian()
+    ham.initialize(-2, 1.1, True)
+    conf_sys = montecarlo.SpinConfigurationSystem()
+    conf_sys.initialize(N)
+    temp = 1.0
+    energy, mag, heat_cap, mag_sus, info = montecarlo.forked_chains(
+        N, ham, temp, 2000, 16, seed=3, full_output=True
+    )
+    errors = info["errors"]
+    assert abs(energy - ham.compute_average_energy(temp, conf_sys)) < 4 * errors["energy"] + 1e-3
+    assert abs(heat_cap - ham.compute_heat_capacity(temp, conf_sys)) < 4 * errors["heat_capacity"] + 1e-2
+    assert len(info["chains"]) == 16
+    assert info["final_configs"].shape == (16, N)
+
+
+def test_forked_chains_decorrelation():
+    ham = montecarlo.Hamiltonian()
+    ham.initialize(-2, 1.1, True)
+
+    # the decorrelation length follows the autocorrelation time of the pilot run
+    info = montecarlo.forked_chains(8, ham, 1.0, 2000, 16, seed=3, full_output=True)[4]
+    tau = max(info["tau_int"].values())
+    assert info["decorrelation_steps"] == int(numpy.ceil(5 * tau))
+    assert info["pilot_steps"] >= 256
+    assert montecarlo.forked_chains(
+        8, ham, 1.0, 100, 2, burn_steps=10, decorrelation_steps=7, seed=3, full_output=True
+    )[4]["decorrelation_steps"] == 7
+
+
+def test_forked_chains_independent():
+    ham = montecarlo.Hamiltonian()
+    ham.initialize(-2, 1.1, True)
+
+    # a chain does not depend on how many chains are forked
+    few = montecarlo.forked_chains(8, ham, 1.0, 500, 3, seed=5, full_output=True)[4]["chains"]
+    many = montecarlo.forked_chains(8, ham, 1.0, 500, 7, seed=5, full_output=True)[4]["chains"]
+    assert numpy.allclose(few, many[:3])
+
+
+def test_simulated_annealing():
+    # an open chain, whose ground state is found by trying all configurations
+    N = 12
+    ham = montecarlo.Hamiltonian()
+    ham.initialize(-2, 1.1, False)
+    conf_sys = montecarlo.SpinConfigurationSystem()
+    conf_sys.initialize(N)
+    exact = min(ham.compute_energy(spins) for spins in conf_sys.collection)
+    for schedule in ["geometric", "adaptive"]:
+        best_spins, best_energy, tts = montecarlo.simulated_annealing(
+            N, ham, sweeps=300, n_restarts=8, schedule=schedule, seed=1
+        )
+        assert abs(best_energy - exact) < 1e-9
+        assert abs(ham.compute_energy(best_spins) - exact) < 1e-9
+        assert 0 < tts["success_probability"] <= 1
+        assert tts["tts99"] >= tts["mean_sweeps"]
+
+
+def test_simulated_annealing_target_energy():
+    N = 12
+    ham = montecarlo.Hamiltonian()
+    ham.initialize(-2, 1.1, False)
+    conf_sys = montecarlo.SpinConfigurationSystem()
+    conf_sys.initialize(N)
+    exact = min(ham.compute_energy(spins) for spins in conf_sys.collection)
+
+    # restarts end once they reach the target energy
+    info = montecarlo.simulated_annealing(
+        N, ham, sweeps=5000, n_restarts=4, target_energy=exact, seed=1, full_output=True
+    )[3]
+    assert max(info["sweeps"]) < 5000
+    assert numpy.all(numpy.isnan(info["temperatures"][0, info["sweeps"][0]:]))
+
+
+def test_simulated_annealing_ring():
+    ham = montecarlo.Hamiltonian()
+    ham.initialize(-2, 1.1, True)
+
+    # the antiferromagnetic ground state of the uniform ring, also with worker processes
+    best_spins, best_energy, tts = montecarlo.simulated_annealing(20, ham, sweeps=200, n_restarts=4, seed=2)
+    assert best_energy == ham.compute_energy(best_spins) == -40.0
+    shared = montecarlo.simulated_annealing(20, ham, sweeps=200, n_restarts=4, seed=2, processes=2)
+    assert shared[1] == best_energy
+    assert shared[2]["sweeps_to_solution"] == tts["sweeps_to_solution"]
+
+
+def test_quench_dynamics():
+    N = 8
+    ham = montecarlo.Hamiltonian()
+    ham.initialize(-2, 1.1, True)
+    conf_sys = montecarlo.SpinConfigurationSystem()
+    conf_sys.initialize(N)
+    temp = 2.0
+
+    # from infinite temperature the ensemble relaxes to the equilibrium values
+    times, energy, mag, energy_variance, mag_variance, info = montecarlo.quench_dynamics(
+        N, ham, temp, 1000, n_chains=500, n_times=30, rng=numpy.random.default_rng(1), full_output=True
+    )
+    assert times[0] == 0 and times[1] == 1 and times[-1] == 1000
+    assert numpy.all(numpy.diff(times) > 0) and len(times) <= 31
+    assert abs(energy[0]) < 4 * info["errors"]["energy"][0]
+    late = times >= 100
+    exact_energy = ham.compute_average_energy(temp, conf_sys)
+    assert abs(numpy.mean(energy[late]) - exact_energy) < 0.1
+    assert abs(numpy.mean(mag[late]) - ham.compute_average_mag(temp, conf_sys)) < 0.05
+    heat_cap = numpy.mean(energy_variance[late]) / temp**2
+    assert abs(heat_cap - ham.compute_heat_capacity(temp, conf_sys)) < 0.3
+    assert info["final_configs"].shape == (500, N)
+
+
+def test_quench_dynamics_field_reversal():
+    N = 8
+    ham = montecarlo.Hamiltonian()
+    ham.initialize(-2, 1.1, True)
+    conf_sys = montecarlo.SpinConfigurationSystem()
+    conf_sys.initialize(N)
+    temp = 2.0
+
+    # a field reversal from an ensemble equilibrated in the opposite field
+    reversed_ham = montecarlo.Hamiltonian()
+    reversed_ham.initialize(-2, -1.1, True)
+    times, energy, mag, energy_variance, mag_variance = montecarlo.quench_dynamics(
+        N, ham, temp, 50, n_chains=200, initial=0.5, initial_ham=reversed_ham, prepare_sweeps=100,
+        times="linear", rng=numpy.random.default_rng(2),
+    )
+    assert len(times) == 51
+    assert mag[0] > 0 > mag[-1]
+    assert abs(mag[-1] - ham.compute_average_mag(temp, conf_sys)) < 0.2
+
+
+def test_quench_dynamics_times():
+    ham = montecarlo.Hamiltonian()
+    ham.initialize(-2, 1.1, True)
+
+    # explicit times and an ordered start
+    times, energy = montecarlo.quench_dynamics(
+        8, ham, 2.0, 60, n_chains=20, initial="ordered", times=[5, 50], rng=numpy.random.default_rng(3)
+    )[:2]
+    assert list(times) == [0, 5, 50]
+    assert energy[0] == -16.0
+
+    # without sweeps only the initial ensemble is measured
+    times, energy = montecarlo.quench_dynamics(
+        8, ham, 2.0, 0, n_chains=20, initial="ordered", rng=numpy.random.default_rng(4)
+    )[:2]
+    assert list(times) == [0] and list(energy) == [-16.0]
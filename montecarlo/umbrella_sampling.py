@@ -0,0 +1,416 @@
+"""
+Umbrella sampling of the distribution of the magnetization or the energy of the Ising chain.
+
+The values of the variable (M or E) are cut into overlapping windows, and every window is sampled
+separately by a walk that rejects moves leaving the window. Within a window, a multicanonical bias
+exp(w(x)) is added to the Boltzmann weight and refined from the histogram of the previous iteration,
+w(x) <- w(x) - ln H(x), until the window is visited evenly. The last histogram divided by the bias then
+gives log P(x) within the window up to a constant, and the constants of neighboring windows are matched on
+their overlap. A single flip changes the energy by up to 4 |J| + 2 |mu|, so energy windows are cut into
+equal ranges of energy that overlap by at least that much. A window that visits no value of the windows
+below it is merged into the window below it, which is run again. The windows are independent and can run
+in parallel. A value whose probability is exp(-N) is reached after a number of sweeps that only grows with
+the number of windows, instead of exp(N).
+
+The values of the variable are those of the (bond sum, M) classes a chain of N sites can reach: with u up
+spins and w domain walls, a ring needs an even 2 <= w <= 2 min(u, N - u) (w = 0 if all spins are equal),
+and an open chain 1 <= w <= min(2 min(u, N - u), N - 1).
+"""
+import concurrent.futures
+import math
+
+import numpy
+
+from .backends import flip_deltas, jit_kernel
+from .density_of_states import log_sum_exp
+from .random_streams import draw_uniforms, spawn_seeds
+
+__all__ = ["umbrella_sampling"]
+
+
+def umbrella_sampling(
+    N,
+    ham,
+    temp,
+    variable="magnetization",
+    n_windows=8,
+    overlap=2,
+    sweeps=1000,
+    iterations=6,
+    burn_steps=100,
+    seed=None,
+    processes=None,
+    full_output=False,
+):
+    """
+    Estimates the full distribution log P(M) or log P(E) of an N-spin system at temperature temp with
+    umbrella sampling over overlapping windows and a multicanonical bias within every window.
+
+    Parameters
+    ----------
+    N : int
+        The number of sites in the spin system.
+    ham : Hamiltonian
+        The Hamiltonian used to describe the spin system.
+    temp : float
+        The temperature of the spin system.
+    variable : str, default: "magnetization"
+        The variable whose distribution is estimated, "magnetization" or "energy".
+    n_windows : int, default: 8
+        The largest number of windows the values of the variable are cut into. There are fewer if the range
+        of values is narrow, and windows that do not connect to the windows below them are merged.
+    overlap : int, default: 2
+        The number of values shared by neighboring windows, at least 1. Neighboring energy windows also
+        share an energy range of at least the largest energy change of a single flip.
+    sweeps : int, default: 1000
+        The number of sweeps (N single-spin steps each) of every window in every iteration, multiplied by
+        the number of windows a merged window is made of.
+    iterations : int, default: 6
+        The number of runs of every window. The bias is refined after every run but the last, whose
+        histogram gives the estimate.
+    burn_steps : int, default: 100
+        The number of sweeps of every window before its first iteration.
+    seed : int or numpy.random.SeedSequence, default: None
+        The root seed from which the random number generators of the windows are spawned. If None, the
+        random module is used, unless processes is given, in which case a fresh seed is drawn.
+    processes : int, default: None
+        The number of worker processes the windows are split over. The results do not depend on it. If
+        None or 1, the windows run in this process.
+    full_output : bool, default: False
+        If True, a dictionary with additional information about the run is returned as a third value.
+
+    Returns
+    -------
+    values : list
+        The values of the variable that were visited, in increasing order.
+    log_probabilities : list
+        The natural logarithm of the probability of every value, normalized over the visited values.
+    info : dict
+        Only returned if full_output is True. Contains the range of values of every window ("windows"),
+        the estimate of log P of every window over the returned values, after matching (nan where the window
+        did not visit a value, "window_log_probabilities"), the fraction of accepted steps of every window
+        ("acceptance") and the largest disagreement between neighboring windows on their overlap
+        ("overlap_mismatch"), which measures the statistical error.
+    """
+    if variable not in ["magnetization", "energy"]:
+        raise ValueError("Unknown variable. Choose 'magnetization' or 'energy'.")
+    periodic = ham.doPeriodicBoundaryConditions
+    bins, values, representatives = _value_bins(N, ham, variable)
+    n_bins = len(values)
+    overlap = max(1, overlap)
+    if variable == "energy":
+        lows, highs = _energy_windows(values, n_windows, overlap, 4 * abs(ham.J) + 2 * abs(ham.mu))
+    else:
+        lows, highs = _magnetization_windows(n_bins, n_windows, overlap)
+
+    # the bias starts from the Boltzmann factor of the energy, or from the field term and the number of
+    # configurations with M, which leaves the iterations only the smaller remainder to flatten
+    if variable == "energy":
+        initial_bias = values / temp
+    else:
+        ups = (values.astype(int) + N) // 2
+        ln_binomial = numpy.array(
+            [math.lgamma(N + 1) - math.lgamma(u + 1) - math.lgamma(N - u + 1) for u in ups]
+        )
+        initial_bias = ham.mu * values / temp - ln_binomial
+
+    if processes is not None and processes > 1 and seed is None:
+        seed = numpy.random.SeedSequence()
+    n_windows = len(lows)
+    seeds = [None] * n_windows if seed is None else spawn_seeds(seed, n_windows)
+    lengths = [1] * n_windows  # number of the initial windows every window is made of
+
+    def window_task(w):
+        return (
+            N,
+            periodic,
+            ham.J / temp,
+            ham.mu / temp,
+            bins,
+            initial_bias,
+            lows[w],
+            highs[w],
+            representatives[(lows[w] + highs[w]) // 2],
+            sweeps * lengths[w],
+            iterations,
+            burn_steps,
+            seeds[w],
+        )
+
+    executor = None
+    if processes is not None and processes > 1:
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=processes)
+    try:
+        results = _run_windows(executor, [window_task(w) for w in range(n_windows)])
+        # a window that shares no visited value with the windows below it is merged into the window below
+        # it, which is run again with the sweeps of both; a single window always connects
+        w = _first_unconnected_window(results)
+        while w is not None:
+            highs[w - 1] = highs[w]
+            lengths[w - 1] += lengths[w]
+            for window_list in [lows, highs, seeds, lengths, results]:
+                del window_list[w]
+            results[w - 1] = _run_windows(executor, [window_task(w - 1)])[0]
+            w = _first_unconnected_window(results)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    n_windows = len(results)
+
+    # matches the constants of the windows on their overlaps, weighting every value by its counts
+    log_p = numpy.zeros(n_bins)
+    weights = numpy.zeros(n_bins)
+    window_log_p = numpy.full((n_windows, n_bins), numpy.nan)
+    mismatch = 0.0
+    for w, (histogram, bias, acceptance) in enumerate(results):
+        visited = numpy.flatnonzero(histogram > 0)
+        estimate = numpy.log(histogram[visited]) - bias[visited]
+        window_log_p[w, visited] = estimate
+        common = visited[weights[visited] > 0]
+        if len(common) > 0:
+            overlap_weights = numpy.minimum(weights[common], histogram[common])
+            differences = log_p[common] - (numpy.log(histogram[common]) - bias[common])
+            estimate = estimate + numpy.sum(overlap_weights * differences) / numpy.sum(overlap_weights)
+            window_log_p[w, visited] = estimate
+            mismatch = max(
+                mismatch, float(numpy.max(numpy.abs(log_p[common] - window_log_p[w, common])))
+            )
+        total = weights[visited] + histogram[visited]
+        log_p[visited] = (weights[visited] * log_p[visited] + histogram[visited] * estimate) / total
+        weights[visited] = total
+
+    visited = weights > 0
+    constant = log_sum_exp(log_p[visited])
+    values_list = values[visited].tolist()
+    log_probabilities = (log_p[visited] - constant).tolist()
+    if full_output:
+        info = {
+            "windows": [(float(values[lows[w]]), float(values[highs[w]])) for w in range(n_windows)],
+            "window_log_probabilities": (window_log_p[:, visited] - constant).tolist(),
+            "acceptance": [result[2] for result in results],
+            "overlap_mismatch": mismatch,
+        }
+        return values_list, log_probabilities, info
+    return values_list, log_probabilities
+
+
+def _magnetization_windows(n_bins, n_windows, overlap):
+    """
+    Returns the first and the last bin of every window, for bins of equally spaced values: the windows
+    hold equal numbers of bins, and neighboring windows share overlap bins.
+    """
+    n_windows = max(1, min(n_windows, n_bins // (overlap + 1)))
+    step = (n_bins - overlap) / n_windows
+    lows = [int(round(w * step)) for w in range(n_windows)]
+    highs = [min(int(round((w + 1) * step)) + overlap - 1, n_bins - 1) for w in range(n_windows)]
+    highs[-1] = n_bins - 1
+    return lows, highs
+
+
+def _energy_windows(values, n_windows, overlap, reach):
+    """
+    Returns the first and the last bin of every window for the sorted energies values. A single flip
+    changes the energy by up to reach, and the energies are not equally spaced, so the windows are cut
+    into equal ranges of energy instead of equal numbers of bins: neighboring windows share an energy
+    range of at least reach (and at least overlap bins), and every window is at least twice as wide.
+    """
+    n_bins = len(values)
+    span = values[-1] - values[0]
+    reach = max(reach, 1e-12)
+    n_windows = max(1, min(n_windows, int((span - reach) // reach), n_bins // (overlap + 1)))
+    width = (span + (n_windows - 1) * reach) / n_windows
+    tolerance = 1e-9 * max(span, 1.0)
+    lows = []
+    highs = []
+    for w in range(n_windows):
+        start = values[0] + w * (width - reach)
+        lows.append(int(numpy.searchsorted(values, start - tolerance, side="left")))
+        highs.append(int(numpy.searchsorted(values, start + width + tolerance, side="right")) - 1)
+    highs[-1] = n_bins - 1
+    for w in range(n_windows - 1):
+        highs[w] = min(max(highs[w], lows[w + 1] + overlap - 1), n_bins - 1)
+    return lows, highs
+
+
+def _run_windows(executor, tasks):
+    """
+    Runs the windows of tasks, in the worker processes of executor unless it is None.
+    """
+    if executor is None:
+        return [_umbrella_window(task) for task in tasks]
+    return list(executor.map(_umbrella_window, tasks))
+
+
+def _first_unconnected_window(results):
+    """
+    Returns the index of the first window that visited no value visited by the windows before it, or None
+    if every window is connected to the ones before it.
+    """
+    covered = numpy.zeros(len(results[0][0]), dtype=bool)
+    for w, (histogram, bias, acceptance) in enumerate(results):
+        visited = histogram > 0
+        if w > 0 and not numpy.any(visited & covered):
+            return w
+        covered |= visited
+    return None
+
+
+def _value_bins(N, ham, variable):
+    """
+    Returns the bin of every (bond sum + N, M + N) class of the grid (-1 for classes no configuration
+    reaches), the value of the variable of every bin in increasing order, and a representative class of
+    every bin as a number of up spins and a number of domain walls.
+    """
+    periodic = ham.doPeriodicBoundaryConditions
+    ups = []
+    walls = []
+    for u in range(N + 1):
+        if u == 0 or u == N:
+            feasible = [0]
+        elif periodic:
+            feasible = range(2, 2 * min(u, N - u) + 1, 2)
+        else:
+            feasible = range(1, min(2 * min(u, N - u), N - 1) + 1)
+        ups += [u] * len(feasible)
+        walls += list(feasible)
+    ups = numpy.array(ups)
+    walls = numpy.array(walls)
+    magnetizations = 2 * ups - N
+    bond_sums = (N if periodic else N - 1) - 2 * walls
+
+    if variable == "magnetization":
+        class_values = magnetizations.astype(float)
+    else:
+        class_values = -ham.J * bond_sums + ham.mu * magnetizations
+    # classes whose values agree up to rounding share a bin
+    scale = max(abs(ham.J), abs(ham.mu), 1.0) * 1e-9
+    keys, class_bins = numpy.unique(numpy.round(class_values / scale), return_inverse=True)
+    bins = numpy.full((2 * N + 1, 2 * N + 1), -1, dtype=numpy.int64)
+    bins[bond_sums + N, magnetizations + N] = class_bins
+    values = keys * scale
+    if variable == "magnetization":
+        values = numpy.round(values)
+    first = numpy.zeros(len(keys), dtype=int)
+    first[class_bins[::-1]] = numpy.arange(len(class_bins))[::-1]
+    representatives = [(int(ups[k]), int(walls[k])) for k in first]
+    return bins, values, representatives
+
+
+def _configuration(N, periodic, n_up, n_walls):
+    """
+    Returns a configuration of N sites with n_up up spins and n_walls domain walls: all but one domain of
+    every kind hold a single spin.
+    """
+    if n_up == 0 or n_up == N:
+        return numpy.full(N, 1 if n_up == N else 0, dtype=numpy.int8)
+    if periodic:
+        n_up_domains = n_down_domains = n_walls // 2
+    elif n_walls % 2 == 1:
+        n_up_domains = n_down_domains = (n_walls + 1) // 2
+    elif n_walls // 2 + 1 <= n_up:
+        n_up_domains, n_down_domains = n_walls // 2 + 1, n_walls // 2
+    else:
+        n_up_domains, n_down_domains = n_walls // 2, n_walls // 2 + 1
+    up_sizes = [n_up - n_up_domains + 1] + [1] * (n_up_domains - 1)
+    down_sizes = [N - n_up - n_down_domains + 1] + [1] * (n_down_domains - 1)
+
+    # the kind with more domains comes first, so the domains alternate
+    if n_down_domains > n_up_domains:
+        domains = [(0, down_sizes[k]) for k in range(n_down_domains)]
+        for k in range(n_up_domains):
+            domains.insert(2 * k + 1, (1, up_sizes[k]))
+    else:
+        domains = [(1, up_sizes[k]) for k in range(n_up_domains)]
+        for k in range(n_down_domains):
+            domains.insert(2 * k + 1, (0, down_sizes[k]))
+    config = numpy.concatenate([numpy.full(size, spin, dtype=numpy.int8) for spin, size in domains])
+    return config
+
+
+def _umbrella_window(task):
+    """
+    Runs the iterations of one window and returns its histogram of the last iteration over all bins, the
+    bias of the last iteration and the fraction of accepted steps.
+    """
+    N, periodic, coupling, field, bins, bias, low, high, start, sweeps, iterations, burn_steps, seed = task
+    rng = None if seed is None else numpy.random.default_rng(seed)
+    config = _configuration(N, periodic, *start)
+    x = 2 * config.astype(numpy.int64) - 1
+    bond_sum = int(numpy.sum(x[:-1] * x[1:])) + (int(x[0] * x[-1]) if periodic else 0)
+    magnetization = int(numpy.sum(x))
+
+    bias = numpy.array(bias, dtype=float)
+    histogram = numpy.zeros(len(bias), dtype=numpy.int64)
+    accepted = 0
+    for iteration in range(iterations + 1):
+        # the first pass is the burn-in
+        n_sweeps = burn_steps if iteration == 0 else sweeps
+        if n_sweeps == 0:
+            continue
+        histogram[:] = 0
+        uniforms = draw_uniforms(rng, n_sweeps, 2 * N)
+        sites = numpy.minimum((uniforms[:, :N] * N).astype(numpy.int64), N - 1).reshape(-1)
+        bond_sum, magnetization, n_accepted = _umbrella_kernel(
+            config,
+            periodic,
+            coupling,
+            field,
+            bins,
+            bias,
+            low,
+            high,
+            histogram,
+            bond_sum,
+            magnetization,
+            sites,
+            numpy.ascontiguousarray(uniforms[:, N:]).reshape(-1),
+        )
+        if iteration == iterations:
+            accepted = n_accepted
+        elif iteration > 0:
+            # w(x) <- w(x) - ln H(x), with values that were not visited counted once
+            window_bias = bias[low : high + 1]
+            window_bias -= numpy.log(numpy.maximum(histogram[low : high + 1], 1))
+            window_bias -= numpy.max(window_bias)
+    return histogram, bias, accepted / max(sweeps * N, 1)
+
+
+@jit_kernel
+def _umbrella_kernel(
+    config,
+    periodic,
+    coupling,
+    field,
+    bins,
+    bias,
+    low,
+    high,
+    histogram,
+    bond_sum,
+    magnetization,
+    sites,
+    uniforms,
+):
+    """
+    Performs one step per entry of sites, flipping the spin at that site with probability
+    min(1, exp((J dbond - mu dM) / T + w(new) - w(old))) if the new class lies in the bins low to high,
+    and counting the bin of the class after every step in histogram. Returns the final bond sum,
+    magnetization and number of accepted steps. Compiled with numba if it is installed.
+    """
+    n = config.shape[0]
+    accepted = 0
+    current = bins[bond_sum + n, magnetization + n]
+    for k in range(sites.shape[0]):
+        i = sites[k]
+        delta_bond, delta_mag = flip_deltas(config, i, periodic)
+        new = bins[bond_sum + delta_bond + n, magnetization + delta_mag + n]
+        if new >= low and new <= high:
+            exponent = coupling * delta_bond - field * delta_mag + bias[new] - bias[current]
+            if exponent >= 0 or uniforms[k] < numpy.exp(exponent):
+                config[i] = 1 - config[i]
+                bond_sum += delta_bond
+                magnetization += delta_mag
+                current = new
+                accepted += 1
+        histogram[current] += 1
+    return bond_sum, magnetization, accepted
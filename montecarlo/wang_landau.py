@@ -0,0 +1,152 @@
+"""
+Wang-Landau estimation of the density of states of the Ising chain.
+
+The walk flips single spins (the move of Hamiltonian.metropolis_sweep) but accepts a flip from class a to
+class b with probability min(1, g(a) / g(b)), using the current estimate of g over the (bond sum, M)
+classes. Every visit multiplies the estimate of the visited class by f. The walk therefore spreads evenly
+over all classes, and the estimate converges to the true density of states as f approaches 1. ln f is
+halved whenever the visit histogram is flat and, once it drops below 1/t (t the number of steps per
+visited class), follows 1/t, which removes the saturation of the error of the original method.
+
+Limitation: the classes are indexed by (bond sum, M), which only determine the energy of the uniform
+nearest-neighbour chain described by Hamiltonian. Disordered chains, with couplings or fields that differ
+from bond to bond or from site to site, and longer-range couplings have energies that are not functions of
+these two integers and are not supported.
+"""
+import numpy
+
+from .backends import compute_bond_sum, compute_magnetization, flip_deltas, jit_kernel
+from .density_of_states import DensityOfStates
+from .random_streams import draw_uniforms, random_configuration
+
+__all__ = ["wang_landau"]
+
+
+def wang_landau(
+    N,
+    ham,
+    final_ln_f=1e-5,
+    flatness=0.8,
+    check_interval=100,
+    max_sweeps=10**7,
+    rng=None,
+    full_output=False,
+):
+    """
+    Estimates the density of states g(bond sum, M) of an N-spin system with the Wang-Landau method and
+    the 1/t refinement of Belardinelli and Pereyra. The returned DensityOfStates gives the thermal
+    quantities at every temperature, and for every uniform J and mu, from a single run. Only the boundary
+    conditions of ham are used; disordered and longer-range Hamiltonians are not supported.
+
+    Parameters
+    ----------
+    N : int
+        The number of sites in the spin system.
+    ham : Hamiltonian
+        The Hamiltonian whose boundary conditions are used.
+    final_ln_f : float, default: 1e-5
+        The value of ln f at which the run stops. The statistical error of ln g scales like
+        sqrt(final_ln_f).
+    flatness : float, default: 0.8
+        The histogram counts as flat when its smallest entry over the visited classes is at least
+        flatness times its mean.
+    check_interval : int, default: 100
+        The number of sweeps (N single-spin steps each) between two flatness checks.
+    max_sweeps : int, default: 10**7
+        The maximum number of sweeps.
+    rng : numpy.random.Generator, default: None
+        The random number generator. If None, the random module is used.
+    full_output : bool, default: False
+        If True, a dictionary with additional information about the run is returned as a second value.
+
+    Returns
+    -------
+    dos : DensityOfStates
+        The estimated density of states of the visited classes.
+    info : dict
+        Only returned if full_output is True. Contains the number of sweeps performed ("sweeps"), the final
+        ln f ("ln_f"), the number of halvings of ln f before the switch to 1/t ("iterations") and whether
+        final_ln_f was reached ("converged").
+    """
+    periodic = ham.doPeriodicBoundaryConditions
+    config = random_configuration(rng, N)
+    bond_sum = compute_bond_sum(config, periodic)
+    magnetization = compute_magnetization(config)
+
+    # ln g and the visit histogram over the grid of (bond sum + N, M + N)
+    ln_g = numpy.zeros((2 * N + 1, 2 * N + 1))
+    histogram = numpy.zeros((2 * N + 1, 2 * N + 1), dtype=numpy.int64)
+    visited = numpy.zeros((2 * N + 1, 2 * N + 1), dtype=bool)
+
+    ln_f = 1.0
+    one_over_t = False  # whether ln f follows 1/t
+    iterations = 0
+    sweeps = 0
+    steps = 0
+    while ln_f > final_ln_f and sweeps < max_sweeps:
+        n_sweeps = min(check_interval, max_sweeps - sweeps)
+        uniforms = draw_uniforms(rng, n_sweeps, 2 * N)
+        sites = numpy.minimum((uniforms[:, :N] * N).astype(numpy.int64), N - 1).reshape(-1)
+        bond_sum, magnetization = _wang_landau_kernel(
+            config,
+            periodic,
+            ln_g,
+            histogram,
+            ln_f,
+            bond_sum,
+            magnetization,
+            sites,
+            numpy.ascontiguousarray(uniforms[:, N:]).reshape(-1),
+        )
+        sweeps += n_sweeps
+        steps += n_sweeps * N
+        visited |= histogram > 0
+
+        if one_over_t:
+            ln_f = numpy.count_nonzero(visited) / steps
+        else:
+            counts = histogram[visited]
+            if numpy.min(counts) >= flatness * numpy.mean(counts):
+                ln_f /= 2
+                iterations += 1
+                histogram[:] = 0
+                if ln_f < numpy.count_nonzero(visited) / steps:
+                    one_over_t = True
+                    ln_f = numpy.count_nonzero(visited) / steps
+
+    bond_index, mag_index = numpy.nonzero(visited)
+    dos = DensityOfStates(N, bond_index - N, mag_index - N, ln_g[visited])
+    if full_output:
+        info = {
+            "sweeps": sweeps,
+            "ln_f": float(ln_f),
+            "iterations": iterations,
+            "converged": bool(ln_f <= final_ln_f),
+        }
+        return dos, info
+    return dos
+
+
+@jit_kernel
+def _wang_landau_kernel(
+    config, periodic, ln_g, histogram, ln_f, bond_sum, magnetization, sites, uniforms
+):
+    """
+    Performs one Wang-Landau step per entry of sites, flipping the spin at that site with probability
+    min(1, g(current class) / g(new class)) and updating ln_g and histogram at the class reached.
+    Returns the final bond sum and magnetization. Compiled with numba if it is installed.
+    """
+    n = config.shape[0]
+    for k in range(sites.shape[0]):
+        i = sites[k]
+        delta_bond, delta_mag = flip_deltas(config, i, periodic)
+        new_bond = bond_sum + delta_bond
+        new_mag = magnetization + delta_mag
+        difference = ln_g[bond_sum + n, magnetization + n] - ln_g[new_bond + n, new_mag + n]
+        if difference >= 0 or uniforms[k] < numpy.exp(difference):
+            config[i] = 1 - config[i]
+            bond_sum = new_bond
+            magnetization = new_mag
+        ln_g[bond_sum + n, magnetization + n] += ln_f
+        histogram[bond_sum + n, magnetization + n] += 1
+    return bond_sum, magnetization